@@ -6,14 +6,24 @@ This package contains the functionality for a fully-playable Pokémon battle sim
 
 __version__ = "0.1.4"
 
-import os
+import argparse
 import platform
-import random
 import typing
-import sys
 from . import utils
 from . import pokemon
+from . import prefetch
 from . import move
+from . import battle
+from . import checkpoint
+from . import cluster
+from . import columns
+from . import damageserver
+from . import memprofile
+from . import stats
+from . import threads
+from . import prng
+from . import trace
+from . import transcript
 
 def chooseAPokemon(available: typing.Set[str], opponent: bool=False) -> pokemon.Pokemon:
 	"""
@@ -44,6 +54,11 @@ def chooseAPokemon(available: typing.Set[str], opponent: bool=False) -> pokemon.
 	species = choice
 	nickname = choice
 
+	# Fetch the species' moves while the user sets it up
+	prefetcher = prefetch.active()
+	if prefetcher is not None:
+		prefetcher.prefetchSpecies(species)
+
 	while True:
 		choice = input("Nickname this Pokémon? [y/N]: ").lower()
 		if choice in {'y', 'yes'}:
@@ -99,22 +114,29 @@ def chooseAMove(poke: pokemon.Pokemon, opponent: pokemon.Pokemon=None) -> move.M
 	return choice
 
 
-def main() -> int:
+def main(rng: prng.BattleRNG = None) -> int:
 	"""
-	Runs the main simulator
+	Runs the main simulator, drawing random numbers from `rng` (by default, a generator
+	seeded from the OS)
 	"""
+	if rng is None:
+		rng = prng.BattleRNG()
 
 	# Theoretically reads in the list of pokemon
-	available_pokemon = set(os.listdir(os.path.join(utils.dataDir, "pokemon")))
-	utils.cls()
+	available_pokemon = set(utils.listData("pokemon"))
+	prefetch.enable()
+	try:
+		utils.cls()
 
-	print("Welcome to the Pokémon Battle Simulator (written in Python3)!\n")
+		print("Welcome to the Pokémon Battle Simulator (written in Python3)!\n")
 
-	userPokemon = chooseAPokemon(available_pokemon)
+		userPokemon = chooseAPokemon(available_pokemon)
 
-	utils.cls()
+		utils.cls()
 
-	opponentPokemon = chooseAPokemon(available_pokemon, True)
+		opponentPokemon = chooseAPokemon(available_pokemon, True)
+	finally:
+		prefetch.disable()
 	utils.cls()
 
 	# Prints the opposing pokemon
@@ -129,43 +151,53 @@ def main() -> int:
 
 		utils.cls()
 
-		# Player chooses a move
-		choice = chooseAMove(userPokemon, opponentPokemon)
-		choiceStr = "%s used %s!" % (userPokemon, choice)
+		with trace.span("moveSelection"):
+			# Player chooses a move
+			choice = chooseAMove(userPokemon, opponentPokemon)
+			choiceStr = "%s used %s!" % (userPokemon, choice)
 
-		#opponent chooses a move
-		utils.cls()
-		opponentChoice = opponentPokemon.moves[random.randrange(4)]
-		opponentChoiceStr = "%s used %s!" % (opponentPokemon, opponentChoice)
+			#opponent chooses a move
+			utils.cls()
+			opponentChoice = opponentPokemon.moves[rng.randrange(4)]
+			opponentChoiceStr = "%s used %s!" % (opponentPokemon, opponentChoice)
 
-		order = utils.decideOrder(userPokemon, choice, opponentPokemon, choice)
+		with trace.span("decideOrder"):
+			order = utils.decideOrder(userPokemon, choice, opponentPokemon, opponentChoice, rng)
 
 		if order:
-			opponentEvents = opponentPokemon.useMove(opponentChoice, userPokemon, choice)
+			with trace.span("useMove", side=1, move=opponentChoice.name):
+				opponentEvents = opponentPokemon.useMove(opponentChoice, userPokemon, choice, rng)
 			if not userPokemon.HP or not opponentPokemon.HP:
-				utils.printHealthBars(userPokemon, opponentPokemon)
-				print("%s\n%s" % (opponentChoiceStr, opponentEvents))
+				with trace.span("render"):
+					utils.printHealthBars(userPokemon, opponentPokemon)
+					print("%s\n%s" % (opponentChoiceStr, opponentEvents))
 				playerWon = not opponentPokemon.HP
 				break
 
-			userEvents = userPokemon.useMove(choice, opponentPokemon, opponentChoice)
-			utils.printHealthBars(userPokemon, opponentPokemon)
-			print("\n".join((opponentChoiceStr, opponentEvents, choiceStr, userEvents)))
+			with trace.span("useMove", side=0, move=choice.name):
+				userEvents = userPokemon.useMove(choice, opponentPokemon, opponentChoice, rng)
+			with trace.span("render"):
+				utils.printHealthBars(userPokemon, opponentPokemon)
+				print("\n".join((opponentChoiceStr, opponentEvents, choiceStr, userEvents)))
 			if not userPokemon.HP or not opponentPokemon.HP:
 				playerWon = not opponentPokemon.HP
 				break
 
 		else:
-			userEvents = userPokemon.useMove(choice, opponentPokemon, opponentChoice)
+			with trace.span("useMove", side=0, move=choice.name):
+				userEvents = userPokemon.useMove(choice, opponentPokemon, opponentChoice, rng)
 			if not userPokemon.HP or not opponentPokemon.HP:
-				utils.printHealthBars(userPokemon, opponentPokemon)
-				print("%s\n%s" % (choiceStr, userEvents))
+				with trace.span("render"):
+					utils.printHealthBars(userPokemon, opponentPokemon)
+					print("%s\n%s" % (choiceStr, userEvents))
 				playerWon = not opponentPokemon.HP
 				break
 
-			opponentEvents = opponentPokemon.useMove(opponentChoice, userPokemon, choice)
-			utils.printHealthBars(userPokemon, opponentPokemon)
-			print("\n".join((choiceStr, userEvents, opponentChoiceStr, opponentEvents)))
+			with trace.span("useMove", side=1, move=opponentChoice.name):
+				opponentEvents = opponentPokemon.useMove(opponentChoice, userPokemon, choice, rng)
+			with trace.span("render"):
+				utils.printHealthBars(userPokemon, opponentPokemon)
+				print("\n".join((choiceStr, userEvents, opponentChoiceStr, opponentEvents)))
 			if not userPokemon.HP or not opponentPokemon.HP:
 				playerWon = not opponentPokemon.HP
 				break
@@ -175,15 +207,191 @@ def main() -> int:
 	else:
 		print("%s fainted.\nYou lose..." % userPokemon)
 
+def simulateMain(battles: int, sides: typing.Tuple[battle.Side, battle.Side], masterSeed: int,
+                 profiler: memprofile.MemoryProfiler = None, checkpointPath: str = None,
+                 checkpointInterval: float = 60.0, resume: bool = False,
+                 columnsDir: str = None, threadCount: int = None) -> int:
+	"""
+	Plays out `battles` battles between the given sides without any user interaction,
+	printing a summary of their results. Progress is checkpointed to `checkpointPath` (if
+	given) every `checkpointInterval` seconds; if `resume` is True, the job saved in that
+	checkpoint is carried on instead. The result of every battle is written to column files
+	in `columnsDir`, if given. Battles are played on `threadCount` threads, if given.
+	Returns the program's exit status
+	"""
+	workers = threads.ThreadRunner(threadCount) if threadCount else None
+	if resume:
+		runner = checkpoint.CheckpointedRun.resume(checkpointPath, checkpointInterval, workers)
+		sides, masterSeed = runner.job.sides, runner.job.masterSeed
+		print("Resuming after %d of %d battles" % (runner.checkpoint.completed, runner.job.battles))
+	else:
+		job = checkpoint.Job(sides, masterSeed, battles)
+		runner = checkpoint.CheckpointedRun(job, checkpointPath, checkpointInterval, workers)
+
+	writer = columns.ColumnWriter(columnsDir) if columnsDir else None
+	if profiler is not None:
+		print(profiler.start())
+
+	def onBattle(result: battle.BattleResult):
+		"""
+		Records each finished battle, and lets the profiler know about it
+		"""
+		if writer is not None:
+			writer.append(result)
+		if profiler is not None:
+			report = profiler.battleFinished()
+			if report:
+				print(report)
+
+	try:
+		aggregate = runner.run(onBattle)
+	finally:
+		if writer is not None:
+			writer.close()
+		if workers is not None:
+			workers.close()
+
+	print("Seed: %d" % masterSeed)
+	print(aggregate.report(sides))
+
+	if profiler is not None:
+		report = profiler.stop()
+		if report:
+			print(report)
+		if profiler.leaking():
+			print("Memory grew by %.1f bytes per battle (threshold: %.1f)" %
+			      (profiler.growthPerBattle(), profiler.threshold))
+			return 1
+	return 0
+
+def coordinatorMain(battles: int, sides: typing.Tuple[battle.Side, battle.Side],
+                    masterSeed: int, address: typing.Tuple[str, int]) -> int:
+	"""
+	Hands out `battles` battles between the given sides to workers connecting to `address`,
+	printing a summary of their results once they're all done. Returns the program's exit
+	status
+	"""
+	coordinator = cluster.Coordinator((sides,), battles, masterSeed)
+	host, port = coordinator.serve(address)
+	print("Waiting for workers on %s:%d" % (host, port))
+	if not cluster.defaultAuthkey():
+		print("Start workers with %s=%s" % (cluster.AUTHKEY_VARIABLE, coordinator.authkey.decode()))
+	try:
+		while not coordinator.wait(10.0):
+			print("%d of %d shards done" % coordinator.progress())
+	finally:
+		coordinator.shutdown()
+
+	print("Seed: %d" % masterSeed)
+	print(coordinator.results()[0].report(sides))
+	return 0
+
 def run():
 	"""
 	A wrapper for main to catch the user quitting for less ugly ends to the program
 	"""
-	if len(sys.argv) > 1 and sys.argv[1] in {'-V', '--version'}:
+	parser = argparse.ArgumentParser(prog="pokesim", description="Pokémon Battle Simulator")
+	parser.add_argument("-V", "--version", action="store_true",
+	                    help="print the program version and exit")
+	parser.add_argument("--trace", metavar="FILE",
+	                    help="record a Chrome trace of every battle turn to FILE")
+	parser.add_argument("--battles", type=int, metavar="N",
+	                    help="play out N battles without user interaction, rather than the game")
+	parser.add_argument("--species", nargs=2, metavar="SPECIES", default=["Bulbasaur", "Bulbasaur"],
+	                    help="the two Pokémon that battle each other with --battles")
+	parser.add_argument("--seed", type=int,
+	                    help="the master seed for the battles played with --battles")
+	parser.add_argument("--memprofile", action="store_true",
+	                    help="profile memory use while playing battles with --battles")
+	parser.add_argument("--memprofile-interval", type=int, default=100, metavar="N",
+	                    help="snapshot the heap every N battles (default: 100)")
+	parser.add_argument("--memprofile-threshold", type=float, default=1024.0, metavar="BYTES",
+	                    help="exit with an error if memory grows by more than BYTES per battle "
+	                         "(default: 1024)")
+	parser.add_argument("--checkpoint", metavar="FILE",
+	                    help="periodically save the progress of --battles to FILE")
+	parser.add_argument("--checkpoint-interval", type=float, default=60.0, metavar="SECONDS",
+	                    help="save a checkpoint at most every SECONDS seconds (default: 60)")
+	parser.add_argument("--resume", action="store_true",
+	                    help="carry on with the battles saved in the --checkpoint file")
+	parser.add_argument("--coordinator", metavar="HOST:PORT",
+	                    help="hand out the battles of --battles to workers connecting to HOST:PORT")
+	parser.add_argument("--worker", metavar="HOST:PORT",
+	                    help="play out battles for the coordinator at HOST:PORT")
+	parser.add_argument("--columns", metavar="DIR",
+	                    help="write the result of every battle played with --battles to .npy "
+	                         "column files in DIR")
+	parser.add_argument("--threads", type=int, metavar="N",
+	                    help="play the battles of --battles on N threads")
+	parser.add_argument("--benchmark-threads", action="store_true",
+	                    help="time --battles battles on 1, 2, 4 and 8 threads, and exit")
+	parser.add_argument("--transcript", metavar="DIR",
+	                    help="record a transcript of every battle turn in DIR, as gzip JSONL")
+	parser.add_argument("--transcript-policy", choices=(transcript.BLOCK, transcript.DROP),
+	                    default=transcript.BLOCK,
+	                    help="whether battles wait for the transcript writer or drop records "
+	                         "when it falls behind (default: %(default)s)")
+	parser.add_argument("--serve-damage", metavar="HOST:PORT",
+	                    help="serve damage calculations over HTTP on HOST:PORT")
+	args = parser.parse_args()
+	simulating = args.battles is not None or args.resume
+	if args.coordinator and (args.battles is None or args.resume or args.checkpoint or
+	                         args.memprofile):
+		parser.error("--coordinator requires --battles, and can't be used with --resume, "
+		             "--checkpoint or --memprofile")
+	if args.columns and (args.battles is None or args.resume or args.coordinator):
+		parser.error("--columns requires --battles, and can't be used with --resume or "
+		             "--coordinator")
+	if (args.threads or args.benchmark_threads) and (args.battles is None or args.coordinator):
+		parser.error("--threads and --benchmark-threads require --battles, and can't be used "
+		             "with --coordinator")
+	if args.worker and (simulating or args.coordinator):
+		parser.error("--worker can't be used with --battles, --resume or --coordinator")
+	if args.memprofile and not simulating:
+		parser.error("--memprofile can only be used with --battles")
+	if args.memprofile_interval < 1:
+		parser.error("--memprofile-interval must be at least 1")
+	if args.checkpoint and not simulating:
+		parser.error("--checkpoint can only be used with --battles or --resume")
+	if args.resume and not args.checkpoint:
+		parser.error("--resume requires --checkpoint")
+
+	if args.version:
 		print("pokesim - Pokémon Battle Simulator - Version %s (Platform: Python%s %s)" % (__version__, platform.python_version(), platform.system()))
 		exit()
 
-	random.seed()
+	if args.trace:
+		trace.enable(args.trace)
+	if args.transcript:
+		transcript.enable(args.transcript, args.transcript_policy)
+
+	if args.serve_damage:
+		damageserver.serve(cluster.parseAddress(args.serve_damage))
+		exit(0)
+
+	if args.worker:
+		if not cluster.defaultAuthkey():
+			parser.error("--worker needs the coordinator's key in %s" % cluster.AUTHKEY_VARIABLE)
+		played = cluster.runWorker(cluster.parseAddress(args.worker))
+		print("Played %d shards" % played)
+		exit(0)
+
+	if simulating:
+		sides = (battle.Side(args.species[0]), battle.Side(args.species[1]))
+		masterSeed = args.seed if args.seed is not None else prng.BattleRNG().seed
+		if args.benchmark_threads:
+			print(threads.benchmarkReport(threads.benchmark(sides, args.battles,
+			                                                masterSeed=masterSeed), args.battles))
+			exit(0)
+		if args.coordinator:
+			exit(coordinatorMain(args.battles, sides, masterSeed,
+			                     cluster.parseAddress(args.coordinator)))
+		profiler = None
+		if args.memprofile:
+			profiler = memprofile.MemoryProfiler(args.memprofile_interval, args.memprofile_threshold)
+		exit(simulateMain(args.battles, sides, masterSeed, profiler, args.checkpoint,
+		                  args.checkpoint_interval, args.resume, args.columns, args.threads))
+
 	try:
 		main()
 	except (KeyboardInterrupt, EOFError):
@@ -0,0 +1,228 @@
+"""
+Defines a battle between two Pokemon that can be played out without any user interaction,
+e.g. for running simulations in bulk
+"""
+
+import typing
+from . import move
+from . import pokemon
+from . import prng
+from . import trace
+from . import transcript
+from . import utils
+
+# The 'winner' of a battle that ended without either Pokemon fainting
+DRAW = -1
+
+# The version of the rules battles are played out by, which goes into the keys of cached
+# results. Bump it whenever a change to the engine changes the outcome of any battle (2: damage
+# computed in fixed point with the cartridge's rounding, 3: speed ties broken with their own draw,
+# 4: critical hits below stage 0 back to halving the odds with each stage)
+ENGINE_VERSION = 4
+
+# The index used to derive the seed of a battle's move choice stream from the battle's seed
+CHOICE_STREAM = -1
+
+class Side(typing.NamedTuple):
+	"""
+	Everything needed to set up one side of a battle
+	"""
+	species: str
+	level: int = 100
+	nature: str = 'Hardy'
+	EVs: typing.Tuple[int, ...] = pokemon.DEFAULT_EVS
+	moves: typing.Tuple[str, ...] = pokemon.DEFAULT_MOVESET
+
+	def build(self, opponent: bool = False) -> pokemon.Pokemon:
+		"""
+		Builds the Pokemon described by this side
+		"""
+		name = "The opponent's " + self.species if opponent else self.species
+		return pokemon.build(self.species, name, self.level, self.nature, self.EVs, self.moves)
+
+class BattleResult(typing.NamedTuple):
+	"""
+	The outcome of a single battle
+	"""
+	seed: int
+	winner: int
+	turns: int
+	damage0: int
+	damage1: int
+	crits0: int
+	crits1: int
+	HP0: int
+	HP1: int
+	moveDamage: typing.Tuple[typing.Tuple[int, ...], typing.Tuple[int, ...]] = ((), ())
+
+class Battle():
+	"""
+	A battle between two Pokemon, which owns the random number generators used for
+	everything that happens in it. Random move choices are drawn from a separate stream
+	than the battle's mechanics, so that a battle can be re-run from its seed and the
+	moves chosen, however they were chosen
+	"""
+
+	def __init__(self, poke0: pokemon.Pokemon, poke1: pokemon.Pokemon,
+	             rng: prng.BattleRNG = None, maxTurns: int = 1000):
+		"""
+		Creates a battle between two already set-up Pokemon. If no generator is given, one
+		is seeded from the OS. The battle is a draw if it goes on for `maxTurns` turns
+		"""
+		self.pokemon = (poke0, poke1)
+		self.rng = rng if rng is not None else prng.BattleRNG()
+		self.choiceRNG = prng.BattleRNG(prng.battleSeed(self.rng.seed, CHOICE_STREAM))
+		self.maxTurns = maxTurns
+		self.turns = 0
+		self.over = False
+		self.winner = DRAW
+		self.damage = [0, 0]
+		self.crits = [0, 0]
+		self.moveDamage = ([0] * len(poke0.moves), [0] * len(poke1.moves))
+		self.journal = None
+
+	def attach(self, journal: 'undo.UndoLog'):
+		"""
+		Records every change made to the battle from now on in the given undo log (or stops
+		recording changes, if `journal` is None)
+		"""
+		self.journal = journal
+		for poke in self.pokemon:
+			poke.journal = journal
+
+	def usableMoves(self, side: int) -> typing.List[int]:
+		"""
+		Returns the indices of the moves the Pokemon on `side` has PP left for
+		"""
+		return [i for i, mymove in enumerate(self.pokemon[side].moves) if mymove.PP > 0]
+
+	def randomChoice(self, side: int) -> int:
+		"""
+		Picks one of the usable moves of the Pokemon on `side` at random
+		"""
+		usable = self.usableMoves(side)
+		return usable[self.choiceRNG.randrange(len(usable))]
+
+	def turn(self, choice0: int, choice1: int) -> typing.List[str]:
+		"""
+		Plays out a single turn, given the index of the move each side chose.
+		Returns a description of what happened
+		"""
+		choices = (choice0, choice1)
+		moves = (self.pokemon[0].moves[choice0], self.pokemon[1].moves[choice1])
+		with trace.span("decideOrder"):
+			first = utils.decideOrder(self.pokemon[0], moves[0], self.pokemon[1], moves[1], self.rng)
+
+		journal = self.journal
+		if journal is not None:
+			for name in ("turns", "over", "winner"):
+				journal.recordAttr(self, name)
+
+		events = []
+		for side in (first, 1 - first):
+			attacker, defender = self.pokemon[side], self.pokemon[1 - side]
+			HP = defender.HP
+			with trace.span("useMove", side=side, move=moves[side].name):
+				result = attacker.useMove(moves[side], defender, moves[1 - side], self.rng)
+			if defender.HP != HP:
+				if journal is not None:
+					journal.recordItem(self.damage, side)
+					journal.recordItem(self.moveDamage[side], choices[side])
+				self.damage[side] += HP - defender.HP
+				self.moveDamage[side][choices[side]] += HP - defender.HP
+			if move.CRITICAL_HIT in result:
+				if journal is not None:
+					journal.recordItem(self.crits, side)
+				self.crits[side] += 1
+			events.append("%s used %s!\n%s" % (attacker, moves[side], result))
+
+			if not defender.HP:
+				self.over = True
+				self.winner = side
+				break
+
+		self.turns += 1
+		if self.turns >= self.maxTurns:
+			self.over = True
+
+		writer = transcript.active()
+		if writer is not None:
+			writer.record(seed=self.rng.seed, turn=self.turns, first=first,
+			              moves=[moves[0].name, moves[1].name], events=events,
+			              HP=[self.pokemon[0].HP, self.pokemon[1].HP],
+			              over=self.over, winner=self.winner)
+		return events
+
+	def play(self,
+	         policy0: typing.Callable[['Battle', int], int] = None,
+	         policy1: typing.Callable[['Battle', int], int] = None) -> int:
+		"""
+		Plays the battle out to the end, with each side choosing its moves using the given
+		policy (a callable taking the battle and the side number, and returning a move
+		index), or at random if no policy is given. Returns the winning side, or DRAW
+		"""
+		policy0 = policy0 if policy0 is not None else Battle.randomChoice
+		policy1 = policy1 if policy1 is not None else Battle.randomChoice
+
+		while not self.over:
+			if not self.usableMoves(0) or not self.usableMoves(1):
+				self.over = True
+				break
+			with trace.span("turn", turn=self.turns):
+				with trace.span("moveSelection"):
+					choice0, choice1 = policy0(self, 0), policy1(self, 1)
+				self.turn(choice0, choice1)
+
+		return self.winner
+
+	def getstate(self) -> typing.Tuple:
+		"""
+		Returns an object capturing everything about the battle that can change as it's
+		played out
+		"""
+		pokes = tuple((poke.HP, poke.status, tuple(poke.stages.items()),
+		               tuple(mymove.PP for mymove in poke.moves)) for poke in self.pokemon)
+		return (pokes, self.turns, self.over, self.winner, tuple(self.damage), tuple(self.crits),
+		        tuple(tuple(moveDamage) for moveDamage in self.moveDamage),
+		        self.rng.getstate(), self.choiceRNG.getstate())
+
+	def setstate(self, state: typing.Tuple):
+		"""
+		Returns the battle to a state previously captured with `getstate`
+		"""
+		pokes, self.turns, self.over, self.winner, damage, crits, moveDamage, rngState, choiceState = state
+		for poke, (HP, status, stages, PP) in zip(self.pokemon, pokes):
+			poke.HP = HP
+			poke.status = status
+			poke.stages.update(stages)
+			for mymove, movePP in zip(poke.moves, PP):
+				mymove.PP = movePP
+		self.damage = list(damage)
+		self.crits = list(crits)
+		for current, saved in zip(self.moveDamage, moveDamage):
+			current[:] = saved
+		self.rng.setstate(rngState)
+		self.choiceRNG.setstate(choiceState)
+
+	def result(self) -> BattleResult:
+		"""
+		Summarizes the battle as it stands
+		"""
+		return BattleResult(self.rng.seed, self.winner, self.turns,
+		                    self.damage[0], self.damage[1],
+		                    self.crits[0], self.crits[1],
+		                    self.pokemon[0].HP, self.pokemon[1].HP,
+		                    tuple(tuple(moveDamage) for moveDamage in self.moveDamage))
+
+def simulate(sides: typing.Tuple[Side, Side], masterSeed: int, index: int,
+             **kwargs) -> BattleResult:
+	"""
+	Plays out the `index`th battle of a run seeded with `masterSeed` between the two given
+	sides, with both choosing moves at random. The result depends only on the arguments,
+	regardless of which process or thread runs it. Extra keyword arguments are passed
+	through to the Battle
+	"""
+	rng = prng.BattleRNG.forBattle(masterSeed, index)
+	battle = Battle(sides[0].build(), sides[1].build(True), rng, **kwargs)
+	battle.play()
+	return battle.result()
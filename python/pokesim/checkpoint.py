@@ -0,0 +1,182 @@
+"""
+Defines checkpointing for long simulation jobs, so that a job that's interrupted (by a crash,
+pre-emption etc.) can be resumed where it stopped rather than started over.
+
+A job's battles are played in fixed-size work units, each summarized on its own and then
+merged into the job's running summary in order. Every battle's random numbers depend only
+on the job's master seed and the battle's index, so a checkpoint - the number of units
+completed and the merged summary - is all that's needed to carry on, and a resumed job
+gives exactly the same results as one that was never interrupted.
+"""
+
+import os
+import pickle
+import tempfile
+import time
+import typing
+from . import battle
+from . import stats
+
+# Identifies checkpoint files, and the version of their format
+MAGIC = b"PKCK"
+VERSION = 1
+
+class Job(typing.NamedTuple):
+	"""
+	A simulation job: some number of battles between two sides
+	"""
+	sides: typing.Tuple[battle.Side, battle.Side]
+	masterSeed: int
+	battles: int
+	maxTurns: int = 1000
+	unitSize: int = 100
+
+class Checkpoint(typing.NamedTuple):
+	"""
+	The progress of a job
+	"""
+	job: Job
+	units: int
+	aggregate: stats.BattleAggregate
+
+	@property
+	def completed(self) -> int:
+		"""
+		The number of battles played so far, which is also the index of the next one
+		"""
+		return min(self.units * self.job.unitSize, self.job.battles)
+
+def save(path: str, checkpoint: Checkpoint):
+	"""
+	Writes a checkpoint to `path` atomically: it's written to a temporary file which then
+	replaces the old checkpoint, so a crash while saving leaves the old one intact
+	"""
+	directory = os.path.dirname(os.path.abspath(path))
+	fd, tmpPath = tempfile.mkstemp(prefix=".checkpoint-", dir=directory)
+	try:
+		with os.fdopen(fd, "wb") as tmpFile:
+			tmpFile.write(MAGIC + bytes((VERSION,)))
+			pickle.dump(tuple(checkpoint), tmpFile, pickle.HIGHEST_PROTOCOL)
+			tmpFile.flush()
+			os.fsync(tmpFile.fileno())
+		os.replace(tmpPath, path)
+	except BaseException:
+		os.unlink(tmpPath)
+		raise
+
+def load(path: str) -> Checkpoint:
+	"""
+	Reads a checkpoint from `path`. Raises a ValueError if it isn't a checkpoint file
+	"""
+	with open(path, "rb") as checkpointFile:
+		header = checkpointFile.read(len(MAGIC) + 1)
+		if header != MAGIC + bytes((VERSION,)):
+			raise ValueError("'%s' is not a pokesim checkpoint" % path)
+		job, units, aggregate = pickle.load(checkpointFile)
+	return Checkpoint(Job(*job), units, aggregate)
+
+class CheckpointedRun():
+	"""
+	Plays out a job one work unit at a time, saving a checkpoint to `path` whenever at least
+	`interval` seconds have passed since the last one. Saving takes time proportional to the
+	size of the summary, which doesn't grow with the number of battles, so the cost of
+	checkpointing is bounded by the interval
+	"""
+
+	def __init__(self, job: Job, path: str = None, interval: float = 60.0,
+	             workers: typing.Union['pool.WorkerPool', 'threads.ThreadRunner'] = None):
+		"""
+		Sets up a fresh run of `job`. If `path` is None, no checkpoints are saved. Each
+		work unit's battles are played in parallel on `workers`, if given
+		"""
+		self.path = path
+		self.interval = interval
+		self.workers = workers
+		self.checkpoint = Checkpoint(job, 0, stats.BattleAggregate(job.maxTurns))
+		self.lastSave = time.monotonic()
+
+		# Set while a unit is being merged into the summary, during which the checkpoint
+		# is inconsistent and mustn't be saved
+		self._merging = False
+
+	@classmethod
+	def resume(cls, path: str, interval: float = 60.0,
+	           workers: typing.Union['pool.WorkerPool', 'threads.ThreadRunner'] = None
+	          ) -> 'CheckpointedRun':
+		"""
+		Sets up a run that carries on from the checkpoint saved at `path`
+		"""
+		checkpoint = load(path)
+		run = cls(checkpoint.job, path, interval, workers)
+		run.checkpoint = checkpoint
+		return run
+
+	@property
+	def job(self) -> Job:
+		"""
+		The job being run
+		"""
+		return self.checkpoint.job
+
+	@property
+	def done(self) -> bool:
+		"""
+		Whether every battle of the job has been played
+		"""
+		return self.checkpoint.completed >= self.job.battles
+
+	def save(self):
+		"""
+		Saves a checkpoint of the run's progress now
+		"""
+		if self.path is not None:
+			save(self.path, self.checkpoint)
+		self.lastSave = time.monotonic()
+
+	def runUnit(self, onBattle: typing.Callable[[battle.BattleResult], None] = None):
+		"""
+		Plays out the next work unit and merges it into the summary, saving a checkpoint
+		afterwards if one is due
+		"""
+		job = self.job
+		start = self.checkpoint.completed
+		indices = range(start, min(start + job.unitSize, job.battles))
+		if self.workers is not None:
+			results = self.workers.simulate(job.sides, job.masterSeed, indices,
+			                                maxTurns=job.maxTurns)
+		else:
+			results = (battle.simulate(job.sides, job.masterSeed, index, maxTurns=job.maxTurns)
+			           for index in indices)
+
+		unit = stats.BattleAggregate(job.maxTurns)
+		for result in results:
+			unit.push(result)
+			if onBattle is not None:
+				onBattle(result)
+
+		self._merging = True
+		aggregate = self.checkpoint.aggregate
+		aggregate.merge(unit)
+		self.checkpoint = Checkpoint(job, self.checkpoint.units + 1, aggregate)
+		self._merging = False
+		if time.monotonic() - self.lastSave >= self.interval:
+			self.save()
+
+	def run(self, onBattle: typing.Callable[[battle.BattleResult], None] = None
+	       ) -> stats.BattleAggregate:
+		"""
+		Plays out the rest of the job, calling `onBattle` (if given) with the result of each
+		battle, and returns the summary of all of its battles. A final checkpoint is saved
+		when the job finishes, or when it's interrupted with Ctrl+C (in which case the
+		unfinished work unit is thrown away, and if the interruption came while a unit
+		was being merged, the previous checkpoint is kept)
+		"""
+		try:
+			while not self.done:
+				self.runUnit(onBattle)
+		except KeyboardInterrupt:
+			if not self._merging:
+				self.save()
+			raise
+		self.save()
+		return self.checkpoint.aggregate
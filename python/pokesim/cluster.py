@@ -0,0 +1,278 @@
+"""
+Defines a coordinator that spreads simulation jobs over worker processes on any number of
+machines, talking over TCP with `multiprocessing.managers`.
+
+Every matchup's battles are split into shards of consecutive battle indices. A job with a
+single matchup is seeded with its master seed, exactly like a local run; otherwise each
+matchup gets its own seed derived from the master seed. Every battle's random numbers
+depend only on that seed and the battle's index, so a shard's results don't depend on which
+worker plays it. Workers lease shards from the coordinator and keep their leases alive with
+heartbeats; the shards of a worker that stops sending them are handed out again. Results
+are merged in shard order, so they're the same however the work was spread out.
+"""
+
+import collections
+import os
+import secrets
+import socket
+import threading
+import time
+import typing
+from multiprocessing import managers
+from . import battle
+from . import prng
+from . import stats
+
+# The environment variable holding the key used to authenticate workers when none is given.
+# Connections are pickled, so anyone with the key can run code on the coordinator and on
+# every worker; there's no default key
+AUTHKEY_VARIABLE = "POKESIM_AUTHKEY"
+
+def defaultAuthkey() -> typing.Optional[bytes]:
+	"""
+	Returns the key set in the environment for authenticating workers, if any
+	"""
+	authkey = os.environ.get(AUTHKEY_VARIABLE)
+	return authkey.encode() if authkey else None
+
+class Shard(typing.NamedTuple):
+	"""
+	A range of battles of one matchup
+	"""
+	shardId: int
+	matchup: int
+	sides: typing.Tuple[battle.Side, battle.Side]
+	seed: int
+	start: int
+	stop: int
+	maxTurns: int = 1000
+
+def runShard(shard: Shard, workers: 'pool.WorkerPool' = None) -> stats.BattleAggregate:
+	"""
+	Plays out the battles of a shard, on a pool of local worker processes if given, and
+	returns a summary of their results
+	"""
+	indices = range(shard.start, shard.stop)
+	if workers is not None:
+		results = workers.simulate(shard.sides, shard.seed, indices, maxTurns=shard.maxTurns)
+	else:
+		results = (battle.simulate(shard.sides, shard.seed, index, maxTurns=shard.maxTurns)
+		           for index in indices)
+
+	aggregate = stats.BattleAggregate(shard.maxTurns)
+	for result in results:
+		aggregate.push(result)
+	return aggregate
+
+class Coordinator():
+	"""
+	Hands out the shards of a job to workers, and collects their results
+	"""
+
+	def __init__(self, matchups: typing.Sequence[typing.Tuple[battle.Side, battle.Side]],
+	             battles: int, masterSeed: int, shardSize: int = 1000, maxTurns: int = 1000,
+	             leaseTimeout: float = 60.0):
+		"""
+		Splits `battles` battles of each of the given matchups into shards of `shardSize`
+		battles. A shard is handed out again if its worker sends no heartbeat for
+		`leaseTimeout` seconds
+		"""
+		self.matchups = tuple(matchups)
+		self.battles = battles
+		self.masterSeed = masterSeed
+		self.maxTurns = maxTurns
+		self.leaseTimeout = leaseTimeout
+
+		self.shards = []
+		for matchup, sides in enumerate(self.matchups):
+			# A single matchup is seeded just like a local run with the same master seed, so
+			# that the two give the same results; several each get a seed of their own
+			seed = masterSeed if len(self.matchups) == 1 else prng.battleSeed(masterSeed, matchup)
+			for start in range(0, battles, shardSize):
+				self.shards.append(Shard(len(self.shards), matchup, sides, seed, start,
+				                         min(start + shardSize, battles), maxTurns))
+
+		self._lock = threading.Lock()
+		self._pending = collections.deque(self.shards)
+		self._leases = {}
+		self._deadlines = {}
+		self._results = {}
+		self._finished = threading.Event()
+		self._server = None
+		self.authkey = None
+		if not self.shards:
+			self._finished.set()
+
+	def _reclaim(self):
+		"""
+		Puts the shards of workers whose leases have run out back at the front of the queue
+		"""
+		now = time.monotonic()
+		for workerId, deadline in list(self._deadlines.items()):
+			if deadline < now:
+				del self._deadlines[workerId]
+				for shardId, owner in list(self._leases.items()):
+					if owner == workerId:
+						del self._leases[shardId]
+						self._pending.appendleft(self.shards[shardId])
+
+	def lease(self, workerId: str) -> typing.Optional[Shard]:
+		"""
+		Hands a shard to the given worker. Returns None if there's nothing to hand out right
+		now, which is when the job is finished or every remaining shard is leased out
+		"""
+		with self._lock:
+			self._reclaim()
+			while self._pending:
+				shard = self._pending.popleft()
+				if shard.shardId not in self._results:
+					self._leases[shard.shardId] = workerId
+					self._deadlines[workerId] = time.monotonic() + self.leaseTimeout
+					return shard
+			return None
+
+	def heartbeat(self, workerId: str):
+		"""
+		Keeps the leases of the given worker alive
+		"""
+		with self._lock:
+			if workerId in self._deadlines:
+				self._deadlines[workerId] = time.monotonic() + self.leaseTimeout
+
+	def complete(self, workerId: str, shardId: int, aggregate: stats.BattleAggregate) -> bool:
+		"""
+		Records the results of a shard. Results for a shard that's already been completed
+		(by a worker that was presumed dead) are ignored. Returns whether they were recorded
+		"""
+		with self._lock:
+			if self._leases.get(shardId) == workerId:
+				del self._leases[shardId]
+			if workerId not in self._leases.values():
+				self._deadlines.pop(workerId, None)
+			if shardId in self._results:
+				return False
+			self._results[shardId] = aggregate
+			if len(self._results) == len(self.shards):
+				self._finished.set()
+			return True
+
+	def finished(self) -> bool:
+		"""
+		Returns whether every shard has been completed
+		"""
+		return self._finished.is_set()
+
+	def progress(self) -> typing.Tuple[int, int]:
+		"""
+		Returns the number of shards completed, and the total number of shards
+		"""
+		with self._lock:
+			return len(self._results), len(self.shards)
+
+	def wait(self, timeout: float = None) -> bool:
+		"""
+		Waits until every shard has been completed, or `timeout` seconds pass. Returns
+		whether the job is finished
+		"""
+		return self._finished.wait(timeout)
+
+	def results(self) -> typing.List[stats.BattleAggregate]:
+		"""
+		Returns the summary of each matchup's battles, merging its shards in order. Raises
+		a RuntimeError if the job isn't finished
+		"""
+		if not self.finished():
+			raise RuntimeError("The job isn't finished (%d of %d shards done)" % self.progress())
+		aggregates = [stats.BattleAggregate(self.maxTurns) for _ in self.matchups]
+		for shard in self.shards:
+			aggregates[shard.matchup].merge(self._results[shard.shardId])
+		return aggregates
+
+	def serve(self, address: typing.Tuple[str, int], authkey: bytes = None
+	         ) -> typing.Tuple[str, int]:
+		"""
+		Starts accepting workers on `address` in a background thread. Workers must give
+		`authkey`, or else the key in the environment; if neither is set, a random key is
+		generated (and kept in `authkey`) to be passed on to them. Returns the address
+		actually listened on (e.g. when the port given is 0)
+		"""
+		self.authkey = authkey or defaultAuthkey() or secrets.token_hex(16).encode()
+		class CoordinatorServer(managers.BaseManager):
+			"""
+			Serves this coordinator
+			"""
+		CoordinatorServer.register("coordinator", callable=lambda: self)
+		server = CoordinatorServer(address, self.authkey)
+		self._server = server.get_server()
+		threading.Thread(target=self._server.serve_forever, name="pokesim-coordinator",
+		                 daemon=True).start()
+		return self._server.address
+
+	def shutdown(self):
+		"""
+		Stops accepting workers
+		"""
+		if self._server is not None:
+			self._server.stop_event.set()
+			self._server = None
+
+class CoordinatorClient(managers.BaseManager):
+	"""
+	A connection to a coordinator served on another process or machine
+	"""
+CoordinatorClient.register("coordinator")
+
+def runWorker(address: typing.Tuple[str, int], authkey: bytes = None,
+              workerId: str = None, workers: 'pool.WorkerPool' = None,
+              heartbeatInterval: float = 10.0, pollInterval: float = 1.0) -> int:
+	"""
+	Plays out shards leased from the coordinator at `address` until its job is finished (or
+	it goes away), on a pool of local worker processes if given. The coordinator's key must
+	be given as `authkey` or set in the environment; otherwise a RuntimeError is raised.
+	Returns the number of shards played
+	"""
+	authkey = authkey or defaultAuthkey()
+	if not authkey:
+		raise RuntimeError("No key to authenticate with the coordinator; set %s" % AUTHKEY_VARIABLE)
+	if workerId is None:
+		workerId = "%s:%d" % (socket.gethostname(), os.getpid())
+	client = CoordinatorClient(address, authkey)
+	client.connect()
+	coordinator = client.coordinator()
+
+	stop = threading.Event()
+	def beat():
+		"""
+		Sends heartbeats until the worker stops
+		"""
+		while not stop.wait(heartbeatInterval):
+			try:
+				coordinator.heartbeat(workerId)
+			except (EOFError, OSError):
+				return
+	threading.Thread(target=beat, name="pokesim-heartbeat", daemon=True).start()
+
+	played = 0
+	try:
+		while True:
+			shard = coordinator.lease(workerId)
+			if shard is None:
+				if coordinator.finished():
+					break
+				time.sleep(pollInterval)
+				continue
+			coordinator.complete(workerId, shard.shardId, runShard(shard, workers))
+			played += 1
+	except (EOFError, OSError):
+		# The coordinator has shut down
+		pass
+	finally:
+		stop.set()
+	return played
+
+def parseAddress(address: str) -> typing.Tuple[str, int]:
+	"""
+	Parses a "host:port" address
+	"""
+	host, _, port = address.rpartition(":")
+	return (host or "localhost", int(port))
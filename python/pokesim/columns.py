@@ -0,0 +1,167 @@
+"""
+Defines a columnar writer for per-battle results, which stores each field as a fixed-type
+array in its own `.npy` file so that analysis tools can memory-map them without parsing or
+copying anything (e.g. `numpy.load(path, mmap_mode='r')`). NumPy isn't needed to write or
+read the files; `openColumns` maps each column as a plain `memoryview`.
+
+Rows are buffered and appended in chunks, so memory stays bounded however many battles are
+written. Each file's header is rewritten with the new row count after every chunk, so the
+files are always valid, even while they're being written.
+"""
+
+import array
+import ast
+import mmap
+import os
+import struct
+import sys
+import typing
+from . import battle
+
+# The columns written for each battle result, as (field name, `array` typecode) pairs
+RESULT_COLUMNS = (("seed", "Q"), ("winner", "b"), ("turns", "i"),
+                  ("damage0", "i"), ("damage1", "i"), ("crits0", "h"), ("crits1", "h"),
+                  ("HP0", "i"), ("HP1", "i"))
+
+# The .npy format: a magic string, a version, the length of the header and then the header
+# itself (a Python dict literal) padded so that the data that follows is aligned. Headers
+# are padded to a fixed size, so they can be rewritten in place as rows are appended
+MAGIC = b"\x93NUMPY\x01\x00"
+HEADER_SIZE = 128
+BYTE_ORDER = "<" if sys.byteorder == "little" else ">"
+
+def descr(typecode: str) -> str:
+	"""
+	Returns the .npy type description of an `array` typecode
+	"""
+	kind = "f" if typecode in "fd" else ("u" if typecode.isupper() else "i")
+	return "%s%s%d" % (BYTE_ORDER, kind, array.array(typecode).itemsize)
+
+def header(typecode: str, rows: int) -> bytes:
+	"""
+	Returns the .npy header of a column of `rows` values of the given type
+	"""
+	info = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr(typecode), rows)
+	padding = HEADER_SIZE - len(MAGIC) - 2 - len(info) - 1
+	return b"".join((MAGIC, struct.pack("<H", HEADER_SIZE - len(MAGIC) - 2), info.encode(),
+	                 b" " * padding, b"\n"))
+
+class ColumnWriter():
+	"""
+	Appends battle results to a directory of column files, one chunk at a time
+	"""
+
+	def __init__(self, directory: str,
+	             columns: typing.Sequence[typing.Tuple[str, str]] = RESULT_COLUMNS,
+	             chunkSize: int = 65536):
+		"""
+		Creates (or empties) a `.npy` file in `directory` for each of the given columns.
+		At most `chunkSize` rows are buffered in memory before being written out
+		"""
+		os.makedirs(directory, exist_ok=True)
+		self.directory = directory
+		self.columns = tuple(columns)
+		self.chunkSize = chunkSize
+		self.rows = 0
+		self._buffers = [array.array(typecode) for _, typecode in self.columns]
+		self._files = []
+		for name, typecode in self.columns:
+			columnFile = open(os.path.join(directory, name + ".npy"), "w+b")
+			columnFile.write(header(typecode, 0))
+			self._files.append(columnFile)
+
+	def append(self, row: typing.Union[battle.BattleResult, typing.Sequence]):
+		"""
+		Adds a row (e.g. a BattleResult) with a value for each column, in order. Rows that
+		are named tuples may have more fields than there are columns; values are looked up
+		by column name
+		"""
+		if hasattr(row, "_asdict"):
+			row = [getattr(row, name) for name, _ in self.columns]
+		for buf, value in zip(self._buffers, row):
+			buf.append(value)
+		if len(self._buffers[0]) >= self.chunkSize:
+			self.flush()
+
+	def flush(self):
+		"""
+		Writes out the buffered rows, and updates every file's row count
+		"""
+		pending = len(self._buffers[0])
+		if not pending:
+			return
+		self.rows += pending
+		for (_, typecode), buf, columnFile in zip(self.columns, self._buffers, self._files):
+			columnFile.seek(0, os.SEEK_END)
+			buf.tofile(columnFile)
+			columnFile.seek(0)
+			columnFile.write(header(typecode, self.rows))
+			columnFile.flush()
+			del buf[:]
+
+	def close(self):
+		"""
+		Writes out any buffered rows and closes the files
+		"""
+		self.flush()
+		for columnFile in self._files:
+			columnFile.close()
+		self._files = []
+
+	def __enter__(self) -> 'ColumnWriter':
+		"""
+		Allows the writer to be used as a context manager
+		"""
+		return self
+
+	def __exit__(self, *unused_exc_info):
+		"""
+		Closes the writer on leaving a context
+		"""
+		self.close()
+
+class Column():
+	"""
+	A read-only, memory-mapped column
+	"""
+
+	def __init__(self, path: str):
+		"""
+		Maps the `.npy` column file at `path`
+		"""
+		with open(path, "rb") as columnFile:
+			if columnFile.read(len(MAGIC) - 2) != MAGIC[:-2]:
+				raise ValueError("'%s' isn't a .npy file" % path)
+			major, _ = columnFile.read(2)
+			lengthFormat = "<H" if major == 1 else "<I"
+			length, = struct.unpack(lengthFormat, columnFile.read(struct.calcsize(lengthFormat)))
+			info = ast.literal_eval(columnFile.read(length).decode("latin1"))
+			offset = columnFile.tell()
+			self.map = mmap.mmap(columnFile.fileno(), 0, access=mmap.ACCESS_READ)
+
+		if info["fortran_order"] or len(info["shape"]) != 1:
+			raise ValueError("'%s' isn't a one-dimensional column" % path)
+		self.descr = info["descr"]
+		byteOrder, kind, size = self.descr[0], self.descr[1], int(self.descr[2:])
+		if byteOrder not in (BYTE_ORDER, "|"):
+			raise ValueError("'%s' isn't in this machine's byte order" % path)
+		typecodes = {array.array(code).itemsize: code for code in
+		             ("fd" if kind == "f" else ("BHILQ" if kind == "u" else "bhilq"))}
+		self.rows = info["shape"][0]
+		self._view = memoryview(self.map)
+		self.values = self._view[offset:offset + self.rows * size].cast(typecodes[size])
+
+	def close(self):
+		"""
+		Unmaps the column
+		"""
+		self.values.release()
+		self._view.release()
+		self.map.close()
+
+def openColumns(directory: str) -> typing.Dict[str, Column]:
+	"""
+	Maps every column in a directory written by a ColumnWriter
+	"""
+	return {name[:-len(".npy")]: Column(os.path.join(directory, name))
+	        for name in sorted(os.listdir(directory)) if name.endswith(".npy")}
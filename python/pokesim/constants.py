@@ -38,6 +38,20 @@ CRIT            = Stats.Critical_Ratio
 ACCURACY        = Stats.Accuracy
 EVASIVENESS     = Stats.Evasiveness
 
+# Stat stage multipliers for stages -6 through +6 (indexed by stage + 6), as (numerator,
+# denominator) pairs so that stats can be scaled with exact integer arithmetic. Accuracy and
+# evasiveness stages go up and down in thirds rather than halves
+STAT_STAGES = tuple((max(2, 2 + stage), max(2, 2 - stage)) for stage in range(-6, 7))
+ACCURACY_STAGES = tuple((max(3, 3 + stage), max(3, 3 - stage)) for stage in range(-6, 7))
+
+def applyStage(value: int, stage: int,
+               table: typing.Tuple[typing.Tuple[int, int], ...] = STAT_STAGES) -> int:
+	"""
+	Scales a stat by the multiplier for the given stage, truncating the result
+	"""
+	numerator, denominator = table[stage + 6]
+	return value * numerator // denominator
+
 class Status(enum.IntEnum):
 	"""
 	A pokemon's status, enumerated for ease-of-use
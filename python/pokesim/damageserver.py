@@ -0,0 +1,355 @@
+"""
+Defines a local HTTP/JSON service that calculates damage ranges with `Move.calcDmg`, for
+tools that need many of them quickly.
+
+Queries are POSTed to /damage, either one at a time or as a JSON list. A query describes
+the attacker, the defender and the move:
+
+	{"attacker": {"species": "Bulbasaur", "level": 50, "nature": "Adamant",
+	              "EVs": [0, 252, 0, 0, 4, 252], "stages": {"Attack": 2}, "status": "BRN"},
+	 "defender": {"species": "Bulbasaur"},
+	 "move": "Vine Whip"}
+
+and anything left out gets the same default as in `pokemon.build`. The answer is the damage
+done with each of the 16 possible damage rolls, without and with a critical hit, along with
+the chance of a critical hit.
+
+Queries arriving at the same time (from any number of connections) are coalesced into
+batches, which are evaluated together, each distinct query once. Results are cached in an
+LRU keyed by the normalized query. GET /stats reports the cache hit rate and the p50/p99
+latency of requests.
+"""
+
+import collections
+import http.server
+import json
+import queue
+import threading
+import time
+import typing
+from concurrent import futures
+from . import constants
+from . import move
+from . import nature
+from . import pokemon
+from . import prng
+from . import stats
+from . import utils
+
+# A normalized query: the attacker, the defender and the move name, where each side is
+# (species, level, nature, EVs, non-zero stages as sorted (stat, stage) pairs, status)
+Side = typing.Tuple[str, int, str, typing.Tuple[int, ...], typing.Tuple[typing.Tuple[int, int], ...], int]
+Query = typing.Tuple[Side, Side, str]
+
+class QueryError(ValueError):
+	"""
+	Raised when a query is malformed
+	"""
+
+def isKnown(kind: str, name: str) -> bool:
+	"""
+	Checks whether there's a data file of the given kind with the given name
+	"""
+	return name in utils.listData(kind)
+
+def normalizeSide(spec: typing.Dict[str, typing.Any],
+                  known: typing.Callable[[str, str], bool] = isKnown) -> Side:
+	"""
+	Normalizes the JSON description of one side of a query, filling in defaults. Species
+	are checked with `known`
+	"""
+	if not isinstance(spec, dict) or not isinstance(spec.get("species"), str):
+		raise QueryError("Each side needs at least a 'species'")
+	if not known("pokemon", spec["species"]):
+		raise QueryError("Unknown species: '%s'" % spec["species"])
+
+	level = int(spec.get("level", 100))
+	if not 1 <= level <= 100:
+		raise QueryError("Invalid level: %d" % level)
+
+	natureName = spec.get("nature", "Hardy")
+	if natureName not in nature.Natures:
+		raise QueryError("Unknown nature: '%s'" % natureName)
+
+	EVs = tuple(int(EV) for EV in spec.get("EVs", pokemon.DEFAULT_EVS))
+	if len(EVs) != 6:
+		raise QueryError("'EVs' must have 6 values")
+
+	stages = {}
+	for statName, stage in spec.get("stages", {}).items():
+		try:
+			stat = constants.Stats[statName.replace(' ', '_')]
+		except KeyError:
+			raise QueryError("Unknown stat: '%s'" % statName)
+		if stat == constants.HP or not -6 <= int(stage) <= 6:
+			raise QueryError("Invalid stage for %s: %s" % (statName, stage))
+		if stage:
+			stages[int(stat)] = int(stage)
+
+	statusName = spec.get("status", constants.NON.name)
+	abbreviations = {abbrev: status for status, abbrev in constants.Status.abbrev().items()}
+	try:
+		status = abbreviations[statusName] if statusName in abbreviations else constants.Status[statusName]
+	except KeyError:
+		raise QueryError("Unknown status: '%s'" % statusName)
+
+	return (spec["species"], level, natureName, EVs,
+	        tuple(sorted(stages.items())), int(status))
+
+def normalize(query: typing.Dict[str, typing.Any],
+              known: typing.Callable[[str, str], bool] = isKnown) -> Query:
+	"""
+	Normalizes the JSON description of a query, filling in defaults. Species and moves are
+	checked with `known`
+	"""
+	if not isinstance(query, dict) or not isinstance(query.get("move"), str):
+		raise QueryError("A query needs an 'attacker', a 'defender' and a 'move'")
+	if not known("moves", query["move"]):
+		raise QueryError("Unknown move: '%s'" % query["move"])
+	return (normalizeSide(query.get("attacker"), known), normalizeSide(query.get("defender"), known),
+	        query["move"])
+
+def buildSide(side: Side) -> pokemon.Pokemon:
+	"""
+	Builds the Pokemon described by one side of a normalized query
+	"""
+	species, level, natureName, EVs, stages, status = side
+	poke = pokemon.build(species, level=level, nature=natureName, EVs=EVs, moves=())
+	poke.stages.update((constants.Stats(stat), stage) for stat, stage in stages)
+	poke.status = constants.Status(status)
+	return poke
+
+def evaluate(query: Query) -> typing.Dict[str, typing.Any]:
+	"""
+	Calculates the damage ranges for a normalized query
+	"""
+	attackerSide, defenderSide, moveName = query
+	try:
+		attacker, defender = buildSide(attackerSide), buildSide(defenderSide)
+		mymove = move.Move(moveName)
+	except FileNotFoundError as e:
+		raise QueryError("Unknown species or move: %s" % e)
+	if mymove.moveType == move.STATUS:
+		raise QueryError("'%s' is a status move" % moveName)
+
+	critOdds = move.critOdds(mymove.crit + attacker.stages[constants.CRIT])
+	if critOdds > 1:
+		critChance = 1 / critOdds
+		rolls = [mymove.calcDmg(attacker, defender, None, prng.ScriptedDraws(roll, False))[0]
+		         for roll in range(16)]
+		critRolls = [mymove.calcDmg(attacker, defender, None, prng.ScriptedDraws(roll, True))[0]
+		             for roll in range(16)]
+	else:
+		# Every hit is a critical hit, and no draw is made for it
+		critChance = 1.0
+		critRolls = [mymove.calcDmg(attacker, defender, None, prng.ScriptedDraws(roll))[0]
+		             for roll in range(16)]
+		rolls = critRolls
+
+	return {"min": min(rolls), "max": max(rolls), "rolls": rolls,
+	        "critMin": min(critRolls), "critMax": max(critRolls), "critRolls": critRolls,
+	        "critChance": critChance, "defenderHP": defender.maxHP}
+
+class DamageService():
+	"""
+	Coalesces damage queries into batches and answers them from an LRU cache where possible
+	"""
+
+	def __init__(self, cacheSize: int = 65536, batchWindow: float = 0.002, maxBatch: int = 256):
+		"""
+		Creates a service caching up to `cacheSize` results. A batch is evaluated once
+		`maxBatch` queries are waiting, or `batchWindow` seconds after its first query arrived
+		"""
+		self.cacheSize = cacheSize
+		self.batchWindow = batchWindow
+		self.maxBatch = maxBatch
+		self._cache = collections.OrderedDict()
+		self._queue = queue.Queue()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.batches = 0
+		self.batched = 0
+		self.latency = stats.QuantileSketch()
+		self._names = {}
+		self._thread = threading.Thread(target=self._run, name="pokesim-damage-batcher", daemon=True)
+		self._thread.start()
+
+	def known(self, kind: str, name: str) -> bool:
+		"""
+		Checks whether there's a data file of the given kind with the given name. The names
+		of each kind are listed once, and listed again only when one isn't found (in case
+		it's been added since)
+		"""
+		names = self._names.get(kind)
+		if names is None or name not in names:
+			names = self._names[kind] = frozenset(utils.listData(kind))
+		return name in names
+
+	def submit(self, query: Query) -> futures.Future:
+		"""
+		Queues a normalized query for the next batch, returning a future for its result
+		"""
+		future = futures.Future()
+		self._queue.put((query, future))
+		return future
+
+	def _run(self):
+		"""
+		The body of the batching thread
+		"""
+		while True:
+			batch = [self._queue.get()]
+			deadline = time.monotonic() + self.batchWindow
+			while len(batch) < self.maxBatch:
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					break
+				try:
+					batch.append(self._queue.get(timeout=remaining))
+				except queue.Empty:
+					break
+			self._evaluate(batch)
+
+	def _evaluate(self, batch: typing.List[typing.Tuple[Query, futures.Future]]):
+		"""
+		Answers a batch of queries, evaluating each distinct uncached query once
+		"""
+		waiting = collections.OrderedDict()
+		for query, future in batch:
+			waiting.setdefault(query, []).append(future)
+
+		with self._lock:
+			self.batches += 1
+			self.batched += len(batch)
+
+		for query, waiters in waiting.items():
+			with self._lock:
+				result = self._cache.get(query)
+				if result is not None:
+					self._cache.move_to_end(query)
+					self.hits += len(waiters)
+				else:
+					self.misses += 1
+					self.hits += len(waiters) - 1
+
+			if result is None:
+				try:
+					result = evaluate(query)
+				except Exception as e: # pylint: disable=broad-except
+					for future in waiters:
+						future.set_exception(e)
+					continue
+				with self._lock:
+					self._cache[query] = result
+					if len(self._cache) > self.cacheSize:
+						self._cache.popitem(last=False)
+
+			for future in waiters:
+				future.set_result(result)
+
+	def recordLatency(self, seconds: float):
+		"""
+		Records how long a request took to answer
+		"""
+		with self._lock:
+			self.latency.push(seconds)
+
+	def report(self) -> typing.Dict[str, typing.Any]:
+		"""
+		Returns the cache hit rate, batching and latency statistics
+		"""
+		with self._lock:
+			lookups = self.hits + self.misses
+			return {"hits": self.hits,
+			        "misses": self.misses,
+			        "hitRate": self.hits / lookups if lookups else None,
+			        "cached": len(self._cache),
+			        "batches": self.batches,
+			        "meanBatchSize": self.batched / self.batches if self.batches else None,
+			        "requests": self.latency.count,
+			        "p50ms": 1000 * self.latency.quantile(0.5) if self.latency.count else None,
+			        "p99ms": 1000 * self.latency.quantile(0.99) if self.latency.count else None}
+
+class DamageRequestHandler(http.server.BaseHTTPRequestHandler):
+	"""
+	Handles requests to the damage service
+	"""
+	server_version = "pokesim-damage"
+
+	def sendJSON(self, status: int, body: typing.Any):
+		"""
+		Sends a JSON response
+		"""
+		data = json.dumps(body).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self): # pylint: disable=invalid-name
+		"""
+		Reports the service's statistics
+		"""
+		if self.path != "/stats":
+			self.sendJSON(404, {"error": "Not found"})
+			return
+		self.sendJSON(200, self.server.service.report())
+
+	def do_POST(self): # pylint: disable=invalid-name
+		"""
+		Answers one query, or a list of them
+		"""
+		start = time.perf_counter()
+		if self.path != "/damage":
+			self.sendJSON(404, {"error": "Not found"})
+			return
+
+		try:
+			body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+			single = not isinstance(body, list)
+			service = self.server.service
+			pending = [service.submit(normalize(query, service.known))
+			           for query in ([body] if single else body)]
+			results = [future.result() for future in pending]
+		except (QueryError, ValueError, TypeError, AttributeError) as e:
+			self.sendJSON(400, {"error": str(e)})
+			return
+		except Exception: # pylint: disable=broad-except
+			self.sendJSON(500, {"error": "Internal error"})
+			return
+
+		self.sendJSON(200, results[0] if single else results)
+		self.server.service.recordLatency(time.perf_counter() - start)
+
+	def log_message(self, *unused_args): # pylint: disable=arguments-differ
+		"""
+		Keeps quiet about every request
+		"""
+
+class DamageServer(http.server.ThreadingHTTPServer):
+	"""
+	An HTTP server for a damage service, handling each connection in its own thread
+	"""
+	daemon_threads = True
+	request_queue_size = 128
+
+	def __init__(self, address: typing.Tuple[str, int], service: DamageService = None):
+		"""
+		Binds the server to `address`
+		"""
+		super().__init__(address, DamageRequestHandler)
+		self.service = service if service is not None else DamageService()
+
+def serve(address: typing.Tuple[str, int]):
+	"""
+	Serves damage queries on `address` until interrupted
+	"""
+	with DamageServer(address) as server:
+		host, port = server.server_address[:2]
+		print("Serving damage queries on http://%s:%d/damage" % (host, port))
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
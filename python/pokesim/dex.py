@@ -0,0 +1,290 @@
+"""
+Defines an in-memory, column-oriented table of species data for answering questions about
+the dex (e.g. "every Grass type with at least 80 base Speed weighing under 10kg") without
+constructing a Pokemon for every species.
+
+Each field is stored as a column. Every numeric column has a sorted index, along with the
+set of rows in each prefix of that order as a bitmask (a Python int with bit `i` set for
+row `i`), so that a range filter is a couple of binary searches and an XOR. Types,
+abilities and the genderless flag have a bitmask per value. Filters combine with AND, and
+sorting (with or without a limit) walks the sort column's index, so most queries take a
+few microseconds.
+"""
+
+import array
+import bisect
+import typing
+from . import poketypes
+from . import species
+from . import utils
+
+# The numeric columns, and their `array` typecodes
+NUMERIC_COLUMNS = (("HP", "H"), ("attack", "H"), ("defense", "H"), ("specialAttack", "H"),
+                   ("specialDefense", "H"), ("speed", "H"), ("total", "H"),
+                   ("height", "d"), ("weight", "d"))
+
+# The names of the base stat columns, in the order of the lines of a species file
+BASE_STATS = ("HP", "attack", "defense", "specialAttack", "specialDefense", "speed")
+
+class Species(typing.NamedTuple):
+	"""
+	One row of the table
+	"""
+	name: str
+	type1: poketypes.Type
+	type2: poketypes.Type
+	genderless: bool
+	height: float
+	weight: float
+	HP: int
+	attack: int
+	defense: int
+	specialAttack: int
+	specialDefense: int
+	speed: int
+	total: int
+	abilities: typing.Tuple[str, ...]
+
+def parseSpecies(name: str, contents: str) -> Species:
+	"""
+	Parses the fields of a species from the contents of its data file
+	"""
+	data = species.parse(contents)
+	return Species(name, data.type1, data.type2, data.genderless, data.height, data.weight,
+	               *data.baseStats, sum(data.baseStats), data.abilities)
+
+class SpeciesTable():
+	"""
+	The columns of every species, and their indexes
+	"""
+
+	def __init__(self, rows: typing.Iterable[Species]):
+		"""
+		Builds the table, and its indexes, from the given rows
+		"""
+		self.rows = tuple(rows)
+		self.names = tuple(row.name for row in self.rows)
+		self.rowNumbers = {name: i for i, name in enumerate(self.names)}
+		self.all = (1 << len(self.rows)) - 1
+
+		self.columns = {}
+		self._sortedValues = {}
+		self._order = {}
+		self._prefixes = {}
+		for column, typecode in NUMERIC_COLUMNS:
+			values = array.array(typecode, (getattr(row, column) for row in self.rows))
+			order = sorted(range(len(values)), key=values.__getitem__)
+			prefixes = [0]
+			for i in order:
+				prefixes.append(prefixes[-1] | (1 << i))
+			self.columns[column] = values
+			self._order[column] = array.array("I", order)
+			self._sortedValues[column] = array.array(typecode, (values[i] for i in order))
+			self._prefixes[column] = prefixes
+
+		self._types = {}
+		self._abilities = {}
+		self.genderless = 0
+		for i, row in enumerate(self.rows):
+			bit = 1 << i
+			for poketype in {row.type1, row.type2} - {poketypes.TYPELESS}:
+				self._types[poketype] = self._types.get(poketype, 0) | bit
+			for ability in row.abilities:
+				self._abilities[ability] = self._abilities.get(ability, 0) | bit
+			if row.genderless:
+				self.genderless |= bit
+
+	@classmethod
+	def load(cls) -> 'SpeciesTable':
+		"""
+		Builds the table from every species' data file
+		"""
+		return cls(parseSpecies(name, utils.readData("pokemon", name))
+		           for name in utils.listData("pokemon"))
+
+	def __len__(self) -> int:
+		"""
+		Returns the number of species in the table
+		"""
+		return len(self.rows)
+
+	def range(self, column: str, low: float = None, high: float = None,
+	          inclusive: typing.Tuple[bool, bool] = (True, True)) -> int:
+		"""
+		Returns the bitmask of the rows whose value in a numeric column is between `low`
+		and `high` (either of which may be None, for no bound), including either end as
+		given by `inclusive`
+		"""
+		try:
+			values = self._sortedValues[column]
+		except KeyError:
+			raise ValueError("Not a numeric column: '%s'" % column)
+		prefixes = self._prefixes[column]
+		if low is None:
+			start = 0
+		else:
+			start = (bisect.bisect_left if inclusive[0] else bisect.bisect_right)(values, low)
+		if high is None:
+			stop = len(values)
+		else:
+			stop = (bisect.bisect_right if inclusive[1] else bisect.bisect_left)(values, high)
+		return prefixes[stop] ^ prefixes[start] if stop > start else 0
+
+	def ofType(self, poketype: typing.Union[str, poketypes.Type]) -> int:
+		"""
+		Returns the bitmask of the rows of the given type (by name, or as a Type)
+		"""
+		if isinstance(poketype, str):
+			try:
+				poketype = poketypes.Type[poketype]
+			except KeyError:
+				raise ValueError("Unknown type: '%s'" % poketype)
+		return self._types.get(poketype, 0)
+
+	def withAbility(self, ability: str) -> int:
+		"""
+		Returns the bitmask of the rows that can have the given ability
+		"""
+		return self._abilities.get(ability, 0)
+
+	def query(self) -> 'Query':
+		"""
+		Starts a query over every species in the table
+		"""
+		return Query(self)
+
+# The ways a numeric column can be compared to a value in `Query.where`, as the arguments
+# to pass to `SpeciesTable.range`
+COMPARISONS = {"<":  lambda value: (None, value, (True, False)),
+               "<=": lambda value: (None, value, (True, True)),
+               "==": lambda value: (value, value, (True, True)),
+               ">=": lambda value: (value, None, (True, True)),
+               ">":  lambda value: (value, None, (False, True))}
+
+class Query():
+	"""
+	A query over a SpeciesTable, built up by chaining filters, then sorted and limited
+	"""
+
+	def __init__(self, table: SpeciesTable):
+		"""
+		Starts a query matching every row of `table`
+		"""
+		self.table = table
+		self.mask = table.all
+		self.sortColumn = None
+		self.descending = False
+		self.count = None
+
+	def where(self, column: str, comparison: str, value: float) -> 'Query':
+		"""
+		Keeps the rows whose value in a numeric column compares to `value` as given (one of
+		<, <=, ==, >= or >)
+		"""
+		try:
+			low, high, inclusive = COMPARISONS[comparison](value)
+		except KeyError:
+			raise ValueError("Unknown comparison: '%s'" % comparison)
+		self.mask &= self.table.range(column, low, high, inclusive)
+		return self
+
+	def between(self, column: str, low: float, high: float) -> 'Query':
+		"""
+		Keeps the rows whose value in a numeric column is between `low` and `high`, inclusive
+		"""
+		self.mask &= self.table.range(column, low, high)
+		return self
+
+	def ofType(self, *types: typing.Union[str, poketypes.Type]) -> 'Query':
+		"""
+		Keeps the rows of any of the given types
+		"""
+		mask = 0
+		for poketype in types:
+			mask |= self.table.ofType(poketype)
+		self.mask &= mask
+		return self
+
+	def withAbility(self, *abilities: str) -> 'Query':
+		"""
+		Keeps the rows that can have any of the given abilities
+		"""
+		mask = 0
+		for ability in abilities:
+			mask |= self.table.withAbility(ability)
+		self.mask &= mask
+		return self
+
+	def genderless(self, genderless: bool = True) -> 'Query':
+		"""
+		Keeps the rows that are (or aren't) genderless
+		"""
+		self.mask &= self.table.genderless if genderless else self.table.all ^ self.table.genderless
+		return self
+
+	def orderBy(self, column: str, descending: bool = False) -> 'Query':
+		"""
+		Sorts the results by a numeric column
+		"""
+		if column not in self.table.columns:
+			raise ValueError("Not a numeric column: '%s'" % column)
+		self.sortColumn = column
+		self.descending = descending
+		return self
+
+	def limit(self, count: int) -> 'Query':
+		"""
+		Keeps only the first `count` results
+		"""
+		self.count = count
+		return self
+
+	def top(self, column: str, count: int) -> 'Query':
+		"""
+		Keeps the `count` results with the highest values in a numeric column
+		"""
+		return self.orderBy(column, True).limit(count)
+
+	def rowNumbers(self) -> typing.List[int]:
+		"""
+		Returns the numbers of the matching rows, in order
+		"""
+		mask = self.mask
+		count = self.count if self.count is not None else len(self.table)
+		if count <= 0 or not mask:
+			return []
+
+		if self.sortColumn is None:
+			rows = []
+			while mask and len(rows) < count:
+				low = mask & -mask
+				rows.append(low.bit_length() - 1)
+				mask ^= low
+			return rows
+
+		order = self.table._order[self.sortColumn] # pylint: disable=protected-access
+		rows = []
+		for i in (reversed(order) if self.descending else order):
+			if mask >> i & 1:
+				rows.append(i)
+				if len(rows) >= count:
+					break
+		return rows
+
+	def rows(self) -> typing.List[Species]:
+		"""
+		Returns the matching rows, in order
+		"""
+		return [self.table.rows[i] for i in self.rowNumbers()]
+
+	def names(self) -> typing.List[str]:
+		"""
+		Returns the names of the matching species, in order
+		"""
+		return [self.table.names[i] for i in self.rowNumbers()]
+
+	def __len__(self) -> int:
+		"""
+		Returns the number of matching rows, ignoring any limit
+		"""
+		return bin(self.mask).count("1")
@@ -0,0 +1,212 @@
+"""
+Defines a vectorized environment for training move-selection agents, in the style of the
+Gym/Gymnasium vector API: `reset(seed)` starts a batch of battles and `step(actions)` plays
+a turn of every one of them, returning the observations, rewards and done flags as arrays.
+
+The agent plays side 0 of each battle and the opponent (side 1) chooses its moves with a
+policy, at random by default. Battles are played by the ordinary engine (`battle.Battle`),
+so the mechanics are exactly those of `battle.simulate`. A finished battle is reset
+automatically in the same step, so the observation returned for it is the first of its
+next episode; its last observation is returned in the step's info instead.
+
+Requires NumPy, which is not otherwise a dependency of this package.
+"""
+
+import typing
+from . import battle
+from . import constants
+from . import move
+from . import poketypes
+from . import prng
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# The number of move slots described in an observation; Pokemon with fewer moves have the
+# remaining slots zeroed out
+MOVE_SLOTS = 4
+
+# The stages in an observation, in order
+STAGES = (constants.ATTACK, constants.DEFENSE, constants.SPECIAL_ATTACK,
+          constants.SPECIAL_DEFENSE, constants.SPEED, constants.CRIT, constants.ACCURACY,
+          constants.EVASIVENESS)
+
+# Move powers are divided by this in observations, to keep the values around [0, 1]
+POWER_SCALE = 250.0
+
+# The rewards for the agent winning and losing a battle. A draw (or any turn that doesn't
+# end the battle) is worth nothing
+WIN_REWARD = 1.0
+LOSS_REWARD = -1.0
+
+# The layout of a single move slot: PP left (as a fraction), power, accuracy (as
+# fractions), a one-hot move type, and the move's types
+MOVE_FEATURES = 3 + len(move.MoveType) + len(poketypes.Type)
+
+# The layout of a single Pokemon: HP (as a fraction), its stages (as fractions of 6), a
+# one-hot status, its types, and then its moves
+POKEMON_FEATURES = 1 + len(STAGES) + len(constants.Status) + len(poketypes.Type) + \
+                   MOVE_SLOTS * MOVE_FEATURES
+
+# An observation describes the agent's Pokemon, then the opponent's
+OBSERVATION_SIZE = 2 * POKEMON_FEATURES
+
+def describeMove(mymove: move.Move, out: 'numpy.ndarray'):
+	"""
+	Writes the features of a move into `out`
+	"""
+	out[0] = mymove.PP / mymove.maxPP if mymove.maxPP else 0.0
+	if mymove.moveType != move.STATUS:
+		out[1] = mymove.power / POWER_SCALE
+	out[2] = mymove.accuracy / 100.0
+	out[3 + mymove.moveType] = 1.0
+	offset = 3 + len(move.MoveType)
+	for movetype in (mymove.type1, mymove.type2):
+		if movetype != poketypes.TYPELESS:
+			out[offset + movetype.value] = 1.0
+
+def describePokemon(poke: 'pokemon.Pokemon', out: 'numpy.ndarray'):
+	"""
+	Writes the features of a Pokemon, including its moves, into `out`
+	"""
+	out[:] = 0.0
+	out[0] = poke.HP / poke.maxHP
+	offset = 1
+	for i, stat in enumerate(STAGES):
+		out[offset + i] = poke.stages[stat] / 6.0
+	offset += len(STAGES)
+	out[offset + poke.status] = 1.0
+	offset += len(constants.Status)
+	for poketype in (poke.type1, poke.type2):
+		if poketype != poketypes.TYPELESS:
+			out[offset + poketype.value] = 1.0
+	offset += len(poketypes.Type)
+	for mymove in poke.moves[:MOVE_SLOTS]:
+		describeMove(mymove, out[offset:offset + MOVE_FEATURES])
+		offset += MOVE_FEATURES
+
+class VectorEnv():
+	"""
+	`count` battles between the same two sides, stepped together
+	"""
+
+	def __init__(self, sides: typing.Tuple[battle.Side, battle.Side], count: int,
+	             opponentPolicy: typing.Callable[[battle.Battle, int], int] = None,
+	             maxTurns: int = 1000):
+		"""
+		Sets up `count` battles between the given sides, with the opponent choosing its
+		moves using `opponentPolicy` (a callable taking the battle and the side number, and
+		returning a move index), or at random if no policy is given. A battle is
+		truncated as a draw after `maxTurns` turns. Raises a RuntimeError if NumPy is not
+		installed
+		"""
+		if numpy is None:
+			raise RuntimeError("The training environment requires NumPy "
+			                   "(install it with the 'env' extra: pip install pokesim[env])")
+
+		self.sides = tuple(sides)
+		self.count = count
+		self.opponentPolicy = opponentPolicy if opponentPolicy is not None else battle.Battle.randomChoice
+		self.maxTurns = maxTurns
+		self.observationSize = OBSERVATION_SIZE
+		self.actionCount = MOVE_SLOTS
+
+		self.seed = None
+		self.episodes = 0
+		self.battles = [None] * count
+
+		# Every battle reuses the same two Pokemon from one episode to the next, put back
+		# into their starting state, so that nothing is read from disk after the first reset
+		self._pokemon = [(sides[0].build(), sides[1].build(True)) for _ in range(count)]
+		self._fresh = battle.Battle(*self._pokemon[0], prng.BattleRNG(0), maxTurns).getstate()[:-2]
+
+		self._observations = numpy.zeros((count, OBSERVATION_SIZE), dtype=numpy.float32)
+
+	def _start(self, slot: int):
+		"""
+		Starts the next episode in the given slot. The `n`th episode since the last reset is
+		seeded as the `n`th battle of a run seeded with the reset's seed, so a sequence of
+		episodes can be replayed exactly from the seed and the actions taken
+		"""
+		rng = prng.BattleRNG.forBattle(self.seed, self.episodes)
+		self.episodes += 1
+		current = battle.Battle(*self._pokemon[slot], rng, self.maxTurns)
+		current.setstate(self._fresh + (rng.getstate(), current.choiceRNG.getstate()))
+		self.battles[slot] = current
+
+	def _observe(self, slot: int, out: 'numpy.ndarray'):
+		"""
+		Writes the observation of the battle in the given slot into `out`
+		"""
+		agent, opponent = self.battles[slot].pokemon
+		describePokemon(agent, out[:POKEMON_FEATURES])
+		describePokemon(opponent, out[POKEMON_FEATURES:])
+
+	def reset(self, seed: int = None) -> 'numpy.ndarray':
+		"""
+		Starts a fresh episode in every slot, seeded from `seed` (or from the OS, if no seed
+		is given). Returns the observations, as a (count, observationSize) array
+		"""
+		self.seed = seed if seed is not None else prng.BattleRNG().seed
+		self.episodes = 0
+		for slot in range(self.count):
+			self._start(slot)
+			self._observe(slot, self._observations[slot])
+		return self._observations.copy()
+
+	def actionMasks(self) -> 'numpy.ndarray':
+		"""
+		Returns which actions are legal in each battle right now, as a (count, actionCount)
+		array of booleans. A move is legal if it has PP left
+		"""
+		masks = numpy.zeros((self.count, MOVE_SLOTS), dtype=bool)
+		for slot, current in enumerate(self.battles):
+			masks[slot, current.usableMoves(0)] = True
+		return masks
+
+	def step(self, actions: typing.Sequence[int]
+	        ) -> typing.Tuple['numpy.ndarray', 'numpy.ndarray', 'numpy.ndarray', typing.Dict]:
+		"""
+		Plays a turn of every battle, with the agent using the move with the given index in
+		each. An illegal action (see `actionMasks`) is replaced with a random legal one.
+
+		Returns the observations, the rewards, whether each battle finished, and an info
+		dict holding the winner of each battle (battle.DRAW where it's still going) and a
+		dict of the last observations of the battles that finished, by slot
+		"""
+		if len(actions) != self.count:
+			raise ValueError("Expected %d actions, got %d" % (self.count, len(actions)))
+
+		rewards = numpy.zeros(self.count, dtype=numpy.float32)
+		dones = numpy.zeros(self.count, dtype=bool)
+		winners = numpy.full(self.count, battle.DRAW, dtype=numpy.int8)
+		finalObservations = {}
+
+		for slot, action in enumerate(actions):
+			current = self.battles[slot]
+			action = int(action)
+			if not 0 <= action < len(current.pokemon[0].moves) or \
+			   current.pokemon[0].moves[action].PP <= 0:
+				action = current.randomChoice(0)
+			current.turn(action, self.opponentPolicy(current, 1))
+			if not current.over and (not current.usableMoves(0) or not current.usableMoves(1)):
+				current.over = True
+
+			if current.over:
+				dones[slot] = True
+				winners[slot] = current.winner
+				if current.winner == 0:
+					rewards[slot] = WIN_REWARD
+				elif current.winner == 1:
+					rewards[slot] = LOSS_REWARD
+				final = numpy.empty(OBSERVATION_SIZE, dtype=numpy.float32)
+				self._observe(slot, final)
+				finalObservations[slot] = final
+				self._start(slot)
+
+			self._observe(slot, self._observations[slot])
+
+		return (self._observations.copy(), rewards, dones,
+		        {"winners": winners, "finalObservations": finalObservations})
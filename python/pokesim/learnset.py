@@ -0,0 +1,100 @@
+"""
+Defines the learnsets of pokemon species, and a reverse index from each move to the species
+(and levels) that learn it (see `species.reverseIndex` for the one over every species' data)
+"""
+
+import bisect
+import typing
+
+class Learnset():
+	"""
+	The moves a species can learn, stored as parallel arrays sorted by the level at which
+	each move is learned. Moves learned at level 0 (i.e. by TM, tutor etc.) can be learned
+	at any level
+	"""
+	__slots__ = ("levels", "moves")
+
+	def __init__(self, entries: typing.Iterable[typing.Tuple[str, int]]):
+		"""
+		Builds a learnset from (move name, required level) pairs
+		"""
+		ordered = sorted(set(entries), key=lambda entry: (entry[1], entry[0]))
+		self.levels = [level for _, level in ordered]
+		self.moves = [name for name, _ in ordered]
+
+	def legalAt(self, level: int) -> typing.List[str]:
+		"""
+		Returns the names of the moves that can be known at the given level
+		"""
+		return self.moves[:bisect.bisect_right(self.levels, level)]
+
+	def __iter__(self) -> typing.Iterator[typing.Tuple[str, int]]:
+		"""
+		Iterates over (move name, required level) pairs, in order of level
+		"""
+		return zip(self.moves, self.levels)
+
+	def __len__(self) -> int:
+		"""
+		Returns the number of (move, level) entries in the learnset
+		"""
+		return len(self.moves)
+
+	def __contains__(self, entry: typing.Tuple[str, int]) -> bool:
+		"""
+		Checks whether a (move name, required level) pair is in the learnset
+		"""
+		name, level = entry
+		start = bisect.bisect_left(self.levels, level)
+		stop = bisect.bisect_right(self.levels, level)
+		return name in self.moves[start:stop]
+
+def parse(lines: typing.Iterable[str]) -> Learnset:
+	"""
+	Parses a learnset from the lines of a species' data file that follow its abilities
+	"""
+	entries = []
+	for line in lines:
+		if not line:
+			# handles blank lines at the end of POSIX-compliant text files
+			break
+		line = line.split(" ")
+		requiredLevel = int(line.pop())
+		entries.append((" ".join(line), requiredLevel))
+	return Learnset(entries)
+
+class ReverseIndex():
+	"""
+	Maps each move to the species that learn it, sorted by the level they learn it at
+	"""
+
+	def __init__(self, learnsets: typing.Dict[str, Learnset]):
+		"""
+		Builds the index from a mapping of species names to their learnsets
+		"""
+		entries = {}
+		for species, speciesMoves in learnsets.items():
+			for name, level in speciesMoves:
+				entries.setdefault(name, []).append((level, species))
+
+		self._levels = {}
+		self._species = {}
+		for name, learners in entries.items():
+			learners.sort()
+			self._levels[name] = [level for level, _ in learners]
+			self._species[name] = [species for _, species in learners]
+
+	def learners(self, move: str, level: int = None) -> typing.List[typing.Tuple[str, int]]:
+		"""
+		Returns the (species, level) pairs for every species that learns `move`, only
+		including those that learn it by `level` if given
+		"""
+		levels = self._levels.get(move, [])
+		stop = len(levels) if level is None else bisect.bisect_right(levels, level)
+		return list(zip(self._species[move][:stop], levels[:stop])) if stop else []
+
+	def moves(self) -> typing.Set[str]:
+		"""
+		Returns the names of every move learned by any species
+		"""
+		return set(self._levels)
@@ -0,0 +1,264 @@
+"""
+Defines an optional engine that plays out many battles of the same matchup at once, holding
+their state as parallel NumPy arrays and advancing all of them by a turn in each step.
+The formulas are the same as those of the scalar engine (`Move.calcDmg`,
+`Pokemon.useMove` and `utils.decideOrder`), but random draws come from NumPy's generator,
+so individual battles don't reproduce those of `battle.simulate`.
+
+Requires NumPy, which is not otherwise a dependency of this package.
+"""
+
+import typing
+from . import battle
+from . import constants
+from . import move
+from . import poketypes
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+class LockstepBattles():
+	"""
+	`count` battles between the same two sides, stored as a struct of arrays
+	"""
+
+	def __init__(self, sides: typing.Tuple[battle.Side, battle.Side], count: int,
+	             seed: int = None, maxTurns: int = 1000):
+		"""
+		Sets up `count` identical battles between the given sides. Raises a RuntimeError if
+		NumPy is not installed
+		"""
+		if numpy is None:
+			raise RuntimeError("The lockstep engine requires NumPy "
+			                   "(install it with the 'lockstep' extra: pip install pokesim[lockstep])")
+
+		self.count = count
+		self.maxTurns = maxTurns
+		self.rng = numpy.random.default_rng(seed)
+
+		# Integer stage multipliers, indexed by stage + 6
+		self.statNumerators, self.statDenominators = numpy.array(constants.STAT_STAGES).T
+		self.accNumerators, self.accDenominators = numpy.array(constants.ACCURACY_STAGES).T
+
+		pokes = (sides[0].build(), sides[1].build(True))
+		self.pokemon = pokes
+
+		# Per-side constants
+		self.level = numpy.array([p.level for p in pokes], dtype=numpy.int64)
+		self.attack = numpy.array([p.attack for p in pokes], dtype=numpy.int64)
+		self.defense = numpy.array([p.defense for p in pokes], dtype=numpy.int64)
+		self.specialAttack = numpy.array([p.specialAttack for p in pokes], dtype=numpy.int64)
+		self.specialDefense = numpy.array([p.specialDefense for p in pokes], dtype=numpy.int64)
+		self.speed = numpy.array([p.speed for p in pokes], dtype=numpy.int64)
+
+		# Per-move constants, indexed by [side, move]
+		shape = (2, len(pokes[0].moves))
+		self.power = numpy.zeros(shape, dtype=numpy.int64)
+		self.accuracy = numpy.zeros(shape, dtype=numpy.int64)
+		self.priority = numpy.zeros(shape, dtype=numpy.int64)
+		self.critRatio = numpy.zeros(shape, dtype=numpy.int64)
+		self.status = numpy.zeros(shape, dtype=bool)
+		self.physical = numpy.zeros(shape, dtype=bool)
+		self.stab = numpy.zeros(shape, dtype=numpy.int64)
+		self.typeNumerator = numpy.ones(shape, dtype=numpy.int64)
+		self.typeDenominator = numpy.ones(shape, dtype=numpy.int64)
+		self.selfTarget = numpy.zeros(shape, dtype=bool)
+		self.stageChanges = numpy.zeros(shape + (len(constants.Stats),), dtype=numpy.int64)
+
+		for side, poke in enumerate(pokes):
+			other = pokes[1 - side]
+			for i, mymove in enumerate(poke.moves):
+				self.accuracy[side, i] = mymove.accuracy
+				self.priority[side, i] = mymove.priority
+				if mymove.moveType == move.STATUS:
+					self.status[side, i] = True
+					self.selfTarget[side, i] = mymove.target
+					for stat, amt in zip(mymove.affectedStats, mymove.stageChanges):
+						self.stageChanges[side, i, stat] = amt
+					continue
+
+				self.power[side, i] = mymove.power
+				self.critRatio[side, i] = mymove.crit
+				self.physical[side, i] = mymove.moveType == move.PHYSICAL
+				typeMod = float(poketypes.calcTypeEffectiveness(poke, other, mymove))
+				self.typeNumerator[side, i], self.typeDenominator[side, i] = typeMod.as_integer_ratio()
+
+				# Same conditions, in the same order, as in Move.calcDmg
+				if mymove.type1 != poketypes.TYPELESS:
+					if poke.type1 == mymove.type1 or poke.type2 == mymove.type2:
+						self.stab[side, i] += 1
+				if mymove.type2 != poketypes.TYPELESS:
+					if poke.type1 == mymove.type2 or poke.type2 == mymove.type2:
+						self.stab[side, i] += 1
+
+		# Per-battle state
+		self.HP = numpy.tile(numpy.array([p.HP for p in pokes], dtype=numpy.int64), (count, 1))
+		self.PP = numpy.tile(numpy.array([[m.PP for m in p.moves] for p in pokes],
+		                                 dtype=numpy.int64), (count, 1, 1))
+		self.stages = numpy.zeros((count, 2, len(constants.Stats)), dtype=numpy.int64)
+		self.statuses = numpy.full((count, 2), int(constants.NON), dtype=numpy.int64)
+		self.active = numpy.ones(count, dtype=bool)
+		self.winner = numpy.full(count, battle.DRAW, dtype=numpy.int64)
+		self.turns = numpy.zeros(count, dtype=numpy.int64)
+		self.damage = numpy.zeros((count, 2), dtype=numpy.int64)
+		self.crits = numpy.zeros((count, 2), dtype=numpy.int64)
+
+	def randomChoices(self, idx: 'numpy.ndarray') -> 'numpy.ndarray':
+		"""
+		Picks a usable move at random for both sides of each of the battles in `idx`.
+		Returns an (n, 2) array of move indices, or -1 where a side has no usable moves
+		"""
+		usable = self.PP[idx] > 0
+		counts = usable.sum(axis=2)
+		picks = (self.rng.random(counts.shape) * counts).astype(numpy.int64)
+		choices = (numpy.cumsum(usable, axis=2) > picks[..., None]).argmax(axis=2)
+		return numpy.where(counts > 0, choices, -1)
+
+	def effectiveSpeed(self, idx: 'numpy.ndarray') -> 'numpy.ndarray':
+		"""
+		Calculates the effective speed of both sides of the battles in `idx`, as in
+		`utils.decideOrder`
+		"""
+		stage = self.stages[idx, :, constants.SPEED] + 6
+		effsp = self.speed * self.statNumerators[stage] // self.statDenominators[stage]
+		paralyzed = self.statuses[idx] == constants.PAR
+		effsp[paralyzed] //= 2
+		return effsp
+
+	def decideOrder(self, idx: 'numpy.ndarray', choices: 'numpy.ndarray') -> 'numpy.ndarray':
+		"""
+		Decides which side moves first in each of the battles in `idx`
+		"""
+		sides = numpy.arange(2)
+		priority = self.priority[sides, choices]
+		effsp = self.effectiveSpeed(idx)
+
+		# Speed ties are broken at random, just like in `utils.decideOrder`
+		first = (effsp[:, 1] > effsp[:, 0]).astype(numpy.int64)
+		ties = effsp[:, 0] == effsp[:, 1]
+		first[ties] = self.rng.random(numpy.count_nonzero(ties)) < 0.5
+		first[priority[:, 0] > priority[:, 1]] = 0
+		first[priority[:, 0] < priority[:, 1]] = 1
+		return first
+
+	def calcDmg(self, idx: 'numpy.ndarray', attacker: 'numpy.ndarray',
+	            choice: 'numpy.ndarray') -> typing.Tuple['numpy.ndarray', 'numpy.ndarray']:
+		"""
+		Calculates the damage done by the `attacker` side of each of the battles in `idx`
+		with their chosen move, as in `Move.calcDmg`. Returns the damage, and whether each
+		hit was critical
+		"""
+		defender = 1 - attacker
+		n = len(idx)
+
+		# The chance (one in N) of a critical hit, as in `move.critOdds`
+		effectiveStage = self.critRatio[attacker, choice] + self.stages[idx, attacker, constants.CRIT]
+		chances = numpy.left_shift(1, numpy.maximum(4 - effectiveStage, 0))
+		crit = (self.rng.random(n) * chances).astype(numpy.int64) == 0
+
+		physical = self.physical[attacker, choice]
+		effat = numpy.where(physical, self.attack[attacker], self.specialAttack[attacker])
+		effdef = numpy.where(physical, self.defense[attacker], self.specialDefense[attacker])
+		atstage = numpy.where(physical,
+		                      self.stages[idx, attacker, constants.ATTACK],
+		                      self.stages[idx, attacker, constants.SPECIAL_ATTACK])
+		defstage = numpy.where(physical,
+		                       self.stages[idx, defender, constants.DEFENSE],
+		                       self.stages[idx, defender, constants.SPECIAL_DEFENSE])
+
+		# Critical hits ignore the attacker's drops and the defender's boosts
+		atstage = numpy.where(crit, numpy.maximum(atstage, 0), atstage) + 6
+		defstage = numpy.where(crit, numpy.minimum(defstage, 0), defstage) + 6
+		effat = effat * self.statNumerators[atstage] // self.statDenominators[atstage]
+		effdef = effdef * self.statNumerators[defstage] // self.statDenominators[defstage]
+
+		dmg = (2 * self.level[attacker] // 5 + 2) * self.power[attacker, choice]
+		dmg = dmg * effat // effdef // 50 + 2
+
+		dmg = numpy.where(crit, move.applyModifier(dmg, move.CRIT_MODIFIER), dmg)
+		dmg = dmg * (85 + (self.rng.random(n) * 16).astype(numpy.int64)) // 100
+		stab = self.stab[attacker, choice]
+		dmg = numpy.where(stab > 0, move.applyModifier(dmg, move.STAB_MODIFIER), dmg)
+		dmg = numpy.where(stab > 1, move.applyModifier(dmg, move.STAB_MODIFIER), dmg)
+		typeNumerator = self.typeNumerator[attacker, choice]
+		dmg = dmg * typeNumerator // self.typeDenominator[attacker, choice]
+		burned = (self.statuses[idx, attacker] == constants.BRN) & physical
+		dmg = numpy.where(burned, move.applyModifier(dmg, move.BURN_MODIFIER), dmg)
+		dmg = numpy.where((dmg == 0) & (typeNumerator > 0), 1, dmg)
+		return dmg, crit
+
+	def useMove(self, idx: 'numpy.ndarray', attacker: 'numpy.ndarray', choice: 'numpy.ndarray'):
+		"""
+		Handles the `attacker` side of each of the battles in `idx` using their chosen move,
+		as in `Pokemon.useMove`
+		"""
+		defender = 1 - attacker
+		self.PP[idx, attacker, choice] -= 1
+		hitChance = (self.rng.random(len(idx)) * 101).astype(numpy.int64)
+
+		accstage = self.stages[idx, attacker, constants.ACCURACY] + 6
+		evstage = self.stages[idx, defender, constants.EVASIVENESS] + 6
+		threshold = (self.accuracy[attacker, choice] * self.accNumerators[accstage] *
+		             self.accDenominators[evstage] //
+		             (self.accDenominators[accstage] * self.accNumerators[evstage]))
+
+		hit = hitChance <= threshold
+		status = self.status[attacker, choice]
+
+		damaging = hit & ~status
+		if damaging.any():
+			didx, datt, dchoice = idx[damaging], attacker[damaging], choice[damaging]
+			dmg, crit = self.calcDmg(didx, datt, dchoice)
+			dmg = numpy.minimum(dmg, self.HP[didx, 1 - datt])
+			self.HP[didx, 1 - datt] -= dmg
+			self.damage[didx, datt] += dmg
+			self.crits[didx, datt] += crit
+
+		boosting = hit & status
+		if boosting.any():
+			bidx, batt, bchoice = idx[boosting], attacker[boosting], choice[boosting]
+			target = numpy.where(self.selfTarget[batt, bchoice], batt, 1 - batt)
+			self.stages[bidx, target] = numpy.clip(self.stages[bidx, target] +
+			                                       self.stageChanges[batt, bchoice], -6, 6)
+
+	def step(self) -> int:
+		"""
+		Advances every unfinished battle by one turn, with both sides choosing moves at
+		random. Returns the number of battles still going
+		"""
+		idx = numpy.flatnonzero(self.active)
+		if not len(idx):
+			return 0
+
+		choices = self.randomChoices(idx)
+		stuck = (choices < 0).any(axis=1)
+		self.active[idx[stuck]] = False
+		idx, choices = idx[~stuck], choices[~stuck]
+
+		first = self.decideOrder(idx, choices)
+		acting, actingChoices, attacker = idx, choices, first
+		for _ in range(2):
+			rows = numpy.arange(len(acting))
+			self.useMove(acting, attacker, actingChoices[rows, attacker])
+
+			fainted = self.HP[acting, 1 - attacker] == 0
+			self.winner[acting[fainted]] = attacker[fainted]
+			self.active[acting[fainted]] = False
+
+			going = ~fainted
+			acting, actingChoices, attacker = acting[going], actingChoices[going], 1 - attacker[going]
+
+		self.turns[idx] += 1
+		self.active[idx[self.turns[idx] >= self.maxTurns]] = False
+		return int(numpy.count_nonzero(self.active))
+
+	def run(self) -> 'numpy.ndarray':
+		"""
+		Steps until every battle is over. Returns the winner of each battle (DRAW for
+		battles that ended without a Pokemon fainting)
+		"""
+		while self.step():
+			pass
+		return self.winner
@@ -0,0 +1,125 @@
+"""
+Defines a persistent, on-disk cache of matchup results. Each result is keyed by a hash of
+the contents of everything that went into it - both species' data files, the data files of
+every move in both movesets, the type chart and the version of the engine's rules - along with how the
+matchup was set up and run, so editing a data file only invalidates the matchups that
+actually use it.
+
+Results are stored in an SQLite database, whose transactions make each write atomic and
+let concurrent runs share the same cache.
+"""
+
+import hashlib
+import itertools
+import pickle
+import sqlite3
+import typing
+from . import battle
+from . import poketypes
+from . import stats
+from . import utils
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS matchups (
+	key TEXT PRIMARY KEY,
+	species0 TEXT NOT NULL,
+	species1 TEXT NOT NULL,
+	battles INTEGER NOT NULL,
+	aggregate BLOB NOT NULL
+)"""
+
+def matchupKey(sides: typing.Tuple[battle.Side, battle.Side], battles: int, masterSeed: int,
+               maxTurns: int = 1000) -> str:
+	"""
+	Returns the cache key of a matchup: a hash of everything its results depend on
+	"""
+	digest = hashlib.sha256()
+	digest.update(b"engine %d\n" % battle.ENGINE_VERSION)
+	digest.update(repr(poketypes.typechart).encode())
+	digest.update(b"\nbattles %d seed %d maxTurns %d\n" % (battles, masterSeed, maxTurns))
+	for side in sides:
+		digest.update(repr(tuple(side)).encode())
+		digest.update(utils.readData("pokemon", side.species).encode())
+		for name in side.moves:
+			digest.update(utils.readData("moves", name).encode())
+	return digest.hexdigest()
+
+class MatchupCache():
+	"""
+	A cache of matchup results, stored in an SQLite database at `path`
+	"""
+
+	def __init__(self, path: str, timeout: float = 60.0):
+		"""
+		Opens (creating if necessary) the cache at `path`. Writers wait up to `timeout`
+		seconds for other runs to finish writing
+		"""
+		self.path = path
+		self.connection = sqlite3.connect(path, timeout=timeout)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		with self.connection:
+			self.connection.execute(SCHEMA)
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key: str) -> typing.Optional[stats.BattleAggregate]:
+		"""
+		Returns the cached results for the given key, or None if there aren't any
+		"""
+		row = self.connection.execute("SELECT aggregate FROM matchups WHERE key = ?", (key,)).fetchone()
+		if row is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return pickle.loads(row[0])
+
+	def put(self, key: str, sides: typing.Tuple[battle.Side, battle.Side],
+	        aggregate: stats.BattleAggregate):
+		"""
+		Stores the results of a matchup, atomically
+		"""
+		with self.connection:
+			self.connection.execute("INSERT OR REPLACE INTO matchups VALUES (?, ?, ?, ?, ?)",
+			                        (key, sides[0].species, sides[1].species, aggregate.battles,
+			                         pickle.dumps(aggregate)))
+
+	def matchup(self, sides: typing.Tuple[battle.Side, battle.Side], battles: int,
+	            masterSeed: int, maxTurns: int = 1000,
+	            run: typing.Callable[[typing.Tuple[battle.Side, battle.Side], int, int, int],
+	                                 stats.BattleAggregate] = None) -> stats.BattleAggregate:
+		"""
+		Returns the results of `battles` battles between the given sides, only playing them
+		out if they aren't already cached. `run` may be given to play them out some other way
+		than one after another in this process (e.g. using a WorkerPool)
+		"""
+		key = matchupKey(sides, battles, masterSeed, maxTurns)
+		aggregate = self.get(key)
+		if aggregate is None:
+			aggregate = (run if run is not None else playMatchup)(sides, battles, masterSeed, maxTurns)
+			self.put(key, sides, aggregate)
+		return aggregate
+
+	def matrix(self, sides: typing.Sequence[battle.Side], battles: int, masterSeed: int,
+	           maxTurns: int = 1000, run: typing.Callable = None
+	          ) -> typing.Dict[typing.Tuple[int, int], stats.BattleAggregate]:
+		"""
+		Returns the results of every pairing of the given sides (including each side against
+		itself), keyed by the indices of both sides in `sides`
+		"""
+		return {(i, j): self.matchup((sides[i], sides[j]), battles, masterSeed, maxTurns, run)
+		        for i, j in itertools.product(range(len(sides)), repeat=2)}
+
+	def close(self):
+		"""
+		Closes the cache
+		"""
+		self.connection.close()
+
+def playMatchup(sides: typing.Tuple[battle.Side, battle.Side], battles: int, masterSeed: int,
+                maxTurns: int = 1000) -> stats.BattleAggregate:
+	"""
+	Plays out `battles` battles between the given sides, one after another
+	"""
+	aggregate = stats.BattleAggregate(maxTurns)
+	for index in range(battles):
+		aggregate.push(battle.simulate(sides, masterSeed, index, maxTurns=maxTurns))
+	return aggregate
@@ -0,0 +1,116 @@
+"""
+Defines a memory profiler for long simulation runs, which periodically snapshots the heap
+with `tracemalloc` to find where memory is being allocated and how fast it's growing
+"""
+
+import linecache
+import tracemalloc
+import typing
+
+# Allocations made by these files are bookkeeping, not a part of the run being profiled
+IGNORED = (tracemalloc.__file__, linecache.__file__, "<frozen importlib._bootstrap>",
+           "<frozen importlib._bootstrap_external>", "<unknown>")
+
+class MemoryProfiler():
+	"""
+	Snapshots the heap when profiling starts, every `interval` battles and when it stops.
+	Growth is measured from the first snapshot, so allocations made before the run (imports
+	etc.) don't count against it, but caches filled by the first battles do; the longer the
+	run, the less they weigh
+	"""
+
+	def __init__(self, interval: int = 100, threshold: float = 1024.0, top: int = 10,
+	             frames: int = 1):
+		"""
+		Creates a profiler that snapshots every `interval` battles, and which considers the
+		run to be leaking if the heap grows by more than `threshold` bytes per battle.
+		Reports list the `top` allocation sites, each identified by `frames` stack frames.
+		Raises a ValueError if `interval` is less than 1
+		"""
+		if interval < 1:
+			raise ValueError("The snapshot interval must be at least 1 battle, not %d" % interval)
+		self.interval = interval
+		self.threshold = threshold
+		self.top = top
+		self.frames = frames
+		self.battles = 0
+		self.previous = None
+		self.previousBattles = 0
+		self.firstTotal = 0
+		self.firstBattles = 0
+		self.lastTotal = 0
+		self.lastBattles = 0
+
+	def _snapshot(self) -> tracemalloc.Snapshot:
+		"""
+		Takes a snapshot of the heap, without the profiler's own allocations
+		"""
+		filters = [tracemalloc.Filter(False, filename) for filename in IGNORED]
+		return tracemalloc.take_snapshot().filter_traces(filters)
+
+	def start(self) -> str:
+		"""
+		Starts tracing allocations, and returns the report of the baseline snapshot
+		"""
+		if not tracemalloc.is_tracing():
+			tracemalloc.start(self.frames)
+		return self.sample()
+
+	def stop(self) -> typing.Optional[str]:
+		"""
+		Stops tracing allocations. Returns the report of a final snapshot, if any battles
+		have finished since the last one
+		"""
+		report = self.sample() if self.battles > self.lastBattles else None
+		tracemalloc.stop()
+		return report
+
+	def battleFinished(self) -> typing.Optional[str]:
+		"""
+		Tells the profiler that another battle has been played out. Returns a report
+		whenever a snapshot is taken
+		"""
+		self.battles += 1
+		if self.battles % self.interval:
+			return None
+		return self.sample()
+
+	def sample(self) -> str:
+		"""
+		Takes a snapshot, and returns a report of the top allocation sites since the last
+		snapshot and the overall growth per battle
+		"""
+		snapshot = self._snapshot()
+		total = sum(stat.size for stat in snapshot.statistics("filename"))
+		if self.previous is None:
+			self.previous, self.previousBattles = snapshot, self.battles
+			self.firstTotal = self.lastTotal = total
+			self.firstBattles = self.lastBattles = self.battles
+			return "After %d battles: baseline of %.1f KiB" % (self.battles, total / 1024)
+
+		self.lastTotal, self.lastBattles = total, self.battles
+		lines = ["After %d battles: %.1f KiB, %+.1f B/battle overall" %
+		         (self.battles, total / 1024, self.growthPerBattle())]
+		battles = self.battles - self.previousBattles
+		for stat in snapshot.compare_to(self.previous, "traceback")[:self.top]:
+			if stat.size_diff:
+				lines.append("  %+10.1f B/battle  %s" % (stat.size_diff / battles, stat.traceback))
+
+		self.previous, self.previousBattles = snapshot, self.battles
+		return "\n".join(lines)
+
+	def growthPerBattle(self) -> float:
+		"""
+		Returns the average growth of the heap in bytes per battle, between the first and
+		the most recent snapshots
+		"""
+		battles = self.lastBattles - self.firstBattles
+		if not battles:
+			return 0.0
+		return (self.lastTotal - self.firstTotal) / battles
+
+	def leaking(self) -> bool:
+		"""
+		Returns whether the heap has grown by more than the threshold per battle
+		"""
+		return self.growthPerBattle() > self.threshold
@@ -3,29 +3,60 @@ Defines data structures and routines for dealing with a pokemon's move
 """
 
 
+import collections
 import random
+import threading
 import typing
 import enum
-import os
 from . import constants
+from . import prng
 from . import poketypes
+from . import trace
 from . import utils
 
 
-def critical(movecrit: int, pokestages:int) -> float:
+# The text added to a move's events when it lands a critical hit
+CRITICAL_HIT = "A critical hit!\n"
+
+# Damage modifiers are fixed-point multiples of 1/4096, as they are in the games
+MODIFIER_ONE = 4096
+CRIT_MODIFIER = 6144
+STAB_MODIFIER = 6144
+BURN_MODIFIER = 2048
+
+# The most damage tables (see `Move.damageTable`) kept in the cache used by `Move.calcDmg`;
+# the least recently used are dropped first
+DAMAGE_CACHE_SIZE = 65536
+_damageCache = collections.OrderedDict()
+_damageCacheLock = threading.Lock()
+
+def applyModifier(value: int, modifier: int) -> int:
 	"""
-	Given a move's inherent critical hit ratio and a pokemon's critical stage,
-	returns a multiplier to apply to damage from critical hits
+	Applies a fixed-point modifier to a damage value, rounding halves down like the games do
+	"""
+	return (value * modifier + 2047) // MODIFIER_ONE
+
+def critOdds(stage: int) -> int:
+	"""
+	Returns the chance (one in N) of a critical hit at the given effective critical stage:
+	1/16 at stage 0, doubling with each stage above it (so it's certain from stage 4) and
+	halving with each stage below it
 	"""
-	effectivestage = (movecrit + pokestages)
+	return 1 << max(4 - stage, 0)
 
-	if effectivestage > 3:
-		return 1.5
+def critical(movecrit: int, pokestages:int, rng: 'prng.BattleRNG'=random) -> int:
+	"""
+	Given a move's inherent critical hit ratio and a pokemon's critical stage,
+	returns the fixed-point modifier to apply to damage (CRIT_MODIFIER for a critical
+	hit, otherwise MODIFIER_ONE). Random draws are taken from `rng`, which defaults to
+	the global `random` module
+	"""
+	odds = critOdds(movecrit + pokestages)
 
-	ratio = 1.0 / (2 ** (4-effectivestage))
-	critChance = random.uniform(0,1)
+	if odds == 1:
+		return CRIT_MODIFIER
 
-	return 1.5 if ratio > critChance else 1
+	return CRIT_MODIFIER if not rng.randrange(odds) else MODIFIER_ONE
 
 class MoveType(enum.IntEnum):
 	"""
@@ -48,28 +79,33 @@ PHYSICAL = MoveType.Physical
 
 class Move():
 	"""
-	A pokemon's move
+	A pokemon's move. A Move holds its pokemon's remaining PP, so every pokemon (in every
+	battle) has Moves of its own, never shared with any other
 	"""
 
-	def __init__(self, name: str):
+	def __init__(self, name: str, contents: str = None):
 		"""
-		Reads in a move's data. Expects it in `../data/moves/<name>`
+		Reads in a move's data. Expects it in `../data/moves/<name>` (or parses `contents`
+		in its place, if given). Without `contents`, the move is copied from the one parsed
+		from its data file by `utils.loadData`, which may be kept between moves
 		"""
+		if contents is None:
+			template = utils.loadData("moves", name, lambda contents: Move(name, contents))
+			self.__dict__.update(template.__dict__)
+			return
+
 		self.name = name
 		self.priority = 0
 
-		with open(os.path.join(utils.dataDir, "moves", name)) as datafile:
-			lines = datafile.read().split('\n')
-			_ = lines.pop() #eliminates POSIX-compliant empty line at file end
-			self.type1 = poketypes.Type(int(lines.pop(0)))
-			self.type2 = poketypes.Type(int(lines.pop(0)))
-			self.contact = bool(int(lines.pop(0)))
-			self.accuracy = int(lines.pop(0))
-			self.PP = int(lines.pop(0))
-			self.maxPP = self.PP
-			self.moveType = MoveType(int(lines.pop(0)))
-
-		print(lines)
+		lines = contents.split('\n')
+		_ = lines.pop() #eliminates POSIX-compliant empty line at file end
+		self.type1 = poketypes.Type(int(lines.pop(0)))
+		self.type2 = poketypes.Type(int(lines.pop(0)))
+		self.contact = bool(int(lines.pop(0)))
+		self.accuracy = int(lines.pop(0))
+		self.PP = int(lines.pop(0))
+		self.maxPP = self.PP
+		self.moveType = MoveType(int(lines.pop(0)))
 
 		if self.moveType != STATUS:
 			self.damagingMove(lines)
@@ -93,77 +129,104 @@ class Move():
 		self.stageChanges = [int(stage) for stage in lines.pop().split(' ')]
 		self.affectedStats = [constants.Stats(int(stat)) for stat in lines.pop().split(' ')]
 
-	def calcDmg(self, pkmn: object, otherpkmn: object, unused_othermove: 'Move') -> typing.Tuple[int, str]:
+	def calcDmg(self, pkmn: object, otherpkmn: object, unused_othermove: 'Move',
+	            rng: 'prng.BattleRNG'=random) -> typing.Tuple[int, str]:
 		"""
-		Calculates damage done by pkmn to otherpkmn (who used 'othermove', if that matters)
+		Calculates damage done by pkmn to otherpkmn (who used 'othermove', if that matters),
+		drawing random numbers from `rng`
 		"""
-		dmg = 2 * pkmn.level / 5.0
-		dmg += 2
-		dmg *= self.power
-
 		eventStr = ''
 
-		crit = critical(self.crit, pkmn.stages[constants.CRIT])
-		if crit > 1:
-			eventStr = "A critical hit!\n"
-
-		effat, effdef = 0.0, 0.0
-		atstage, defstage = None, None
+		crit = critical(self.crit, pkmn.stages[constants.CRIT], rng)
+		if crit != MODIFIER_ONE:
+			eventStr = CRITICAL_HIT
 
 		#Physical attack
 		if self.moveType == PHYSICAL:
-			effat = pkmn.attack
-			effdef = pkmn.defense
-			atstage = pkmn.stages[constants.ATTACK]
-			defstage = otherpkmn.stages[constants.DEFENSE]
+			atstat, defstat = constants.ATTACK, constants.DEFENSE
 		#Special attack
 		else:
-			effat = pkmn.specialAttack
-			effdef = pkmn.specialDefense
-			atstage = pkmn.stages[constants.SPECIAL_ATTACK]
-			defstage = otherpkmn.stages[constants.SPECIAL_DEFENSE]
+			atstat, defstat = constants.SPECIAL_ATTACK, constants.SPECIAL_DEFENSE
+		atstage = pkmn.stages[atstat]
+		defstage = otherpkmn.stages[defstat]
+
+		# Critical hits ignore the attacker's drops and the defender's boosts
+		if crit != MODIFIER_ONE:
+			atstage = max(atstage, 0)
+			defstage = min(defstage, 0)
+
+		effat = pkmn.stagedStat(atstat, atstage)
+		effdef = pkmn.stagedStat(defstat, defstage)
+
+		# Everything but the damage roll is deterministic, so the damage done with each roll
+		# (type effectiveness and all) is looked up, or calculated and cached, and then the
+		# roll is drawn
+		burned = pkmn.status == constants.BRN and self.moveType == PHYSICAL
+		with trace.span("typeEffectiveness"):
+			key = (self.power, self.moveType, self.type1, self.type2, pkmn.level, effat, effdef,
+			       crit, pkmn.type1, pkmn.type2, otherpkmn.type1, otherpkmn.type2,
+			       otherpkmn.shadow, burned)
+			with _damageCacheLock:
+				entry = _damageCache.get(key)
+				if entry is not None:
+					_damageCache.move_to_end(key)
+			if entry is None:
+				entry = self.damageTable(pkmn, otherpkmn, effat, effdef, crit, burned)
+				with _damageCacheLock:
+					_damageCache[key] = entry
+					if len(_damageCache) > DAMAGE_CACHE_SIZE:
+						_damageCache.popitem(last=False)
+
+		rolls, effectStr = entry
+		return rolls[rng.randrange(16)], eventStr + effectStr
+
+	def damageTable(self, pkmn: object, otherpkmn: object, effat: int, effdef: int, crit: int,
+	                burned: bool) -> typing.Tuple[typing.Tuple[int, ...], str]:
+		"""
+		Calculates the damage done by pkmn to otherpkmn with each of the 16 damage rolls, given
+		the effective attacking and defending stats and the critical hit modifier, along with
+		a description of the move's type effectiveness
+		"""
+		base = (2 * pkmn.level // 5 + 2) * self.power * effat // effdef // 50 + 2
 
-		if atstage > 0:
-			effat *= (2.0 + atstage) / 2.0
-		elif atstage < 0 and crit == 1:
-			effat *= 2.0 / (2.0 - atstage)
+		#Caclucate modifiers, truncating after each one
+		base = applyModifier(base, crit)
 
-		if defstage > 0 and crit ==1:
-			effdef *= (2.0 + defstage) / 2.0
-		elif defstage < 0:
-			effdef *= 2.0 / (2.0 - defstage)
+		typeMod = poketypes.calcTypeEffectiveness(pkmn, otherpkmn, self)
+		numerator, denominator = float(typeMod).as_integer_ratio()
 
+		rolls = []
+		for roll in range(16):
+			dmg = base * (85 + roll) // 100
 
-		dmg *= effat/effdef
-		dmg /= 50
-		dmg += 2
+			if self.type1 != poketypes.TYPELESS:
+				if pkmn.type1 == self.type1 or pkmn.type2 == self.type2:
+					dmg = applyModifier(dmg, STAB_MODIFIER)
 
-		#Caclucate modifier
-		mod = random.uniform(0.85, 1)
-		if self.type1 != poketypes.TYPELESS:
-			if pkmn.type1 == self.type1 or pkmn.type2 == self.type2:
-				mod *= 1.5
+			if self.type2 != poketypes.TYPELESS:
+				if pkmn.type1 == self.type2 or pkmn.type2 == self.type2:
+					dmg = applyModifier(dmg, STAB_MODIFIER)
 
-		if self.type2 != poketypes.TYPELESS:
-			if pkmn.type1 == self.type2 or pkmn.type2 == self.type2:
-				mod *= 1.5
+			dmg = dmg * numerator // denominator
 
-		if pkmn.status == constants.BRN and self.moveType == PHYSICAL:
-			mod /= 2.0
+			if burned:
+				dmg = applyModifier(dmg, BURN_MODIFIER)
 
-		typeMod = poketypes.calcTypeEffectiveness(pkmn, otherpkmn, self)
-		mod *= typeMod
+			# Anything that isn't immune takes at least 1 damage
+			if typeMod and not dmg:
+				dmg = 1
+			rolls.append(dmg)
 
 		if not typeMod:
-			eventStr += 'But it had no effect!\n'
+			effectStr = 'But it had no effect!\n'
 		elif typeMod < 1:
-			eventStr += "It's not very effective...\n"
+			effectStr = "It's not very effective...\n"
 		elif typeMod > 1:
-			eventStr += "It's super effective!\n"
-
-		dmg *= mod * crit
+			effectStr = "It's super effective!\n"
+		else:
+			effectStr = ''
 
-		return int(dmg), eventStr
+		return tuple(rolls), effectStr
 
 	def __repr__(self) -> str:
 		"""
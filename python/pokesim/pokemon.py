@@ -3,23 +3,31 @@ Defines data structures and routines for dealing with a pokemon and its various
 """
 
 import random
-import os
+import typing
 from . import nature
 from . import move
 from . import utils
 from . import constants
 from . import poketypes
+from . import prng
+from . import species as speciesdata
+from . import trace
 
 suffixes = {0:"st", 1:"nd", 2:"rd", 3:"th"}
 
+# The moveset and EV spread used when the user doesn't make a choice during setup
+DEFAULT_MOVESET = ('Growl', 'Sweet Scent', 'Razor Leaf', 'Vine Whip')
+DEFAULT_EVS = (252, 252, 6, 0, 0, 0)
+
 class Pokemon():
 	"""
 	A class representing a pokemon, and all the information that entails
 	"""
 
-	def __init__(self, species: str, name: str = None):
+	def __init__(self, species: str, name: str = None, contents: str = None):
 		"""
 		Creates a pokemon, reading in basic data from a file in `../data/pokemon/<name>`
+		(or parsing `contents` in its place, if given)
 		"""
 		self.species = species
 		self.name = name if name else species
@@ -35,95 +43,145 @@ class Pokemon():
 		          constants.CRIT: 0,
 		          constants.ACCURACY: 0,
 		          constants.EVASIVENESS: 0}
-		self.EVs = [0,0,0,0,0,0]
-		self.level = 0
-		self.nature = None
+		self._EVs = (0, 0, 0, 0, 0, 0)
+		self._level = 0
+		self._nature = None
+		self._stats = None
+		self._stagedStats = {}
 		self.shadow = False
 
-		with open(os.path.join(utils.dataDir, "pokemon", species)) as datafile:
-			lines = datafile.read().split("\n")
-			self.type1 = poketypes.Type(int(lines[0]))
-			self.type2 = poketypes.Type(int(lines[1]))
-			if int(lines[2]):
-				self.gender = 'n'
-			else:
-				self.gender = 'm'
-			self.height = float(lines[3])
-			self.weight = float(lines[4])
-			self.maxHP = int(lines[5])
-			self.attack = int(lines[6])
-			self.defense = int(lines[7])
-			self.specialAttack = int(lines[8])
-			self.specialDefense = int(lines[9])
-			self.speed = int(lines[10])
-			self.availableAbilities = lines[11].split(" ")
-			self.ability = None
-			self.availableMoves = set()
-			self.moves = [None, None, None, None]
-
-			for line in lines[12:]:
-				if not line:
-					# handles blank lines at the end of POSIX-compliant text files
-					break
-				line = line.split(" ")
-				requiredLevel = int(line.pop())
-				self.availableMoves.add((" ".join(line), requiredLevel))
+		# An undo log (see the `undo` module) to record changes in, if any
+		self.journal = None
+
+		if contents is None:
+			data = utils.loadData("pokemon", species, speciesdata.parse)
+		else:
+			data = speciesdata.parse(contents)
+		self.type1 = data.type1
+		self.type2 = data.type2
+		if data.genderless:
+			self.gender = 'n'
+		else:
+			self.gender = 'm'
+		self.height = data.height
+		self.weight = data.weight
+		self.baseStats = data.baseStats
+		self.availableAbilities = list(data.abilities)
+		self.ability = None
+		self.availableMoves = data.learnset
+		self.moves = [None, None, None, None]
 
 		self.HP = self.maxHP
 
-	def setStats(self):
+	def _invalidate(self):
 		"""
-		Sets a pokemons's stats based on its nature, EVs and base stats
-		(assumes perfect IVs)
+		Forgets the pokemon's computed stats, after a change to something they depend on
 		"""
-		mults = nature.statMult(self.nature)
+		self._stats = None
+		self._stagedStats = {}
 
-		self.maxHP = (2 * self.maxHP) + 31 + int( self.EVs[0] / 4.0 )
-		self.maxHP = int(self.maxHP * self.level / 100.0)
-		self.maxHP = self.maxHP + self.level + 10
-		self.HP = self.maxHP
+	@property
+	def level(self) -> int:
+		"""
+		The pokemon's level (0 until it's been set up)
+		"""
+		return self._level
 
-		self.attack = (2 * self.attack) + 31 + int( self.EVs[1] / 4.0 )
-		self.attack = int(self.attack * self.level / 100.0)
-		self.attack += 5
-		self.attack = int(self.attack * mults[0])
+	@level.setter
+	def level(self, level: int):
+		self._level = level
+		self._invalidate()
 
-		self.defense = (2.0 * self.defense) + 31 + int( self.EVs[2] / 4.0 )
-		self.defense = int(self.defense * self.level / 100.0)
-		self.defense += 5
-		self.defense = int(self.defense * mults[1])
+	@property
+	def nature(self) -> str:
+		"""
+		The name of the pokemon's nature (None until it's been set up)
+		"""
+		return self._nature
+
+	@nature.setter
+	def nature(self, nature: str):
+		self._nature = nature
+		self._invalidate()
+
+	@property
+	def EVs(self) -> typing.Tuple[int, ...]:
+		"""
+		The pokemon's Effort Values, in the order of its stats. A new tuple must be assigned
+		to change them
+		"""
+		return self._EVs
 
-		self.specialAttack = (2.0 * self.specialAttack) + 31 + int( self.EVs[3] / 4.0 )
-		self.specialAttack = int(self.specialAttack * self.level / 100.0)
-		self.specialAttack += 5
-		self.specialAttack = int(self.specialAttack * mults[2])
+	@EVs.setter
+	def EVs(self, EVs: typing.Sequence[int]):
+		self._EVs = tuple(EVs)
+		self._invalidate()
 
-		self.specialDefense = (2.0 * self.specialDefense) + 31 + int( self.EVs[4] / 4.0 )
-		self.specialDefense = int(self.specialDefense * self.level / 100.0)
-		self.specialDefense += 5
-		self.specialDefense = int(self.specialDefense * mults[3])
+	@property
+	def stats(self) -> typing.Tuple[int, ...]:
+		"""
+		The pokemon's final stats (HP, Attack, Defense, Special Attack, Special Defense,
+		Speed), computed from its base stats, EVs, level and nature the first time they're
+		needed after any of those change. Until its level and nature have been set, these
+		are just its base stats
+		"""
+		if self._stats is None:
+			if self._level and self._nature is not None:
+				self._stats = calcStats(self.baseStats, self._EVs, self._level, self._nature)
+			else:
+				self._stats = self.baseStats
+		return self._stats
+
+	maxHP = property(lambda self: self.stats[constants.HP], doc="The pokemon's maximum HP")
+	attack = property(lambda self: self.stats[constants.ATTACK], doc="The pokemon's Attack")
+	defense = property(lambda self: self.stats[constants.DEFENSE], doc="The pokemon's Defense")
+	specialAttack = property(lambda self: self.stats[constants.SPECIAL_ATTACK],
+	                         doc="The pokemon's Special Attack")
+	specialDefense = property(lambda self: self.stats[constants.SPECIAL_DEFENSE],
+	                          doc="The pokemon's Special Defense")
+	speed = property(lambda self: self.stats[constants.SPEED], doc="The pokemon's Speed")
+
+	def stagedStat(self, stat: constants.Stats, stage: int) -> int:
+		"""
+		Returns one of the pokemon's stats scaled by the multiplier for the given stage. The
+		stat at every stage is computed together the first time any is needed, and kept
+		until the stat itself changes
+		"""
+		try:
+			return self._stagedStats[stat][stage + 6]
+		except KeyError:
+			value = self.stats[stat]
+			staged = tuple(constants.applyStage(value, s) for s in range(-6, 7))
+			self._stagedStats[stat] = staged
+			return staged[stage + 6]
+
+	def effectiveSpeed(self) -> int:
+		"""
+		Returns the pokemon's Speed as it stands in battle, after its stage and paralysis
+		"""
+		speed = self.stagedStat(constants.SPEED, self.stages[constants.SPEED])
+		return speed // 2 if self.status == constants.PAR else speed
 
-		self.speed = (2.0 * self.speed) + 31 + int( self.EVs[5] / 4.0 )
-		self.speed = int(self.speed * self.level / 100.0)
-		self.speed += 5
-		self.speed = int(self.speed * mults[4])
+	def setStats(self):
+		"""
+		Restores the pokemon's HP to its maximum, which (like all its stats) now follows from
+		its nature, EVs and base stats (assuming perfect IVs)
+		"""
+		self.HP = self.maxHP
 
 	def setMove(self, moveNo: int):
 		"""
 		An interactive routine to set the pokemon's `moveNo`th move
 		"""
-		available = { availableMove[0] for availableMove in self.availableMoves
-		                       if availableMove[1] <= self.level }
-
+		available = set(self.availableMoves.legalAt(self.level))
+		available.difference_update(str(knownMove) for index, knownMove in enumerate(self.moves)
+		                            if knownMove and index != moveNo)
 		utils.setCompleter(available)
-		for index, knownMove in enumerate(self.moves):
-			if knownMove and index != moveNo:
-				available.remove(str(knownMove))
 		while True:
 			print("Select %s's %d%s move." % (self, moveNo+1, suffixes[moveNo]))
 			choice = input("(move, or type 'l' to list available moves) [Debug Moveset]:")
 			if not choice:
-				self.moves[moveNo] = move.Move(['Growl', 'Sweet Scent', 'Razor Leaf', 'Vine Whip'][moveNo])
+				self.moves[moveNo] = move.Move(DEFAULT_MOVESET[moveNo])
 				break
 			if choice == 'l':
 				utils.cls()
@@ -145,6 +203,9 @@ class Pokemon():
 		Changes a Pokemon's stat (specified by 'stat') stage by the given amount.
 		Returns a string describing what took place.
 		"""
+		if self.journal is not None:
+			self.journal.recordItem(self.stages, stat)
+
 		if amt > 0 and self.stages[stat] >= 6:
 			self.stages[stat] = 6
 			return "%s's %s won't go any higher!" % (self, stat)
@@ -161,31 +222,32 @@ class Pokemon():
 		return "%s's %s %s" % (self, stat, constants.statChangeFlavorText(amt))
 
 
-	def useMove(self, mymove: move.Move, otherpoke: 'Pokemon', othermove: move.Move) -> str:
+	def useMove(self, mymove: move.Move, otherpoke: 'Pokemon', othermove: move.Move,
+	            rng: 'prng.BattleRNG'=random) -> str:
 		"""
-		Handles what happens when a pokemon uses a move on another pokemon.
-		Returns a string describing the interaction
+		Handles what happens when a pokemon uses a move on another pokemon, drawing any
+		random numbers from `rng`. Returns a string describing the interaction
 		"""
+		journal = self.journal
+		if journal is not None:
+			journal.recordAttr(mymove, "PP")
 		mymove.PP -=1
-		hitChance = random.randrange(101)
-		effacc = 100.0
-		if self.stages[constants.ACCURACY] > 0:
-			effacc *= ( 3 + self.stages[constants.ACCURACY] ) / 3.0
-		elif self.stages[constants.ACCURACY] < 0:
-			effacc *= 3.0 / ( 3 + self.stages[constants.ACCURACY] )
-
-		effev = 100.0
-		if otherpoke.stages[constants.EVASIVENESS] > 0:
-			effev *= ( 3 + otherpoke.stages[constants.EVASIVENESS] ) / 3.0
-		elif otherpoke.stages[constants.EVASIVENESS] < 0:
-			effev *= 3.0 / ( 3 - otherpoke.stages[constants.EVASIVENESS] )
-
-		if hitChance > int(mymove.accuracy * effacc / effev ):
+		hitChance = rng.randrange(101)
+		accStage = self.stages[constants.ACCURACY]
+		evStage = otherpoke.stages[constants.EVASIVENESS]
+		accNumerator, accDenominator = constants.ACCURACY_STAGES[accStage + 6]
+		evNumerator, evDenominator = constants.ACCURACY_STAGES[evStage + 6]
+
+		if hitChance > (mymove.accuracy * accNumerator * evDenominator //
+		                (accDenominator * evNumerator)):
 			return "... but it %s!" % ('missed' if mymove.moveType != move.STATUS else 'failed')
 
 		# Some damaging move, either physical or special
 		if mymove.moveType != move.STATUS:
-			dmg, eventStr = mymove.calcDmg(self, otherpoke, othermove)
+			with trace.span("calcDmg"):
+				dmg, eventStr = mymove.calcDmg(self, otherpoke, othermove, rng)
+			if journal is not None:
+				journal.recordAttr(otherpoke, "HP")
 			otherpoke.HP -= dmg
 			if otherpoke.HP < 0:
 				otherpoke.HP = 0
@@ -247,6 +309,26 @@ class Pokemon():
 		"""
 		return self.name
 
+def calcStats(baseStats: typing.Sequence[int], EVs: typing.Sequence[int], level: int,
+              natureName: str) -> typing.Tuple[int, ...]:
+	"""
+	Calculates a pokemon's final stats from its base stats, EVs, level and nature
+	(assumes perfect IVs)
+	"""
+	mults = nature.statMult(natureName)
+
+	maxHP = (2 * baseStats[0]) + 31 + int( EVs[0] / 4.0 )
+	maxHP = int(maxHP * level / 100.0)
+	maxHP = maxHP + level + 10
+
+	stats = [maxHP]
+	for base, EV, mult in zip(baseStats[1:], EVs[1:], mults):
+		stat = (2.0 * base) + 31 + int( EV / 4.0 )
+		stat = int(stat * level / 100.0)
+		stat += 5
+		stats.append(int(stat * mult))
+	return tuple(stats)
+
 def setEVs(pokemon: Pokemon):
 	"""
 	An interactive procedure to set the EVs of a given pokemon
@@ -263,7 +345,7 @@ def setEVs(pokemon: Pokemon):
 		print("[5]: Speed           -\t%d\n" % pokemon.EVs[5])
 		stat = input("[Default stats - 252 HP, 252 ATK, 6 DEF]:")
 		if not stat:
-			pokemon.EVs = [252, 252, 6, 0, 0, 0]
+			pokemon.EVs = DEFAULT_EVS
 			utils.cls()
 			break
 		try:
@@ -296,7 +378,7 @@ def setEVs(pokemon: Pokemon):
 		elif total - amt < 0:
 			print("You don't have that many EVs to spend!\n")
 		else:
-			pokemon.EVs[stat] += amt
+			pokemon.EVs = pokemon.EVs[:stat] + (pokemon.EVs[stat] + amt,) + pokemon.EVs[stat + 1:]
 			total -= amt
 
 def setGender(pokemon: Pokemon):
@@ -375,3 +457,20 @@ def setup(pokemon: Pokemon):
 	for i in range(4):
 		pokemon.setMove(i)
 		utils.cls()
+
+def build(species: str, name: str = None, level: int = 100, nature: str = 'Hardy',
+          EVs: typing.Sequence[int] = DEFAULT_EVS,
+          moves: typing.Sequence[str] = DEFAULT_MOVESET) -> Pokemon:
+	"""
+	Totally sets up a Pokemon, non-interactively. Anything not given gets the same value
+	it would if the user just hit 'Enter' at every prompt in `setup`
+	"""
+	pokemon = Pokemon(species, name)
+	if pokemon.gender != 'n':
+		pokemon.gender = 'm'
+	pokemon.level = level
+	pokemon.nature = nature
+	pokemon.EVs = EVs
+	pokemon.setStats()
+	pokemon.moves = [move.Move(mymove) for mymove in moves]
+	return pokemon
@@ -34,6 +34,10 @@ class Type(enum.Enum):
 	Shadow   = 18
 	Typeless = 19
 
+	# Members are singletons, so they can hash by identity, which is much faster than the
+	# default of hashing their names (types are part of the keys of the damage cache)
+	__hash__ = object.__hash__
+
 	@staticmethod
 	def colors() -> typing.Dict['Type', 'utils.Color']:
 		"""
@@ -0,0 +1,85 @@
+"""
+Defines a pool of worker processes for running simulations in parallel. The data tables are
+loaded once, into shared memory, and the workers stay warm between batches of jobs
+"""
+
+import functools
+import multiprocessing
+import multiprocessing.util
+import typing
+from . import battle
+from . import tables
+from . import utils
+
+# The tables attached to by a worker process; kept referenced for the life of the worker
+_workerTables = None
+
+def _initWorker(tablesName: str):
+	"""
+	Attaches a freshly started worker process to the shared data tables, so that it never
+	reads data files from disk
+	"""
+	global _workerTables # pylint: disable=global-statement
+	_workerTables = tables.SharedTables.attach(tablesName)
+	utils.readData = _workerTables.read
+	utils.listData = _workerTables.names
+	utils.loadData = _workerTables.load
+	multiprocessing.util.Finalize(_workerTables, _workerTables.close, exitpriority=10)
+
+class WorkerPool():
+	"""
+	A pool of worker processes sharing one copy of the data tables
+	"""
+
+	def __init__(self, processes: int = None, context: str = None, dataDir: str = utils.dataDir):
+		"""
+		Loads the data in `dataDir` into shared memory and starts `processes` workers (by
+		default, one per CPU) using the given multiprocessing start method
+		"""
+		self.tables = tables.SharedTables.create(dataDir)
+		self.processes = processes if processes else multiprocessing.cpu_count()
+		ctx = multiprocessing.get_context(context)
+		self._pool = ctx.Pool(self.processes, _initWorker, (self.tables.name,))
+
+	def map(self, func: typing.Callable, iterable: typing.Iterable,
+	        chunksize: int = None) -> typing.List:
+		"""
+		Applies `func` to everything in `iterable` using the workers, returning the results
+		in order. Jobs are sent to the workers in chunks, so that the per-job cost of
+		dispatch is amortized; by default there are about four chunks per worker
+		"""
+		if chunksize is None:
+			jobs = list(iterable)
+			chunksize = max(1, -(-len(jobs) // (4 * self.processes)))
+			iterable = jobs
+		return self._pool.map(func, iterable, chunksize)
+
+	def simulate(self, sides: typing.Tuple[battle.Side, battle.Side], masterSeed: int,
+	             indices: typing.Iterable[int], chunksize: int = None, **kwargs) -> typing.List[battle.BattleResult]:
+		"""
+		Plays out the battles with the given indices of a run seeded with `masterSeed`,
+		returning their results in order. Extra keyword arguments are passed through to
+		`battle.simulate`
+		"""
+		job = functools.partial(battle.simulate, sides, masterSeed, **kwargs)
+		return self.map(job, indices, chunksize)
+
+	def close(self):
+		"""
+		Waits for the workers to finish, then stops them and frees the shared tables
+		"""
+		self._pool.close()
+		self._pool.join()
+		self.tables.unlink()
+
+	def __enter__(self) -> 'WorkerPool':
+		"""
+		Allows the pool to be used as a context manager
+		"""
+		return self
+
+	def __exit__(self, *unused_exc_info):
+		"""
+		Closes the pool on leaving a context
+		"""
+		self.close()
@@ -0,0 +1,138 @@
+"""
+Defines a prefetcher that parses data files on background threads, so that interactive setup
+doesn't wait on the disk (or on network storage) after each choice the user makes.
+
+While it's installed, the prefetcher stands in for `utils.loadData`: data that has been
+prefetched (or is being fetched) is answered from memory, already parsed, waiting for the
+fetch to finish if need be, and anything else is loaded as usual. Nothing is fetched up
+front; once a species is chosen, its data file is parsed in the background and every move
+in its learnset is parsed into a Move while the user is still answering the prompts for its
+level, nature and EVs.
+"""
+
+import atexit
+import functools
+import threading
+import typing
+from concurrent import futures
+from . import move
+from . import pokemon
+from . import species as speciesdata
+from . import utils
+
+# How the data files of each kind are parsed, given their name and contents; the same way
+# `Pokemon` and `Move` parse them
+PARSERS = {"pokemon": lambda name, contents: speciesdata.parse(contents),
+           "moves": move.Move}
+
+class Prefetcher():
+	"""
+	A read-through cache of parsed data files, filled by background threads
+	"""
+
+	def __init__(self, load: typing.Callable[[str, str, typing.Callable], typing.Any] = None,
+	             threads: int = 4):
+		"""
+		Creates a prefetcher that loads files with `load` (by default, whatever
+		`utils.loadData` is now), using `threads` background threads
+		"""
+		self.base = load if load is not None else utils.loadData
+		self._lock = threading.Lock()
+		self._files = {}
+		self._executor = futures.ThreadPoolExecutor(threads, thread_name_prefix="pokesim-prefetch")
+
+	def prefetch(self, kind: str, names: typing.Iterable[str]):
+		"""
+		Starts parsing the data files of the given kind with the given names, unless they've
+		already been fetched
+		"""
+		with self._lock:
+			for name in names:
+				if (kind, name) not in self._files:
+					parse = functools.partial(PARSERS[kind], name)
+					self._files[(kind, name)] = self._executor.submit(self.base, kind, name, parse)
+
+	def prefetchSpecies(self, species: str):
+		"""
+		Starts parsing a species' data file and, once it's been parsed, the data file of
+		every move in its learnset (and of the default moveset)
+		"""
+		def fetchMoves():
+			"""
+			Waits for the species' learnset and fetches its moves
+			"""
+			data = self.load("pokemon", species, speciesdata.parse)
+			moves = [name for name, _ in data.learnset]
+			self.prefetch("moves", list(pokemon.DEFAULT_MOVESET) + moves)
+		self.prefetch("pokemon", (species,))
+		self._executor.submit(fetchMoves)
+
+	def load(self, kind: str, name: str, parse: typing.Callable[[str], typing.Any]) -> typing.Any:
+		"""
+		Returns the contents of a data file as parsed by `parse`, just like
+		`utils.loadDataFile`
+		"""
+		with self._lock:
+			fetched = self._files.get((kind, name))
+		if fetched is None:
+			return self.base(kind, name, parse)
+		return fetched.result()
+
+	def invalidate(self):
+		"""
+		Forgets everything fetched so far (e.g. because the data has changed since)
+		"""
+		with self._lock:
+			self._files = {}
+
+	def install(self):
+		"""
+		Makes `utils.loadData` load through this prefetcher
+		"""
+		utils.loadData = self.load
+
+	def uninstall(self):
+		"""
+		Makes `utils.loadData` load files directly again
+		"""
+		if utils.loadData == self.load:
+			utils.loadData = self.base
+
+	def close(self):
+		"""
+		Uninstalls the prefetcher and stops its threads, dropping any fetches not yet
+		started
+		"""
+		self.uninstall()
+		self._executor.shutdown(wait=False, cancel_futures=True)
+
+# The active prefetcher, if any
+_prefetcher = None
+
+def enable(threads: int = 4) -> Prefetcher:
+	"""
+	Installs a prefetcher; nothing is fetched until a species is chosen. It's closed at exit
+	if it hasn't been disabled
+	"""
+	global _prefetcher # pylint: disable=global-statement
+	disable()
+	_prefetcher = Prefetcher(threads=threads)
+	_prefetcher.install()
+	atexit.register(_prefetcher.close)
+	return _prefetcher
+
+def disable():
+	"""
+	Uninstalls the active prefetcher, if any
+	"""
+	global _prefetcher # pylint: disable=global-statement
+	if _prefetcher is not None:
+		atexit.unregister(_prefetcher.close)
+		_prefetcher.close()
+		_prefetcher = None
+
+def active() -> typing.Optional[Prefetcher]:
+	"""
+	Returns the active prefetcher, or None if data isn't being prefetched
+	"""
+	return _prefetcher
@@ -0,0 +1,87 @@
+"""
+Defines the random number generators owned by individual battles, so that a battle can be
+reproduced exactly from its seed and run alongside others without sharing global state
+"""
+
+import hashlib
+import os
+import random
+import typing
+
+def battleSeed(masterSeed: int, index: int) -> int:
+	"""
+	Derives the seed for the `index`th battle of a run from the run's master seed. The
+	derivation depends only on those two numbers, so it doesn't matter which worker plays
+	which battle, or in what order
+	"""
+	digest = hashlib.sha256(b"pokesim:%d:%d" % (masterSeed, index)).digest()
+	return int.from_bytes(digest[:8], "little")
+
+class BattleRNG():
+	"""
+	A battle's own stream of random numbers. Exposes the subset of the `random` module's
+	interface used by the engine, with every draw derived from `random()`
+	"""
+
+	def __init__(self, seed: int = None):
+		"""
+		Creates a generator from the given seed, or from the OS if no seed is given
+		"""
+		if seed is None:
+			seed = int.from_bytes(os.urandom(8), "little")
+		self.seed = seed
+		self._random = random.Random(seed)
+
+		# The raw draw is bound directly to skip a layer of Python method calls
+		self.random = self._random.random
+
+	@classmethod
+	def forBattle(cls, masterSeed: int, index: int, **kwargs) -> 'BattleRNG':
+		"""
+		Creates the generator for the `index`th battle of a run seeded with `masterSeed`
+		"""
+		return cls(battleSeed(masterSeed, index), **kwargs)
+
+	def uniform(self, a: float, b: float) -> float:
+		"""
+		Returns a random floating point number in the range [a, b)
+		"""
+		return a + (b - a) * self.random()
+
+	def randrange(self, stop: int) -> int:
+		"""
+		Returns a random integer in the range [0, stop)
+		"""
+		return int(self.random() * stop)
+
+	def getstate(self) -> typing.Tuple:
+		"""
+		Returns an object capturing the generator's current position in its stream
+		"""
+		return self._random.getstate()
+
+	def setstate(self, state: typing.Tuple):
+		"""
+		Returns the generator to a position previously captured with `getstate`
+		"""
+		self._random.setstate(state)
+
+class ScriptedDraws():
+	"""
+	Stands in for a random number generator, giving `Move.calcDmg` chosen draws so that a
+	specific damage roll, with or without a critical hit, can be calculated
+	"""
+	__slots__ = ("draws",)
+
+	def __init__(self, roll: int, crit: bool = None):
+		"""
+		Scripts the draws for the `roll`th damage roll (0-15), preceded by the draw for a
+		critical hit (or not) unless `crit` is None, for when no draw is made
+		"""
+		self.draws = [roll] if crit is None else [0 if crit else 1, roll]
+
+	def randrange(self, unused_stop: int) -> int:
+		"""
+		Returns the next scripted draw
+		"""
+		return self.draws.pop(0)
@@ -0,0 +1,260 @@
+"""
+Defines a registry of species and move data that can be reloaded while a process is running.
+The registry polls the data directory for modified files, re-parses them, and then swaps in
+a new version of the data all at once. Pokemon and moves parse their data when they're
+built, so battles in progress carry on with the version they were built from, while
+anything built after the swap gets the new one. Anything else built from the data as a whole
+(the reverse index of learnsets, and whatever the prefetcher has fetched) is rebuilt or
+dropped when a new version is swapped in.
+"""
+
+import contextlib
+import os
+import threading
+import typing
+from . import move
+from . import pokemon
+from . import prefetch
+from . import species
+from . import utils
+
+# The kinds of data files the registry watches, and how to check that the contents of a file
+# of each kind can be parsed
+KINDS = {"pokemon": pokemon.Pokemon, "moves": move.Move}
+
+class DataVersion():
+	"""
+	One immutable version of the contents of every data file, along with whatever has been
+	parsed from them
+	"""
+	__slots__ = ("number", "files", "stamps", "_parsed")
+
+	def __init__(self, number: int, files: typing.Dict[str, typing.Dict[str, str]],
+	             stamps: typing.Dict[typing.Tuple[str, str], typing.Tuple[int, int]]):
+		"""
+		Creates a version from the contents of the files of each kind, and the (mtime, size)
+		of each file when it was read
+		"""
+		self.number = number
+		self.files = files
+		self.stamps = stamps
+		self._parsed = {}
+
+	def read(self, kind: str, name: str) -> str:
+		"""
+		Returns the contents of a data file, just like `utils.readDataFile`
+		"""
+		try:
+			return self.files[kind][name]
+		except KeyError:
+			raise FileNotFoundError("No %s named '%s' in data version %d" % (kind, name, self.number))
+
+	def names(self, kind: str) -> typing.List[str]:
+		"""
+		Returns the names of everything of the given kind, just like `utils.listDataFiles`
+		"""
+		return sorted(self.files[kind])
+
+	def load(self, kind: str, name: str, parse: typing.Callable[[str], typing.Any]) -> typing.Any:
+		"""
+		Returns the contents of a data file as parsed by `parse`, just like
+		`utils.loadDataFile`. Each file is parsed once per version
+		"""
+		try:
+			return self._parsed[kind, name]
+		except KeyError:
+			parsed = self._parsed[kind, name] = parse(self.read(kind, name))
+			return parsed
+
+class DataRegistry():
+	"""
+	The current version of the data in a data directory, reloaded whenever its files change
+	"""
+
+	def __init__(self, dataDir: str = utils.dataDir):
+		"""
+		Loads every data file in `dataDir`
+		"""
+		self.dataDir = dataDir
+		self._current = DataVersion(0, {kind: {} for kind in KINDS}, {})
+		self._pinned = threading.local()
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._watcher = None
+		self._previous = (utils.readDataFile, utils.listDataFiles, utils.loadDataFile)
+		self.poll()
+
+	@property
+	def current(self) -> DataVersion:
+		"""
+		The most recently loaded version of the data
+		"""
+		return self._current
+
+	def _scan(self) -> typing.Dict[typing.Tuple[str, str], typing.Tuple[int, int]]:
+		"""
+		Returns the (mtime, size) of every data file
+		"""
+		stamps = {}
+		for kind in KINDS:
+			with os.scandir(os.path.join(self.dataDir, kind)) as entries:
+				for entry in entries:
+					if entry.is_file():
+						info = entry.stat()
+						stamps[kind, entry.name] = (info.st_mtime_ns, info.st_size)
+		return stamps
+
+	def poll(self) -> bool:
+		"""
+		Checks the data directory for added, modified or removed files, and if there are any
+		swaps in a new version of the data. Files that can't be parsed (e.g. because they're
+		only partly written) keep their old contents, and are tried again on the next poll.
+		Returns whether a new version was swapped in
+		"""
+		with self._lock:
+			old = self._current
+			stamps = self._scan()
+			changed = [key for key, stamp in stamps.items() if old.stamps.get(key) != stamp]
+			removed = [key for key in old.stamps if key not in stamps]
+			if not changed and not removed:
+				return False
+
+			files = {kind: dict(contents) for kind, contents in old.files.items()}
+			newStamps = dict(old.stamps)
+			for kind, name in removed:
+				del files[kind][name]
+				del newStamps[kind, name]
+			for kind, name in changed:
+				try:
+					with open(os.path.join(self.dataDir, kind, name)) as datafile:
+						files[kind][name] = datafile.read()
+				except OSError:
+					continue
+				newStamps[kind, name] = stamps[kind, name]
+
+			for kind, name in changed:
+				if (kind, name) not in newStamps:
+					continue
+				try:
+					KINDS[kind](name, contents=files[kind][name])
+				except (ValueError, IndexError):
+					if (kind, name) in old.stamps:
+						files[kind][name] = old.files[kind][name]
+						newStamps[kind, name] = old.stamps[kind, name]
+					else:
+						del files[kind][name]
+						del newStamps[kind, name]
+
+			if newStamps == old.stamps:
+				return False
+			self._current = DataVersion(old.number + 1, files, newStamps)
+			self._swapped()
+			return True
+
+	def _swapped(self):
+		"""
+		Brings everything built from the data as a whole up to date with the version just
+		swapped in: the reverse index of learnsets is rebuilt from it (or, if the registry
+		isn't installed, dropped to be loaded again when it's next needed), and the active
+		prefetcher, if any, forgets what it's fetched
+		"""
+		if self.installed():
+			species.load(self._current.read, self._current.names)
+		else:
+			species.invalidate()
+		prefetcher = prefetch.active()
+		if prefetcher is not None:
+			prefetcher.invalidate()
+
+	@contextlib.contextmanager
+	def pinned(self, version: DataVersion = None) -> typing.Iterator[DataVersion]:
+		"""
+		Makes every read by this thread come from one version of the data (by default, the
+		current one) for the duration of the context, so that e.g. both sides of a battle are
+		built from the same version even if a new one is swapped in halfway through
+		"""
+		previous = getattr(self._pinned, "version", None)
+		self._pinned.version = version if version is not None else self._current
+		try:
+			yield self._pinned.version
+		finally:
+			self._pinned.version = previous
+
+	def version(self) -> DataVersion:
+		"""
+		Returns the version of the data that this thread reads from
+		"""
+		version = getattr(self._pinned, "version", None)
+		return version if version is not None else self._current
+
+	def read(self, kind: str, name: str) -> str:
+		"""
+		Returns the contents of a data file, just like `utils.readDataFile`
+		"""
+		return self.version().read(kind, name)
+
+	def names(self, kind: str) -> typing.List[str]:
+		"""
+		Returns the names of everything of the given kind, just like `utils.listDataFiles`
+		"""
+		return self.version().names(kind)
+
+	def load(self, kind: str, name: str, parse: typing.Callable[[str], typing.Any]) -> typing.Any:
+		"""
+		Returns the contents of a data file as parsed by `parse`, just like
+		`utils.loadDataFile`
+		"""
+		return self.version().load(kind, name, parse)
+
+	def install(self):
+		"""
+		Makes the registry the source of all data, in place of wherever it came from before
+		(e.g. files on disk, or a prefetcher)
+		"""
+		self._previous = (utils.readData, utils.listData, utils.loadData)
+		utils.readData = self.read
+		utils.listData = self.names
+		utils.loadData = self.load
+		species.load(self.current.read, self.current.names)
+
+	def installed(self) -> bool:
+		"""
+		Returns whether the registry is the source of all data
+		"""
+		return utils.readData == self.read
+
+	def uninstall(self):
+		"""
+		Goes back to getting data from wherever it came from before the registry was
+		installed, unless something else has been installed since
+		"""
+		if self.installed():
+			utils.readData, utils.listData, utils.loadData = self._previous
+			species.invalidate()
+
+	def watch(self, interval: float = 1.0):
+		"""
+		Starts polling for changes every `interval` seconds, in a background thread
+		"""
+		if self._watcher is not None:
+			return
+		self._stop.clear()
+		self._watcher = threading.Thread(target=self._watch, args=(interval,),
+		                                 name="pokesim-data-watcher", daemon=True)
+		self._watcher.start()
+
+	def _watch(self, interval: float):
+		"""
+		The body of the background polling thread
+		"""
+		while not self._stop.wait(interval):
+			self.poll()
+
+	def stop(self):
+		"""
+		Stops polling for changes in the background
+		"""
+		if self._watcher is not None:
+			self._stop.set()
+			self._watcher.join()
+			self._watcher = None
@@ -0,0 +1,205 @@
+"""
+Defines a compact binary format for recording battles, and a replayer that reconstructs the
+state of a recorded battle at any turn by re-simulating it.
+
+A replay holds only what's needed to play the battle out again: how each side was set up,
+the seed of the battle's random number generator and the move each side chose on each turn.
+"""
+
+import struct
+import typing
+from . import battle
+from . import nature
+from . import prng
+
+# The binary layout of a replay's fixed-size parts
+HEADER = struct.Struct("<4sBQI")
+SIDE = struct.Struct("<BB6HB")
+MAGIC = b"PKRP"
+VERSION = 1
+
+# Each turn's choices are packed into a single byte, one side per nibble
+MAX_MOVES = 16
+
+# Natures are packed by their position in the table of natures
+NATURES = tuple(nature.Natures)
+
+def _packStr(string: str) -> bytes:
+	"""
+	Packs a string, prefixed with its length
+	"""
+	data = string.encode()
+	return struct.pack("<B", len(data)) + data
+
+def _unpackStr(data: bytes, offset: int) -> typing.Tuple[str, int]:
+	"""
+	Unpacks a length-prefixed string, returning it and the offset of whatever follows it
+	"""
+	length = data[offset]
+	return data[offset + 1:offset + 1 + length].decode(), offset + 1 + length
+
+class Replay(typing.NamedTuple):
+	"""
+	A recording of a single battle
+	"""
+	sides: typing.Tuple[battle.Side, battle.Side]
+	seed: int
+	maxTurns: int
+	choices: typing.Tuple[typing.Tuple[int, int], ...]
+
+	def pack(self) -> bytes:
+		"""
+		Packs the replay into its binary format
+		"""
+		data = [HEADER.pack(MAGIC, VERSION, self.seed, self.maxTurns)]
+		for side in self.sides:
+			data.append(_packStr(side.species))
+			data.append(SIDE.pack(side.level, NATURES.index(side.nature), *side.EVs, len(side.moves)))
+			data += [_packStr(mymove) for mymove in side.moves]
+		data.append(struct.pack("<I", len(self.choices)))
+		data.append(bytes(choice0 << 4 | choice1 for choice0, choice1 in self.choices))
+		return b"".join(data)
+
+	@classmethod
+	def unpack(cls, data: bytes) -> 'Replay':
+		"""
+		Unpacks a replay from its binary format
+		"""
+		magic, version, seed, maxTurns = HEADER.unpack_from(data, 0)
+		if magic != MAGIC or version != VERSION:
+			raise ValueError("Not a version %d pokesim replay" % VERSION)
+
+		offset = HEADER.size
+		sides = []
+		for _ in range(2):
+			species, offset = _unpackStr(data, offset)
+			level, natureNo, *EVs, moveCount = SIDE.unpack_from(data, offset)
+			offset += SIDE.size
+			moves = []
+			for _ in range(moveCount):
+				mymove, offset = _unpackStr(data, offset)
+				moves.append(mymove)
+			sides.append(battle.Side(species, level, NATURES[natureNo], tuple(EVs), tuple(moves)))
+
+		turns, = struct.unpack_from("<I", data, offset)
+		offset += 4
+		choices = tuple((choice >> 4, choice & 0xf) for choice in data[offset:offset + turns])
+		return cls(tuple(sides), seed, maxTurns, choices)
+
+class RecordingBattle(battle.Battle):
+	"""
+	A battle that records the moves chosen on every turn
+	"""
+
+	def __init__(self, *args, **kwargs):
+		"""
+		Creates a battle, exactly like a plain Battle
+		"""
+		super().__init__(*args, **kwargs)
+		self.choices = []
+
+	def turn(self, choice0: int, choice1: int) -> typing.List[str]:
+		"""
+		Records the moves chosen, then plays out the turn
+		"""
+		self.choices.append((choice0, choice1))
+		return super().turn(choice0, choice1)
+
+def record(sides: typing.Tuple[battle.Side, battle.Side], seed: int, maxTurns: int = 1000,
+           policy0: typing.Callable[[battle.Battle, int], int] = None,
+           policy1: typing.Callable[[battle.Battle, int], int] = None
+          ) -> typing.Tuple[Replay, battle.BattleResult]:
+	"""
+	Plays out a battle between the given sides with its generator seeded from `seed`,
+	returning a recording of it along with its result
+	"""
+	for side in sides:
+		if len(side.moves) > MAX_MOVES:
+			raise ValueError("Replays can't record Pokemon with more than %d moves" % MAX_MOVES)
+
+	recorded = RecordingBattle(sides[0].build(), sides[1].build(True), prng.BattleRNG(seed), maxTurns)
+	recorded.play(policy0, policy1)
+	return Replay(tuple(sides), seed, maxTurns, tuple(recorded.choices)), recorded.result()
+
+class Replayer():
+	"""
+	Reconstructs the states of a recorded battle by re-simulating it. If a keyframe interval
+	is given, the whole battle is played through once up front, saving its state every
+	`keyframeInterval` turns, so that seeking only has to re-simulate from the nearest
+	keyframe rather than from the start
+	"""
+
+	def __init__(self, replay: Replay, keyframeInterval: int = 0):
+		"""
+		Prepares to replay a battle
+		"""
+		self.replay = replay
+		self.keyframeInterval = keyframeInterval
+		self.keyframes = []
+		self.battle = self._fresh()
+
+		if keyframeInterval > 0:
+			for turn in range(len(replay.choices)):
+				if not turn % keyframeInterval:
+					self.keyframes.append(self.battle.getstate())
+				self.battle.turn(*replay.choices[turn])
+			self.battle = self._fresh()
+
+	def _fresh(self) -> battle.Battle:
+		"""
+		Sets the recorded battle up from scratch
+		"""
+		sides = self.replay.sides
+		rng = prng.BattleRNG(self.replay.seed)
+		return battle.Battle(sides[0].build(), sides[1].build(True), rng, self.replay.maxTurns)
+
+	def __len__(self) -> int:
+		"""
+		Returns the number of turns in the recorded battle
+		"""
+		return len(self.replay.choices)
+
+	def seek(self, turn: int) -> battle.Battle:
+		"""
+		Returns the battle as it stood after `turn` turns had been played. The returned
+		battle is reused by later calls to `seek`, so it shouldn't be modified
+		"""
+		if not 0 <= turn <= len(self):
+			raise IndexError("The recorded battle has no turn %d" % turn)
+
+		current = self.battle.turns
+		if self.keyframes and (turn < current or turn - current >= self.keyframeInterval):
+			keyframe = min(turn // self.keyframeInterval, len(self.keyframes) - 1)
+			self.battle.setstate(self.keyframes[keyframe])
+		elif turn < current:
+			self.battle = self._fresh()
+
+		for choices in self.replay.choices[self.battle.turns:turn]:
+			self.battle.turn(*choices)
+		return self.battle
+
+	def play(self) -> battle.BattleResult:
+		"""
+		Re-simulates the whole battle, returning its result
+		"""
+		return self.seek(len(self)).result()
+
+def writeReplays(stream: typing.BinaryIO, replays: typing.Iterable[Replay]):
+	"""
+	Writes replays to a binary stream, each prefixed with its length
+	"""
+	for replay in replays:
+		data = replay.pack()
+		stream.write(struct.pack("<I", len(data)))
+		stream.write(data)
+
+def readReplays(stream: typing.BinaryIO) -> typing.Iterator[Replay]:
+	"""
+	Reads replays written by `writeReplays` from a binary stream
+	"""
+	while True:
+		size = stream.read(4)
+		if not size:
+			return
+		length, = struct.unpack("<I", size)
+		yield Replay.unpack(stream.read(length))
@@ -0,0 +1,84 @@
+"""
+Defines the layout of a species' data file (see `pokemon.template`) and parses one into its
+fields, so that everything reading species data shares one parser. Also keeps the reverse
+index from each move to the species (and levels) that learn it, over every species' data
+file.
+"""
+
+import threading
+import typing
+from . import learnset
+from . import poketypes
+from . import utils
+
+# The line of a species' data file that its learnset starts on; everything before it is a
+# fixed field
+LEARNSET_LINE = 12
+
+class SpeciesData(typing.NamedTuple):
+	"""
+	The parsed contents of a species' data file
+	"""
+	type1: poketypes.Type
+	type2: poketypes.Type
+	genderless: bool
+	height: float
+	weight: float
+	baseStats: typing.Tuple[int, ...]
+	abilities: typing.Tuple[str, ...]
+	learnset: learnset.Learnset
+
+def parse(contents: str) -> SpeciesData:
+	"""
+	Parses the contents of a species' data file
+	"""
+	lines = contents.split("\n")
+	return SpeciesData(poketypes.Type(int(lines[0])), poketypes.Type(int(lines[1])),
+	                   bool(int(lines[2])), float(lines[3]), float(lines[4]),
+	                   tuple(int(line) for line in lines[5:11]), tuple(lines[11].split(" ")),
+	                   learnset.parse(lines[LEARNSET_LINE:]))
+
+# The reverse index over every species' data, and the lock held while loading it on first use
+_reverseIndex = None
+_reverseIndexLock = threading.Lock()
+
+def load(read: typing.Callable[[str, str], str] = None,
+         names: typing.Callable[[str], typing.List[str]] = None) -> learnset.ReverseIndex:
+	"""
+	Builds the reverse index over every species' data file, read with `read` and listed
+	with `names` (by default, `utils.readData` and `utils.listData`), and makes it the one
+	`reverseIndex` returns. Called whenever data is loaded (e.g. by the data registry, each
+	time it swaps in a new version)
+	"""
+	global _reverseIndex # pylint: disable=global-statement
+	read = read if read is not None else utils.readData
+	names = names if names is not None else utils.listData
+	_reverseIndex = learnset.ReverseIndex({name: parse(read("pokemon", name)).learnset
+	                                       for name in names("pokemon")})
+	return _reverseIndex
+
+def reverseIndex() -> learnset.ReverseIndex:
+	"""
+	Returns the reverse index over every species' data file, loading it (just once, however
+	many threads ask at the same time) if nothing has loaded it yet
+	"""
+	if _reverseIndex is None:
+		with _reverseIndexLock:
+			if _reverseIndex is None:
+				load()
+	return _reverseIndex
+
+def invalidate():
+	"""
+	Forgets the reverse index (e.g. because the data it was built from has changed), so that
+	it's loaded again the next time it's needed
+	"""
+	global _reverseIndex # pylint: disable=global-statement
+	_reverseIndex = None
+
+def learners(move: str, level: int = None) -> typing.List[typing.Tuple[str, int]]:
+	"""
+	Returns the (species, level) pairs for every species that learns `move`, only including
+	those that learn it by `level` if given
+	"""
+	return reverseIndex().learners(move, level)
@@ -0,0 +1,363 @@
+"""
+Defines constant-memory, mergeable aggregates for summarizing the results of any number of
+battles: running means and variances, quantile sketches, histograms and win rates.
+
+Every aggregate can be merged with another of the same kind, so partial aggregates built by
+parallel workers can be combined into one. Merging counts (histograms, sketches, win rates)
+is exact; merging means and variances is exact up to floating point rounding, so merging the
+same partial aggregates in the same order always gives the same result.
+"""
+
+import math
+import typing
+
+class RunningStats():
+	"""
+	The count, mean, variance, minimum and maximum of a stream of numbers, computed online
+	with Welford's algorithm
+	"""
+	__slots__ = ("count", "mean", "M2", "min", "max")
+
+	def __init__(self):
+		"""
+		Creates an empty aggregate
+		"""
+		self.count = 0
+		self.mean = 0.0
+		self.M2 = 0.0
+		self.min = math.inf
+		self.max = -math.inf
+
+	def push(self, value: float):
+		"""
+		Adds a value to the aggregate
+		"""
+		self.count += 1
+		delta = value - self.mean
+		self.mean += delta / self.count
+		self.M2 += delta * (value - self.mean)
+		if value < self.min:
+			self.min = value
+		if value > self.max:
+			self.max = value
+
+	def merge(self, other: 'RunningStats'):
+		"""
+		Adds everything in another aggregate to this one (Chan et al.'s parallel algorithm)
+		"""
+		if not other.count:
+			return
+		if not self.count:
+			self.count, self.mean, self.M2 = other.count, other.mean, other.M2
+			self.min, self.max = other.min, other.max
+			return
+
+		count = self.count + other.count
+		delta = other.mean - self.mean
+		self.mean += delta * other.count / count
+		self.M2 += other.M2 + delta * delta * self.count * other.count / count
+		self.count = count
+		self.min = min(self.min, other.min)
+		self.max = max(self.max, other.max)
+
+	@property
+	def variance(self) -> float:
+		"""
+		The sample variance of the values
+		"""
+		return self.M2 / (self.count - 1) if self.count > 1 else 0.0
+
+	@property
+	def stdev(self) -> float:
+		"""
+		The sample standard deviation of the values
+		"""
+		return math.sqrt(self.variance)
+
+	def confidenceInterval(self, z: float = 1.96) -> typing.Tuple[float, float]:
+		"""
+		Returns a normal-approximation confidence interval for the mean (by default, 95%)
+		"""
+		if not self.count:
+			return (math.nan, math.nan)
+		halfWidth = z * self.stdev / math.sqrt(self.count)
+		return (self.mean - halfWidth, self.mean + halfWidth)
+
+	def __repr__(self) -> str:
+		"""
+		A string representation of the aggregate
+		"""
+		if not self.count:
+			return "n=0"
+		return "n=%d mean=%.3f sd=%.3f min=%g max=%g" % (self.count, self.mean, self.stdev,
+		                                                 self.min, self.max)
+
+class QuantileSketch():
+	"""
+	A sketch of the distribution of a stream of non-negative numbers, from which any
+	quantile can be estimated to within a fixed relative error. Values are counted in
+	logarithmically sized buckets, so memory grows only with the logarithm of the range of
+	the values
+	"""
+	__slots__ = ("relativeError", "gamma", "logGamma", "zeros", "buckets", "count")
+
+	def __init__(self, relativeError: float = 0.01):
+		"""
+		Creates an empty sketch, whose quantile estimates are within `relativeError` of the
+		true values
+		"""
+		self.relativeError = relativeError
+		self.gamma = (1 + relativeError) / (1 - relativeError)
+		self.logGamma = math.log(self.gamma)
+		self.zeros = 0
+		self.buckets = {}
+		self.count = 0
+
+	def push(self, value: float):
+		"""
+		Adds a value to the sketch
+		"""
+		if value < 0:
+			raise ValueError("Quantile sketches only hold non-negative values")
+		self.count += 1
+		if not value:
+			self.zeros += 1
+			return
+		bucket = math.ceil(math.log(value) / self.logGamma)
+		self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+	def merge(self, other: 'QuantileSketch'):
+		"""
+		Adds everything in another sketch (with the same relative error) to this one
+		"""
+		if other.relativeError != self.relativeError:
+			raise ValueError("Can't merge sketches with different relative errors")
+		self.count += other.count
+		self.zeros += other.zeros
+		for bucket, count in other.buckets.items():
+			self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+	def quantile(self, q: float) -> float:
+		"""
+		Estimates the `q`th quantile (0 <= q <= 1) of the values
+		"""
+		if not self.count:
+			return math.nan
+		rank = q * (self.count - 1)
+		seen = self.zeros
+		if rank < seen:
+			return 0.0
+		for bucket in sorted(self.buckets):
+			seen += self.buckets[bucket]
+			if rank < seen:
+				return 2 * self.gamma ** bucket / (self.gamma + 1)
+		return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+class Histogram():
+	"""
+	Counts of a stream of numbers in equal-width bins over a fixed range, along with counts
+	of the values that fall below or above the range
+	"""
+	__slots__ = ("low", "high", "width", "counts", "under", "over")
+
+	def __init__(self, low: float, high: float, bins: int):
+		"""
+		Creates an empty histogram of `bins` bins over [low, high)
+		"""
+		self.low = low
+		self.high = high
+		self.width = (high - low) / bins
+		self.counts = [0] * bins
+		self.under = 0
+		self.over = 0
+
+	def push(self, value: float):
+		"""
+		Adds a value to the histogram
+		"""
+		if value < self.low:
+			self.under += 1
+		elif value >= self.high:
+			self.over += 1
+		else:
+			self.counts[min(int((value - self.low) / self.width), len(self.counts) - 1)] += 1
+
+	def merge(self, other: 'Histogram'):
+		"""
+		Adds everything in another histogram (with the same bins) to this one
+		"""
+		if (other.low, other.high, len(other.counts)) != (self.low, self.high, len(self.counts)):
+			raise ValueError("Can't merge histograms with different bins")
+		self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+		self.under += other.under
+		self.over += other.over
+
+	def bins(self) -> typing.Iterator[typing.Tuple[float, float, int]]:
+		"""
+		Iterates over the (low, high, count) of each bin
+		"""
+		for i, count in enumerate(self.counts):
+			yield (self.low + i * self.width, self.low + (i + 1) * self.width, count)
+
+class WinRate():
+	"""
+	The number of wins out of a number of trials
+	"""
+	__slots__ = ("wins", "trials")
+
+	def __init__(self):
+		"""
+		Creates an empty win rate
+		"""
+		self.wins = 0
+		self.trials = 0
+
+	def push(self, won: bool):
+		"""
+		Adds the outcome of a trial
+		"""
+		self.trials += 1
+		if won:
+			self.wins += 1
+
+	def merge(self, other: 'WinRate'):
+		"""
+		Adds the trials of another win rate to this one
+		"""
+		self.wins += other.wins
+		self.trials += other.trials
+
+	@property
+	def rate(self) -> float:
+		"""
+		The fraction of trials won
+		"""
+		return self.wins / self.trials if self.trials else math.nan
+
+	def confidenceInterval(self, z: float = 1.96) -> typing.Tuple[float, float]:
+		"""
+		Returns the Wilson score interval for the true win rate (by default, at 95%)
+		"""
+		if not self.trials:
+			return (0.0, 1.0)
+		n, p = self.trials, self.rate
+		denominator = 1 + z * z / n
+		center = (p + z * z / (2 * n)) / denominator
+		halfWidth = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+		return (max(0.0, center - halfWidth), min(1.0, center + halfWidth))
+
+	def __repr__(self) -> str:
+		"""
+		A string representation of the win rate, with its 95% confidence interval
+		"""
+		low, high = self.confidenceInterval()
+		return "%d/%d (%.2f%%, 95%% CI %.2f%%-%.2f%%)" % (self.wins, self.trials, 100 * self.rate,
+		                                                 100 * low, 100 * high)
+
+class Distribution():
+	"""
+	Running statistics, a quantile sketch and a histogram of the same stream of numbers
+	"""
+	__slots__ = ("stats", "sketch", "histogram")
+
+	def __init__(self, low: float, high: float, bins: int):
+		"""
+		Creates an empty distribution, whose histogram has `bins` bins over [low, high)
+		"""
+		self.stats = RunningStats()
+		self.sketch = QuantileSketch()
+		self.histogram = Histogram(low, high, bins)
+
+	def push(self, value: float):
+		"""
+		Adds a value to the distribution
+		"""
+		self.stats.push(value)
+		self.sketch.push(value)
+		self.histogram.push(value)
+
+	def merge(self, other: 'Distribution'):
+		"""
+		Adds everything in another distribution to this one
+		"""
+		self.stats.merge(other.stats)
+		self.sketch.merge(other.sketch)
+		self.histogram.merge(other.histogram)
+
+	def __repr__(self) -> str:
+		"""
+		A string representation of the distribution's statistics and median
+		"""
+		return "%r median~%.1f p99~%.1f" % (self.stats, self.sketch.quantile(0.5),
+		                                    self.sketch.quantile(0.99))
+
+class BattleAggregate():
+	"""
+	A summary of the results of any number of battles between the same two sides
+	"""
+
+	def __init__(self, maxTurns: int = 1000):
+		"""
+		Creates an empty summary. Histograms of turns cover 0 to `maxTurns`
+		"""
+		self.battles = 0
+		self.wins = (WinRate(), WinRate())
+		self.draws = 0
+		self.turns = Distribution(0, maxTurns, min(maxTurns, 100))
+		self.damage = (RunningStats(), RunningStats())
+		self.crits = (RunningStats(), RunningStats())
+		self.HP = (RunningStats(), RunningStats())
+		self.moveDamage = ({}, {})
+
+	def push(self, result: 'battle.BattleResult'):
+		"""
+		Adds the result of a battle to the summary
+		"""
+		self.battles += 1
+		self.wins[0].push(result.winner == 0)
+		self.wins[1].push(result.winner == 1)
+		if result.winner not in (0, 1):
+			self.draws += 1
+		self.turns.push(result.turns)
+		for side, (damage, crits, HP) in enumerate(((result.damage0, result.crits0, result.HP0),
+		                                            (result.damage1, result.crits1, result.HP1))):
+			self.damage[side].push(damage)
+			self.crits[side].push(crits)
+			self.HP[side].push(HP)
+			for slot, moveDamage in enumerate(result.moveDamage[side]):
+				self.moveDamage[side].setdefault(slot, RunningStats()).push(moveDamage)
+
+	def merge(self, other: 'BattleAggregate'):
+		"""
+		Adds everything in another summary to this one
+		"""
+		self.battles += other.battles
+		self.draws += other.draws
+		self.turns.merge(other.turns)
+		for side in range(2):
+			self.wins[side].merge(other.wins[side])
+			self.damage[side].merge(other.damage[side])
+			self.crits[side].merge(other.crits[side])
+			self.HP[side].merge(other.HP[side])
+			for slot, moveDamage in sorted(other.moveDamage[side].items()):
+				self.moveDamage[side].setdefault(slot, RunningStats()).merge(moveDamage)
+
+	def report(self, sides: typing.Tuple['battle.Side', 'battle.Side'] = None) -> str:
+		"""
+		Returns a human-readable report of the summary, naming moves if the sides are given
+		"""
+		lines = ["Battles: %d (draws: %d)" % (self.battles, self.draws),
+		         "Turns: %r" % self.turns]
+		for side in range(2):
+			if sides:
+				name = "The opponent's " + sides[side].species if side else sides[side].species
+			else:
+				name = "Side %d" % side
+			lines.append("%s wins: %r" % (name, self.wins[side]))
+			lines.append("  damage dealt: %r" % self.damage[side])
+			lines.append("  critical hits: %r" % self.crits[side])
+			lines.append("  remaining HP: %r" % self.HP[side])
+			for slot, moveDamage in sorted(self.moveDamage[side].items()):
+				moveName = sides[side].moves[slot] if sides else "move %d" % slot
+				lines.append("  damage from %s: %r" % (moveName, moveDamage))
+		return "\n".join(lines)
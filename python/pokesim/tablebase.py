@@ -0,0 +1,409 @@
+"""
+Defines endgame tablebases for small matchups: for a fixed pair of sides (species, level,
+nature, EVs and moveset), a pure maximin move for each side and an estimate of the chance
+that side 0 wins, in every state the battle can reach, solved offline so that a policy can
+play by table lookup alone.
+
+A state is both Pokemon's HP, along with any stages that the two movesets can change
+(e.g. the Attack stage of a Pokemon facing Growl); stages nothing can change stay at 0 and
+aren't part of the state. PP isn't part of the state either, so the table assumes that
+neither side ever runs out and battles can't end in a draw; once PP runs low its moves and
+values are wrong (the policy just falls back to a random usable move once the tabled move
+has none left).
+
+The table is solved by retrograde analysis. HP never goes up, so states are solved in
+order of increasing HP, each from the already-solved states it can lead to, and those with
+the same HP (reached by misses and stage changes) are iterated together until their values
+settle. The outcomes of each pair of moves are enumerated exactly from `Move.calcDmg` (every
+damage roll, with and without a critical hit), the accuracy check in `Pokemon.useMove`,
+and the turn order from `utils.decideOrder`.
+
+Both sides choose their moves at once, so each state is really a small matrix game, whose
+solution may need mixed strategies. The solver doesn't solve it: each side is given its
+pure security move (the one whose worst outcome against any single reply is best), and a
+state's value is side 0's chance of winning when both sides play those. This is a pure
+maximin approximation - neither the value of the game nor a guarantee against any opponent.
+
+The solver is pure Python, and the number of states grows with the product of both
+Pokemon's HP and of every stage their moves can change, so only small matchups are in
+reach: low levels and short movesets, with few stage-changing moves. Standard matchups are
+not - even at level 5, two Pokemon with the default moveset have about 1.5 million states,
+and at level 100 they have hundreds of millions.
+
+Tables are written to a file that's memory-mapped when loaded, so looking a move up is a
+single index into an array.
+"""
+
+import array
+import json
+import mmap
+import struct
+import typing
+from . import battle
+from . import constants
+from . import move
+from . import pokemon
+from . import prng
+
+# The layout of a tablebase file: a header, the JSON description of the table, and then the
+# values and moves of every state, each padded to an 8-byte boundary
+MAGIC = b"PKTB"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxQI")
+
+# Values are stored as side 0's chance of winning, scaled to this
+VALUE_SCALE = 65535
+
+# The largest number of states solved, unless otherwise specified: about a minute's work,
+# at the few thousand states a second the solver manages
+DEFAULT_MAX_STATES = 250000
+
+# The stages that can be part of a state
+TRACKABLE_STAGES = (constants.ATTACK, constants.DEFENSE, constants.SPECIAL_ATTACK,
+                    constants.SPECIAL_DEFENSE, constants.SPEED, constants.CRIT,
+                    constants.ACCURACY, constants.EVASIVENESS)
+
+# An outcome of a single move: its probability, the damage it does, and the index of the
+# stages afterwards
+Outcome = typing.Tuple[float, int, int]
+
+def trackedStages(pokes: typing.Tuple[pokemon.Pokemon, pokemon.Pokemon]
+                 ) -> typing.List[typing.Tuple[int, constants.Stats, int, int]]:
+	"""
+	Returns the stages that the two Pokemon's moves can change, as (side, stat, lowest,
+	highest) tuples
+	"""
+	changes = {}
+	for side, poke in enumerate(pokes):
+		for mymove in poke.moves:
+			if mymove.moveType != move.STATUS:
+				continue
+			target = side if mymove.target else 1 - side
+			for stat, amt in zip(mymove.affectedStats, mymove.stageChanges):
+				if stat in TRACKABLE_STAGES and amt:
+					low, high = changes.get((target, stat), (0, 0))
+					changes[(target, stat)] = (-6 if amt < 0 else low, 6 if amt > 0 else high)
+	return [(side, stat, low, high) for (side, stat), (low, high) in sorted(changes.items())]
+
+class Solver():
+	"""
+	Solves the tablebase of a matchup
+	"""
+
+	def __init__(self, sides: typing.Tuple[battle.Side, battle.Side],
+	             maxStates: int = DEFAULT_MAX_STATES, tolerance: float = 1e-9):
+		"""
+		Sets up the matchup between the given sides. Raises a ValueError if it has more than
+		`maxStates` states. States with the same HP are iterated until no value changes by
+		more than `tolerance`
+		"""
+		self.sides = tuple(sides)
+		self.pokemon = (sides[0].build(), sides[1].build(True))
+		self.tolerance = tolerance
+		self.tracked = trackedStages(self.pokemon)
+		self.maxHP = tuple(poke.maxHP for poke in self.pokemon)
+
+		self.stageCount = 1
+		for _, _, low, high in self.tracked:
+			self.stageCount *= high - low + 1
+		self.states = (self.maxHP[0] + 1) * (self.maxHP[1] + 1) * self.stageCount
+		if self.states > maxStates:
+			raise ValueError("The matchup has %d states, more than the limit of %d" %
+			                 (self.states, maxStates))
+
+		self.values = array.array("d", bytes(8 * self.states))
+		self.moves = array.array("B", bytes(self.states))
+		self._outcomes = {}
+		self._orders = {}
+
+	def stageIndex(self, stages: typing.Sequence[int]) -> int:
+		"""
+		Returns the index of the given values of the tracked stages
+		"""
+		index = 0
+		for (_, _, low, high), stage in zip(self.tracked, stages):
+			index = index * (high - low + 1) + min(max(stage, low), high) - low
+		return index
+
+	def stageValues(self, index: int) -> typing.List[int]:
+		"""
+		Returns the values of the tracked stages with the given index
+		"""
+		stages = []
+		for _, _, low, high in reversed(self.tracked):
+			index, offset = divmod(index, high - low + 1)
+			stages.append(low + offset)
+		return stages[::-1]
+
+	def _setStages(self, index: int):
+		"""
+		Puts both Pokemon into the tracked stages with the given index
+		"""
+		for (side, stat, _, _), stage in zip(self.tracked, self.stageValues(index)):
+			self.pokemon[side].stages[stat] = stage
+
+	def order(self, stageIndex: int, moves: typing.Tuple[int, int]) -> typing.List[typing.Tuple[float, int]]:
+		"""
+		Returns the chance of each side going first, as (probability, side) pairs, when they
+		use the given moves with the given stages
+		"""
+		key = (stageIndex, moves)
+		orders = self._orders.get(key)
+		if orders is None:
+			self._setStages(stageIndex)
+			move0, move1 = self.pokemon[0].moves[moves[0]], self.pokemon[1].moves[moves[1]]
+			if move0.priority != move1.priority:
+				orders = [(1.0, 0 if move0.priority > move1.priority else 1)]
+			else:
+				speed0, speed1 = self.pokemon[0].effectiveSpeed(), self.pokemon[1].effectiveSpeed()
+				if speed0 != speed1:
+					orders = [(1.0, 0 if speed0 > speed1 else 1)]
+				else:
+					orders = [(0.5, 0), (0.5, 1)]
+			self._orders[key] = orders
+		return orders
+
+	def outcomes(self, stageIndex: int, side: int, moveNo: int) -> typing.List[Outcome]:
+		"""
+		Returns the possible outcomes of the Pokemon on `side` using its `moveNo`th move with
+		the given stages
+		"""
+		key = (stageIndex, side, moveNo)
+		result = self._outcomes.get(key)
+		if result is not None:
+			return result
+
+		self._setStages(stageIndex)
+		attacker, defender = self.pokemon[side], self.pokemon[1 - side]
+		mymove = attacker.moves[moveNo]
+		accNumerator, accDenominator = constants.ACCURACY_STAGES[attacker.stages[constants.ACCURACY] + 6]
+		evNumerator, evDenominator = constants.ACCURACY_STAGES[defender.stages[constants.EVASIVENESS] + 6]
+		threshold = mymove.accuracy * accNumerator * evDenominator // (accDenominator * evNumerator)
+		hit = min(max(threshold + 1, 0), 101) / 101
+
+		distribution = {}
+		if hit < 1:
+			distribution[(0, stageIndex)] = 1 - hit
+		if hit > 0 and mymove.moveType == move.STATUS:
+			stages = self.stageValues(stageIndex)
+			target = side if mymove.target else 1 - side
+			for stat, amt in zip(mymove.affectedStats, mymove.stageChanges):
+				for i, (trackedSide, trackedStat, _, _) in enumerate(self.tracked):
+					if (trackedSide, trackedStat) == (target, stat):
+						stages[i] = min(max(stages[i] + amt, -6), 6)
+			after = (0, self.stageIndex(stages))
+			distribution[after] = distribution.get(after, 0.0) + hit
+		elif hit > 0:
+			critOdds = move.critOdds(mymove.crit + attacker.stages[constants.CRIT])
+			if critOdds > 1:
+				critChance = 1 / critOdds
+				draws = [(hit * (1 - critChance) / 16, prng.ScriptedDraws(roll, False))
+				         for roll in range(16)]
+				draws += [(hit * critChance / 16, prng.ScriptedDraws(roll, True))
+				          for roll in range(16)]
+			else:
+				draws = [(hit / 16, prng.ScriptedDraws(roll)) for roll in range(16)]
+			for chance, draw in draws:
+				dmg, _ = mymove.calcDmg(attacker, defender, None, draw)
+				distribution[(dmg, stageIndex)] = distribution.get((dmg, stageIndex), 0.0) + chance
+
+		result = [(chance, dmg, after) for (dmg, after), chance in distribution.items()]
+		self._outcomes[key] = result
+		return result
+
+	def index(self, HP0: int, HP1: int, stageIndex: int) -> int:
+		"""
+		Returns the index of a state
+		"""
+		return (HP0 * (self.maxHP[1] + 1) + HP1) * self.stageCount + stageIndex
+
+	def value(self, HP: typing.List[int], stageIndex: int) -> float:
+		"""
+		Returns side 0's chance of winning from a state, as solved so far
+		"""
+		if not HP[1]:
+			return 1.0
+		if not HP[0]:
+			return 0.0
+		return self.values[self.index(HP[0], HP[1], stageIndex)]
+
+	def moveValue(self, HP0: int, HP1: int, stageIndex: int, moves: typing.Tuple[int, int]) -> float:
+		"""
+		Returns side 0's chance of winning from a state when the sides use the given moves
+		this turn, and play on from the values solved so far
+		"""
+		total = 0.0
+		for orderChance, first in self.order(stageIndex, moves):
+			second = 1 - first
+			for chance, dmg, after in self.outcomes(stageIndex, first, moves[first]):
+				HP = [HP0, HP1]
+				HP[second] = max(HP[second] - dmg, 0)
+				if not HP[second]:
+					total += orderChance * chance * (1.0 if first == 0 else 0.0)
+					continue
+				for chance2, dmg2, after2 in self.outcomes(after, second, moves[second]):
+					afterHP = list(HP)
+					afterHP[first] = max(afterHP[first] - dmg2, 0)
+					total += orderChance * chance * chance2 * self.value(afterHP, after2)
+		return total
+
+	def solveState(self, HP0: int, HP1: int, stageIndex: int) -> float:
+		"""
+		Solves a single state from the values solved so far, giving each side its pure
+		security move and the state the value of that pair of moves. Returns how much its
+		value changed
+		"""
+		moves0, moves1 = range(len(self.pokemon[0].moves)), range(len(self.pokemon[1].moves))
+		table = [[self.moveValue(HP0, HP1, stageIndex, (a, b)) for b in moves1] for a in moves0]
+		best0 = max(moves0, key=lambda a: min(table[a]))
+		best1 = min(moves1, key=lambda b: max(row[b] for row in table))
+
+		index = self.index(HP0, HP1, stageIndex)
+		change = abs(table[best0][best1] - self.values[index])
+		self.values[index] = table[best0][best1]
+		self.moves[index] = best0 | best1 << 4
+		return change
+
+	def solve(self, maxIterations: int = 10000) -> 'Tablebase':
+		"""
+		Solves every state, returning the tablebase
+		"""
+		for HP0 in range(1, self.maxHP[0] + 1):
+			for HP1 in range(1, self.maxHP[1] + 1):
+				for _ in range(maxIterations):
+					change = max(self.solveState(HP0, HP1, stageIndex)
+					             for stageIndex in range(self.stageCount))
+					if change <= self.tolerance:
+						break
+		return Tablebase(self.describe(), self.values, self.moves)
+
+	def describe(self) -> typing.Dict[str, typing.Any]:
+		"""
+		Returns the description of the table stored alongside it
+		"""
+		return {"sides": [list(side) for side in self.sides],
+		        "maxHP": list(self.maxHP),
+		        "tracked": [[side, int(stat), low, high] for side, stat, low, high in self.tracked]}
+
+class Tablebase():
+	"""
+	The solved values and moves of every state of a matchup
+	"""
+
+	def __init__(self, description: typing.Dict[str, typing.Any],
+	             values: typing.Sequence[float], moves: typing.Sequence[int]):
+		"""
+		Wraps a solved table. Values may be given as chances, or already scaled to
+		VALUE_SCALE (as they are when loaded)
+		"""
+		self.description = description
+		self.sides = tuple(battle.Side(species, level, natureName, tuple(EVs), tuple(moveNames))
+		                   for species, level, natureName, EVs, moveNames in description["sides"])
+		self.maxHP = tuple(description["maxHP"])
+		self.tracked = tuple(tuple(entry) for entry in description["tracked"])
+		self.stageCount = 1
+		for _, _, low, high in self.tracked:
+			self.stageCount *= high - low + 1
+		self.values = values
+		self.moves = moves
+		self._map = None
+		self._views = ()
+
+	def index(self, HP0: int, HP1: int, stages: typing.Sequence[typing.Dict[constants.Stats, int]]) -> int:
+		"""
+		Returns the index of the state with the given HP and stages (a stage dict for each
+		side)
+		"""
+		stageIndex = 0
+		for side, stat, low, high in self.tracked:
+			stageIndex = stageIndex * (high - low + 1) + min(max(stages[side][stat], low), high) - low
+		return (HP0 * (self.maxHP[1] + 1) + HP1) * self.stageCount + stageIndex
+
+	def lookup(self, current: battle.Battle) -> typing.Tuple[int, int, float]:
+		"""
+		Returns the move each side should use, and side 0's chance of winning, in the
+		current state of a battle between the table's sides
+		"""
+		poke0, poke1 = current.pokemon
+		index = self.index(poke0.HP, poke1.HP, (poke0.stages, poke1.stages))
+		moves, value = self.moves[index], self.values[index]
+		if isinstance(value, int):
+			value /= VALUE_SCALE
+		return moves & 0xF, moves >> 4, value
+
+	def save(self, path: str):
+		"""
+		Writes the table to a file
+		"""
+		description = json.dumps(self.description).encode()
+		description += b" " * (-(HEADER.size + len(description)) % 8)
+		values = self.values
+		if values.typecode != "H":
+			values = array.array("H", (round(value * VALUE_SCALE) for value in values))
+		moves = array.array("B", self.moves)
+		with open(path, "wb") as tableFile:
+			tableFile.write(HEADER.pack(MAGIC, VERSION, len(moves), len(description)))
+			tableFile.write(description)
+			values.tofile(tableFile)
+			tableFile.write(b"\0" * (-len(values) * values.itemsize % 8))
+			moves.tofile(tableFile)
+
+	@classmethod
+	def load(cls, path: str) -> 'Tablebase':
+		"""
+		Memory-maps a table written with `save`
+		"""
+		with open(path, "rb") as tableFile:
+			magic, version, states, descriptionSize = HEADER.unpack(tableFile.read(HEADER.size))
+			if magic != MAGIC or version != VERSION:
+				raise ValueError("'%s' isn't a version %d tablebase" % (path, VERSION))
+			description = json.loads(tableFile.read(descriptionSize))
+			tableMap = mmap.mmap(tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+
+		view = memoryview(tableMap)
+		offset = HEADER.size + descriptionSize
+		values = view[offset:offset + 2 * states].cast("H")
+		offset += 2 * states + (-2 * states % 8)
+		moves = view[offset:offset + states]
+		table = cls(description, values, moves)
+		table._map = tableMap
+		table._views = (values, moves, view)
+		return table
+
+	def close(self):
+		"""
+		Unmaps a loaded table
+		"""
+		for view in self._views:
+			view.release()
+		self._views = ()
+		if self._map is not None:
+			self._map.close()
+			self._map = None
+
+class TablebasePolicy():
+	"""
+	A policy (for `battle.Battle.play`) that plays the moves from a tablebase
+	"""
+
+	def __init__(self, table: Tablebase):
+		"""
+		Plays by the given table
+		"""
+		self.table = table
+
+	def __call__(self, current: battle.Battle, side: int) -> int:
+		"""
+		Returns the index of the move the Pokemon on `side` should use. If it has no PP left
+		for it, a usable move is chosen at random instead
+		"""
+		choice = self.table.lookup(current)[side]
+		if current.pokemon[side].moves[choice].PP > 0:
+			return choice
+		return current.randomChoice(side)
+
+def solve(sides: typing.Tuple[battle.Side, battle.Side], **kwargs) -> Tablebase:
+	"""
+	Solves the tablebase of a matchup. Keyword arguments are passed through to the Solver
+	"""
+	return Solver(sides, **kwargs).solve()
@@ -0,0 +1,135 @@
+"""
+Defines tables of species and move data packed into a single block of shared memory, so
+that many processes can read the data without each of them loading it from disk. The type
+chart isn't packed: it's a constant in `poketypes`, which every process already has.
+
+Each process attached to the tables also keeps whatever it parses from them (see `load`),
+so a worker parses each species and move once, rather than once per battle.
+
+Requires Python 3.8+ for `multiprocessing.shared_memory`.
+"""
+
+import os
+import struct
+import typing
+from multiprocessing import shared_memory
+from . import utils
+
+# The kinds of data files that get packed into the tables, in the order they're packed
+KINDS = ("pokemon", "moves")
+
+# Layout of the tables: a header, an index entry per file and then the contents of all the
+# files one after the other
+HEADER = struct.Struct("<4sHI")
+ENTRY = struct.Struct("<BIIII")
+MAGIC = b"PKST"
+VERSION = 2
+
+def pack(dataDir: str = utils.dataDir) -> bytes:
+	"""
+	Packs all of the data files in `dataDir` into the tables' binary format. Files are read
+	just as `utils.readDataFile` reads them (in text mode, so with universal newlines) and
+	stored as UTF-8
+	"""
+	files = []
+	for kindNo, kind in enumerate(KINDS):
+		for name in sorted(os.listdir(os.path.join(dataDir, kind))):
+			with open(os.path.join(dataDir, kind, name)) as datafile:
+				files.append((kindNo, name.encode(), datafile.read().encode()))
+
+	offset = HEADER.size + ENTRY.size * len(files)
+	index, blobs = [], []
+	for kindNo, name, data in files:
+		index.append(ENTRY.pack(kindNo, offset, len(name), offset + len(name), len(data)))
+		blobs += [name, data]
+		offset += len(name) + len(data)
+
+	header = HEADER.pack(MAGIC, VERSION, len(files))
+	return b"".join([header] + index + blobs)
+
+class SharedTables():
+	"""
+	A read-only view of the tables in a block of shared memory
+	"""
+
+	def __init__(self, memory: shared_memory.SharedMemory, owner: bool = False):
+		"""
+		Wraps an existing block of shared memory holding the tables. Use `create` or `attach`
+		rather than calling this directly
+		"""
+		self.memory = memory
+		self.owner = owner
+		self.name = memory.name
+		self._parsed = {}
+		buf = memory.buf
+
+		magic, version, count = HEADER.unpack_from(buf, 0)
+		if magic != MAGIC or version != VERSION:
+			raise ValueError("'%s' doesn't hold pokesim data tables" % self.name)
+
+		self._index = {kind: {} for kind in KINDS}
+		for entry in range(count):
+			kindNo, nameOffset, nameLen, dataOffset, dataLen = ENTRY.unpack_from(
+			    buf, HEADER.size + ENTRY.size * entry)
+			name = bytes(buf[nameOffset:nameOffset + nameLen]).decode()
+			self._index[KINDS[kindNo]][name] = (dataOffset, dataLen)
+
+	@classmethod
+	def create(cls, dataDir: str = utils.dataDir) -> 'SharedTables':
+		"""
+		Loads the data in `dataDir` into a new block of shared memory. The process that
+		creates the tables is responsible for calling `unlink` when they're no longer needed
+		"""
+		data = pack(dataDir)
+		memory = shared_memory.SharedMemory(create=True, size=len(data))
+		memory.buf[:len(data)] = data
+		return cls(memory, True)
+
+	@classmethod
+	def attach(cls, name: str) -> 'SharedTables':
+		"""
+		Attaches to tables created by another process, without copying them. Meant for
+		processes started by the creator, which share its resource tracker
+		"""
+		return cls(shared_memory.SharedMemory(name))
+
+	def names(self, kind: str) -> typing.List[str]:
+		"""
+		Returns the names of everything of the given kind, just like `utils.listDataFiles`
+		"""
+		return sorted(self._index[kind])
+
+	def read(self, kind: str, name: str) -> str:
+		"""
+		Returns the contents of a data file, just like `utils.readDataFile`
+		"""
+		try:
+			offset, length = self._index[kind][name]
+		except KeyError:
+			raise FileNotFoundError("No %s named '%s' in the shared tables" % (kind, name))
+		return str(self.memory.buf[offset:offset + length], 'utf-8')
+
+	def load(self, kind: str, name: str, parse: typing.Callable[[str], typing.Any]) -> typing.Any:
+		"""
+		Returns the contents of a data file as parsed by `parse`, just like
+		`utils.loadDataFile`. Each file is parsed once, and kept for the life of the process
+		"""
+		try:
+			return self._parsed[kind, name]
+		except KeyError:
+			parsed = self._parsed[kind, name] = parse(self.read(kind, name))
+			return parsed
+
+	def close(self):
+		"""
+		Detaches from the shared memory
+		"""
+		self.memory.close()
+
+	def unlink(self):
+		"""
+		Detaches from, and then frees, the shared memory. Only the owner should do this
+		"""
+		self.close()
+		if self.owner:
+			self.memory.unlink()
@@ -0,0 +1,116 @@
+"""
+Defines a pool of threads for running simulations in parallel within one process, so the
+data is only ever loaded once. Headless battles share no mutable state - each has its own
+random number generators, Pokemon and moves - so they can run on any number of threads at
+once. On a GIL build of CPython, threads only take turns; on a free-threaded build (e.g.
+3.13t) they run in parallel, which `benchmark` can be used to check.
+"""
+
+import os
+import sys
+import time
+import typing
+from concurrent import futures
+from . import battle
+
+def gilEnabled() -> bool:
+	"""
+	Returns whether the interpreter is running with the GIL
+	"""
+	isEnabled = getattr(sys, "_is_gil_enabled", None)
+	return isEnabled() if isEnabled is not None else True
+
+def _runChunk(func: typing.Callable, chunk: typing.Sequence) -> typing.List:
+	"""
+	Applies `func` to everything in a chunk of jobs
+	"""
+	return [func(job) for job in chunk]
+
+class ThreadRunner():
+	"""
+	A pool of threads, with the same interface as `pool.WorkerPool`
+	"""
+
+	def __init__(self, threads: int = None):
+		"""
+		Starts `threads` threads (by default, one per CPU)
+		"""
+		self.threads = threads if threads else os.cpu_count()
+		self._executor = futures.ThreadPoolExecutor(self.threads, thread_name_prefix="pokesim-battle")
+
+	def map(self, func: typing.Callable, iterable: typing.Iterable,
+	        chunksize: int = None) -> typing.List:
+		"""
+		Applies `func` to everything in `iterable` using the threads, returning the results
+		in order. Jobs are handed out in chunks, by default about four per thread
+		"""
+		jobs = list(iterable)
+		if chunksize is None:
+			chunksize = max(1, -(-len(jobs) // (4 * self.threads)))
+		chunks = [self._executor.submit(_runChunk, func, jobs[start:start + chunksize])
+		          for start in range(0, len(jobs), chunksize)]
+		return [result for chunk in chunks for result in chunk.result()]
+
+	def simulate(self, sides: typing.Tuple[battle.Side, battle.Side], masterSeed: int,
+	             indices: typing.Iterable[int], chunksize: int = None, **kwargs) -> typing.List[battle.BattleResult]:
+		"""
+		Plays out the battles with the given indices of a run seeded with `masterSeed`,
+		returning their results in order. Extra keyword arguments are passed through to
+		`battle.simulate`
+		"""
+		def job(index: int) -> battle.BattleResult:
+			"""
+			Plays out one battle
+			"""
+			return battle.simulate(sides, masterSeed, index, **kwargs)
+		return self.map(job, indices, chunksize)
+
+	def close(self):
+		"""
+		Waits for the threads to finish, then stops them
+		"""
+		self._executor.shutdown()
+
+	def __enter__(self) -> 'ThreadRunner':
+		"""
+		Allows the runner to be used as a context manager
+		"""
+		return self
+
+	def __exit__(self, *unused_exc_info):
+		"""
+		Closes the runner on leaving a context
+		"""
+		self.close()
+
+def benchmark(sides: typing.Tuple[battle.Side, battle.Side], battles: int,
+              threadCounts: typing.Sequence[int] = (1, 2, 4, 8),
+              masterSeed: int = 0) -> typing.List[typing.Tuple[int, float, float]]:
+	"""
+	Times `battles` battles on each number of threads, checking that every run gives the
+	same results. Returns (threads, seconds, speedup over the first count) for each count
+	"""
+	timings = []
+	expected = None
+	for threads in threadCounts:
+		with ThreadRunner(threads) as runner:
+			start = time.perf_counter()
+			results = runner.simulate(sides, masterSeed, range(battles))
+			seconds = time.perf_counter() - start
+		if expected is None:
+			expected = results
+		elif results != expected:
+			raise RuntimeError("Results on %d threads differ from those on %d" %
+			                   (threads, threadCounts[0]))
+		timings.append((threads, seconds, timings[0][1] / seconds if timings else 1.0))
+	return timings
+
+def benchmarkReport(timings: typing.List[typing.Tuple[int, float, float]], battles: int) -> str:
+	"""
+	Returns a human-readable report of the timings from `benchmark`
+	"""
+	lines = ["Python %s, GIL %s" % (sys.version.split()[0], "enabled" if gilEnabled() else "disabled")]
+	for threads, seconds, speedup in timings:
+		lines.append("%3d threads: %8.3fs  %10.1f battles/s  %5.2fx" %
+		             (threads, seconds, battles / seconds, speedup))
+	return "\n".join(lines)
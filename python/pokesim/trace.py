@@ -0,0 +1,137 @@
+"""
+Defines an optional tracer that records timed spans for the phases of each battle turn,
+and writes them out in the Chrome Trace Event format (so they can be opened in e.g.
+chrome://tracing or Perfetto).
+
+Spans are buffered in memory in a bounded ring - so only the most recent spans are kept
+once it fills up - and only written out when the tracer is flushed, which happens
+automatically at exit.
+"""
+
+import atexit
+import collections
+import json
+import os
+import threading
+import time
+import typing
+
+# The number of spans kept in memory, unless otherwise specified
+DEFAULT_CAPACITY = 1000000
+
+class _NullSpan():
+	"""
+	Stands in for a span when tracing is disabled, doing nothing as cheaply as possible
+	"""
+
+	def __enter__(self):
+		"""
+		Does nothing
+		"""
+		return self
+
+	def __exit__(self, *unused_exc_info):
+		"""
+		Does nothing
+		"""
+
+NULL_SPAN = _NullSpan()
+
+class Span():
+	"""
+	A single timed span; records itself with its tracer when it exits
+	"""
+	__slots__ = ("tracer", "name", "category", "args", "start")
+
+	def __init__(self, tracer: 'Tracer', name: str, category: str, args: typing.Dict):
+		"""
+		Creates a span, which starts timing when it's entered
+		"""
+		self.tracer = tracer
+		self.name = name
+		self.category = category
+		self.args = args
+		self.start = 0
+
+	def __enter__(self) -> 'Span':
+		"""
+		Starts timing the span
+		"""
+		self.start = time.perf_counter_ns()
+		return self
+
+	def __exit__(self, *unused_exc_info):
+		"""
+		Stops timing the span and records it
+		"""
+		self.tracer.events.append((self.name, self.category, self.start,
+		                           time.perf_counter_ns(), threading.get_ident(), self.args))
+
+class Tracer():
+	"""
+	Buffers spans in memory, and writes them out as a Chrome trace
+	"""
+
+	def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY):
+		"""
+		Creates a tracer that will write its trace to `path`, keeping at most `capacity`
+		spans in memory
+		"""
+		self.path = path
+		self.events = collections.deque(maxlen=capacity)
+		self.origin = time.perf_counter_ns()
+
+	def span(self, name: str, category: str = "battle", **args) -> Span:
+		"""
+		Returns a context manager that records a span with the given name and arguments
+		"""
+		return Span(self, name, category, args)
+
+	def flush(self):
+		"""
+		Writes out every buffered span, emptying the buffer
+		"""
+		pid = os.getpid()
+		events = []
+		while self.events:
+			name, category, start, end, tid, args = self.events.popleft()
+			event = {"name": name, "cat": category, "ph": "X", "pid": pid, "tid": tid,
+			         "ts": (start - self.origin) / 1000.0, "dur": (end - start) / 1000.0}
+			if args:
+				event["args"] = args
+			events.append(event)
+
+		with open(self.path, 'w') as tracefile:
+			json.dump({"traceEvents": events, "displayTimeUnit": "ns"}, tracefile)
+
+# The active tracer, if any
+_tracer = None
+
+def enable(path: str, capacity: int = DEFAULT_CAPACITY) -> Tracer:
+	"""
+	Starts tracing to `path`; the trace is written out at exit
+	"""
+	global _tracer # pylint: disable=global-statement
+	disable()
+	_tracer = Tracer(path, capacity)
+	atexit.register(_tracer.flush)
+	return _tracer
+
+def disable():
+	"""
+	Stops tracing, writing out anything traced so far
+	"""
+	global _tracer # pylint: disable=global-statement
+	if _tracer is not None:
+		atexit.unregister(_tracer.flush)
+		_tracer.flush()
+		_tracer = None
+
+def span(name: str, category: str = "battle", **args) -> typing.Union[Span, _NullSpan]:
+	"""
+	Returns a context manager that records a span with the active tracer, or does nothing
+	if tracing isn't enabled
+	"""
+	if _tracer is None:
+		return NULL_SPAN
+	return Span(_tracer, name, category, args)
@@ -0,0 +1,245 @@
+"""
+Defines an optional sink for battle transcripts: a record of every move used in every
+battle, written as gzip-compressed JSON Lines for later audits.
+
+Records are put on a bounded queue and written out in batches by a background thread, so
+battles never wait on the disk. What happens when the queue is full is chosen up front:
+with the BLOCK policy the battle waits for room (so nothing is lost), while with the DROP
+policy the record is thrown away and counted. Records that can't be written as JSON are
+skipped and counted too, rather than stopping the thread. Files are rotated once they reach
+a size or an age limit, so each stays a manageable size and finished ones can be shipped
+off while the run continues.
+"""
+
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import typing
+
+# What to do with a record when the queue is full: wait for room, or throw it away
+BLOCK = "block"
+DROP = "drop"
+
+# The defaults for the size of the queue and of each batch written, and the limits after
+# which a file is rotated
+DEFAULT_QUEUE_SIZE = 65536
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_AGE = 3600.0
+
+# Put on the queue to tell the writing thread to stop
+_STOP = object()
+
+class TranscriptWriter():
+	"""
+	Writes records, handed over from any number of threads, to rotated gzip JSONL files
+	"""
+
+	def __init__(self, directory: str, policy: str = BLOCK, queueSize: int = DEFAULT_QUEUE_SIZE,
+	             batchSize: int = DEFAULT_BATCH_SIZE, maxBytes: int = DEFAULT_MAX_BYTES,
+	             maxAge: float = DEFAULT_MAX_AGE, flushInterval: float = 1.0):
+		"""
+		Starts writing to `transcript-NNNNN.jsonl.gz` files in `directory`. At most
+		`queueSize` records wait to be written, and what happens to any more depends on the
+		`policy` (BLOCK or DROP). A file is rotated once `maxBytes` compressed bytes have
+		been written to it, or it's `maxAge` seconds old. Buffered records are written out
+		at least every `flushInterval` seconds
+		"""
+		if policy not in (BLOCK, DROP):
+			raise ValueError("Unknown queue policy: '%s'" % policy)
+		os.makedirs(directory, exist_ok=True)
+		self.directory = directory
+		self.policy = policy
+		self.batchSize = batchSize
+		self.maxBytes = maxBytes
+		self.maxAge = maxAge
+		self.flushInterval = flushInterval
+
+		self.written = 0
+		self.dropped = 0
+		self.errors = 0
+		self.files = []
+		self._lock = threading.Lock()
+		self._queue = queue.Queue(queueSize)
+		self._raw = None
+		self._file = None
+		self._opened = 0.0
+		self._closed = False
+		self._thread = threading.Thread(target=self._run, name="pokesim-transcript", daemon=True)
+		self._thread.start()
+
+	def _put(self, item: typing.Any) -> bool:
+		"""
+		Waits for room on the queue and puts `item` on it, unless the writing thread stops
+		first. Returns whether it was queued
+		"""
+		while self._thread.is_alive():
+			try:
+				self._queue.put(item, timeout=self.flushInterval)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def record(self, **fields) -> bool:
+		"""
+		Queues a record with the given fields. Returns whether it was queued: it's dropped
+		(and counted) if the writer has been closed or its thread has stopped, or under the
+		DROP policy when the queue is full
+		"""
+		if not self._closed and self._thread.is_alive():
+			if self.policy == BLOCK:
+				if self._put(fields):
+					return True
+			else:
+				try:
+					self._queue.put_nowait(fields)
+					return True
+				except queue.Full:
+					pass
+		with self._lock:
+			self.dropped += 1
+		return False
+
+	def _rotate(self):
+		"""
+		Closes the current file, if any, and opens the next one
+		"""
+		if self._file is not None:
+			self._file.close()
+			self._raw.close()
+		path = os.path.join(self.directory, "transcript-%05d.jsonl.gz" % len(self.files))
+		self._raw = open(path, "wb")
+		self._file = gzip.GzipFile(fileobj=self._raw, mode="wb")
+		self._opened = time.monotonic()
+		self.files.append(path)
+
+	def _write(self, batch: typing.List[typing.Dict]):
+		"""
+		Writes out a batch of records, rotating the file first if it's due. Records that
+		can't be written as JSON are skipped, and counted as errors
+		"""
+		lines = []
+		for fields in batch:
+			try:
+				lines.append(json.dumps(fields, separators=(",", ":")) + "\n")
+			except (TypeError, ValueError):
+				pass
+		if self._file is None or self._raw.tell() >= self.maxBytes or \
+		   time.monotonic() - self._opened >= self.maxAge:
+			self._rotate()
+		self._file.write("".join(lines).encode())
+		with self._lock:
+			self.written += len(lines)
+			self.errors += len(batch) - len(lines)
+
+	def _run(self):
+		"""
+		The body of the writing thread
+		"""
+		stopping = False
+		while not stopping:
+			try:
+				item = self._queue.get(timeout=self.flushInterval)
+			except queue.Empty:
+				if self._file is not None:
+					self._file.flush()
+				continue
+			batch = []
+			while True:
+				if item is _STOP:
+					stopping = True
+					break
+				batch.append(item)
+				if len(batch) >= self.batchSize:
+					break
+				try:
+					item = self._queue.get_nowait()
+				except queue.Empty:
+					break
+
+			try:
+				if batch:
+					self._write(batch)
+			finally:
+				for _ in range(len(batch) + stopping):
+					self._queue.task_done()
+
+		if self._file is not None:
+			self._file.close()
+			self._raw.close()
+			self._file = None
+
+	def flush(self):
+		"""
+		Waits until everything queued so far has been handed to the compressor (or the
+		writing thread has stopped)
+		"""
+		with self._queue.all_tasks_done:
+			while self._queue.unfinished_tasks and self._thread.is_alive():
+				self._queue.all_tasks_done.wait(self.flushInterval)
+
+	def close(self):
+		"""
+		Writes out everything queued and closes the files. Records made after this are
+		dropped
+		"""
+		if self._closed:
+			return
+		self._closed = True
+		self._put(_STOP)
+		self._thread.join()
+
+	def __enter__(self) -> 'TranscriptWriter':
+		"""
+		Allows the writer to be used as a context manager
+		"""
+		return self
+
+	def __exit__(self, *unused_exc_info):
+		"""
+		Closes the writer on leaving a context
+		"""
+		self.close()
+
+def read(path: str) -> typing.Iterator[typing.Dict]:
+	"""
+	Yields the records in a transcript file
+	"""
+	with gzip.open(path, "rt") as transcriptFile:
+		for line in transcriptFile:
+			yield json.loads(line)
+
+# The active writer, if any
+_writer = None
+
+def enable(directory: str, policy: str = BLOCK, **kwargs) -> TranscriptWriter:
+	"""
+	Starts recording transcripts in `directory`; they're written out in full at exit.
+	Extra keyword arguments are passed through to the TranscriptWriter
+	"""
+	global _writer # pylint: disable=global-statement
+	disable()
+	_writer = TranscriptWriter(directory, policy, **kwargs)
+	atexit.register(_writer.close)
+	return _writer
+
+def disable():
+	"""
+	Stops recording transcripts, writing out anything recorded so far
+	"""
+	global _writer # pylint: disable=global-statement
+	if _writer is not None:
+		atexit.unregister(_writer.close)
+		_writer.close()
+		_writer = None
+
+def active() -> typing.Optional[TranscriptWriter]:
+	"""
+	Returns the active writer, or None if transcripts aren't being recorded
+	"""
+	return _writer
@@ -0,0 +1,120 @@
+"""
+Defines a scheduler that orders the actions of any number of combatants in a turn (e.g. in
+doubles, triples or free-for-all battles), as `utils.decideOrder` does for two.
+
+Actions go first by priority bracket, then by effective speed, with exact ties broken at
+random. They're kept in a heap, so ordering a turn of N actions takes O(N log N) rather
+than comparing every pair. When a combatant's speed changes partway through a turn (e.g.
+its Speed stage drops, or it's paralyzed), `update` re-keys just its pending actions; the
+old heap entries are left in place and skipped when they surface.
+"""
+
+import heapq
+import itertools
+import random
+import typing
+from . import move
+from . import pokemon
+from . import prng
+
+class Action(typing.NamedTuple):
+	"""
+	A move to be used by a combatant this turn, along with anything else its caller needs
+	(e.g. the target)
+	"""
+	pokemon: pokemon.Pokemon
+	move: move.Move
+	data: typing.Any = None
+
+class TurnOrder():
+	"""
+	The pending actions of a single turn, ordered by priority, then effective speed, then a
+	random tiebreak drawn for each action when it's scheduled
+	"""
+
+	def __init__(self, rng: 'prng.BattleRNG' = random):
+		"""
+		Creates an empty turn, drawing tiebreaks from `rng`
+		"""
+		self.rng = rng
+		self._heap = []
+		self._entries = {}
+		self._count = itertools.count()
+		self._pending = 0
+
+	def _key(self, action: Action, tiebreak: float) -> typing.Tuple:
+		"""
+		Returns the heap key of an action; smaller keys go first
+		"""
+		return (-action.move.priority, -action.pokemon.effectiveSpeed(), tiebreak)
+
+	def push(self, poke: pokemon.Pokemon, mymove: move.Move, data: typing.Any = None):
+		"""
+		Schedules a Pokemon to use a move this turn
+		"""
+		action = Action(poke, mymove, data)
+		tiebreak = self.rng.random()
+		entry = [self._key(action, tiebreak), next(self._count), action, tiebreak]
+		self._entries.setdefault(id(poke), []).append(entry)
+		heapq.heappush(self._heap, entry)
+		self._pending += 1
+
+	def update(self, poke: pokemon.Pokemon):
+		"""
+		Re-orders the pending actions of a Pokemon whose effective speed has changed. Each
+		keeps the tiebreak it was first given
+		"""
+		entries = self._entries.get(id(poke), [])
+		for i, entry in enumerate(entries):
+			_, _, action, tiebreak = entry
+			entry[2] = None
+			entries[i] = [self._key(action, tiebreak), next(self._count), action, tiebreak]
+			heapq.heappush(self._heap, entries[i])
+
+	def cancel(self, poke: pokemon.Pokemon):
+		"""
+		Removes the pending actions of a Pokemon (e.g. because it fainted)
+		"""
+		for entry in self._entries.pop(id(poke), []):
+			entry[2] = None
+			self._pending -= 1
+
+	def pop(self) -> Action:
+		"""
+		Removes and returns the next action. Raises an IndexError if there are none left
+		"""
+		while self._heap:
+			entry = heapq.heappop(self._heap)
+			action = entry[2]
+			if action is not None:
+				entries = self._entries[id(action.pokemon)]
+				entries.remove(entry)
+				if not entries:
+					del self._entries[id(action.pokemon)]
+				self._pending -= 1
+				return action
+		raise IndexError("No actions left this turn")
+
+	def __len__(self) -> int:
+		"""
+		Returns the number of pending actions
+		"""
+		return self._pending
+
+	def __iter__(self) -> typing.Iterator[Action]:
+		"""
+		Pops actions in order until there are none left. Actions may be updated or cancelled
+		while iterating
+		"""
+		while self._pending:
+			yield self.pop()
+
+def order(actions: typing.Iterable[typing.Tuple[pokemon.Pokemon, move.Move]],
+          rng: 'prng.BattleRNG' = random) -> typing.List[Action]:
+	"""
+	Returns the given (Pokemon, move) pairs as Actions, in the order they'd be used
+	"""
+	turn = TurnOrder(rng)
+	for poke, mymove in actions:
+		turn.push(poke, mymove)
+	return list(turn)
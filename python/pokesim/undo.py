@@ -0,0 +1,134 @@
+"""
+Defines cheap ways of checkpointing a battle's state for search algorithms: an undo log that
+records every change made to a battle so they can be rolled back, and snapshots that share
+whatever they can with the snapshot they were branched from.
+
+Neither covers the battle's random number generators; searches that need to replay the same
+draws should capture those with the generators' own `getstate`.
+"""
+
+import operator
+import typing
+
+class UndoLog():
+	"""
+	A log of the changes made to the objects of a battle, each recorded as the old value of
+	an attribute or item just before it's changed
+	"""
+
+	def __init__(self):
+		"""
+		Creates an empty log
+		"""
+		self.entries = []
+
+	def recordAttr(self, target: object, name: str):
+		"""
+		Records the current value of an attribute of `target`, which is about to change
+		"""
+		self.entries.append((setattr, target, name, getattr(target, name)))
+
+	def recordItem(self, target: typing.MutableMapping, key: typing.Hashable):
+		"""
+		Records the current value of an item in `target`, which is about to change
+		"""
+		self.entries.append((operator.setitem, target, key, target[key]))
+
+	def mark(self) -> int:
+		"""
+		Returns a mark that the log can later be rolled back to
+		"""
+		return len(self.entries)
+
+	def rollback(self, mark: int):
+		"""
+		Undoes every change recorded since `mark`, most recent first
+		"""
+		entries = self.entries
+		while len(entries) > mark:
+			restore, target, key, value = entries.pop()
+			restore(target, key, value)
+
+	def commit(self):
+		"""
+		Forgets every recorded change, so that none of them can be rolled back
+		"""
+		self.entries.clear()
+
+	def __len__(self) -> int:
+		"""
+		Returns the number of changes recorded
+		"""
+		return len(self.entries)
+
+class Snapshot():
+	"""
+	An immutable capture of a battle's state. A snapshot taken from a branch of another
+	snapshot shares whatever parts of each Pokemon's state (stages, PP etc.) haven't
+	changed since, rather than copying them
+	"""
+	__slots__ = ("pokemon", "turns", "over", "winner", "damage", "crits", "moveDamage")
+
+	def __init__(self, battle: 'battle.Battle', parent: 'Snapshot' = None):
+		"""
+		Captures the state of a battle, sharing with `parent` where possible
+		"""
+		pokes = []
+		for side, poke in enumerate(battle.pokemon):
+			state = (poke.HP, poke.status, tuple(poke.stages.values()),
+			         tuple(mymove.PP for mymove in poke.moves))
+			if parent is not None:
+				previous = parent.pokemon[side]
+				if previous == state:
+					state = previous
+				else:
+					state = tuple(old if old == new else new for old, new in zip(previous, state))
+			pokes.append(state)
+
+		self.pokemon = tuple(pokes)
+		self.turns = battle.turns
+		self.over = battle.over
+		self.winner = battle.winner
+		self.damage = tuple(battle.damage)
+		self.crits = tuple(battle.crits)
+		self.moveDamage = tuple(tuple(moveDamage) for moveDamage in battle.moveDamage)
+
+	def restore(self, battle: 'battle.Battle'):
+		"""
+		Returns a battle to the captured state. If the battle has an undo log attached, the
+		restoration is recorded in it, so it too can be rolled back
+		"""
+		journal = battle.journal
+		for poke, (HP, status, stages, PP) in zip(battle.pokemon, self.pokemon):
+			if journal is not None:
+				journal.recordAttr(poke, "HP")
+				journal.recordAttr(poke, "status")
+				for stat in poke.stages:
+					journal.recordItem(poke.stages, stat)
+				for mymove in poke.moves:
+					journal.recordAttr(mymove, "PP")
+			poke.HP = HP
+			poke.status = status
+			poke.stages.update(zip(poke.stages, stages))
+			for mymove, movePP in zip(poke.moves, PP):
+				mymove.PP = movePP
+
+		if journal is not None:
+			for name in ("turns", "over", "winner"):
+				journal.recordAttr(battle, name)
+			for side in range(2):
+				journal.recordItem(battle.damage, side)
+				journal.recordItem(battle.crits, side)
+				for slot in range(len(battle.moveDamage[side])):
+					journal.recordItem(battle.moveDamage[side], slot)
+		battle.turns, battle.over, battle.winner = self.turns, self.over, self.winner
+		battle.damage[:] = self.damage
+		battle.crits[:] = self.crits
+		for current, saved in zip(battle.moveDamage, self.moveDamage):
+			current[:] = saved
+
+	def branch(self, battle: 'battle.Battle') -> 'Snapshot':
+		"""
+		Captures the current state of a battle that was restored from this snapshot
+		"""
+		return Snapshot(battle, self)
@@ -7,6 +7,7 @@ import random
 import typing
 import os
 import shutil
+import threading
 try:
 	import readline
 except ImportError:
@@ -14,6 +15,7 @@ except ImportError:
 from . import constants
 from . import pokemon
 from . import move
+from . import prng
 
 
 ###################################################################################################
@@ -45,6 +47,35 @@ Color = typing.NewType('Color', typing.Tuple[int, int, int])
 ###                                                                                             ###
 ###################################################################################################
 
+def readDataFile(kind: str, name: str) -> str:
+	"""
+	Returns the raw contents of the data file for the `name`d thing of the given kind
+	(i.e. "pokemon" or "moves")
+	"""
+	with open(os.path.join(dataDir, kind, name)) as datafile:
+		return datafile.read()
+
+def listDataFiles(kind: str) -> typing.List[str]:
+	"""
+	Returns the names of every thing of the given kind (i.e. "pokemon" or "moves") that has
+	a data file
+	"""
+	return sorted(os.listdir(os.path.join(dataDir, kind)))
+
+def loadDataFile(kind: str, name: str, parse: typing.Callable[[str], typing.Any]) -> typing.Any:
+	"""
+	Returns the contents of a data file, as parsed by `parse`. Every file of a kind must be
+	parsed the same way, so that sources which cache parsed data can stand in for this
+	"""
+	return parse(readData(kind, name))
+
+# The functions used to read, list and parse data files; they may be swapped out (e.g. by
+# worker processes) to get the data from somewhere other than the `dataDir`, or to keep
+# what's been parsed
+readData = readDataFile
+listData = listDataFiles
+loadData = loadDataFile
+
 def getTTYsize() -> os.terminal_size:
 	"""
 	Returns the terminal size
@@ -133,9 +164,10 @@ def cls():
 	print("\033[H\033[J")
 
 def decideOrder(poke0: pokemon.Pokemon, move0: move.Move,
-                poke1: pokemon.Pokemon, move1: move.Move) -> int:
+                poke1: pokemon.Pokemon, move1: move.Move, rng: 'prng.BattleRNG'=random) -> int:
 	"""
-	Given two pokemon and their chosen moves, determines which one should go first
+	Given two pokemon and their chosen moves, determines which one should go first.
+	Ties are broken with a draw from `rng`
 	"""
 	if move0.priority > move1.priority:
 		return 0
@@ -143,23 +175,8 @@ def decideOrder(poke0: pokemon.Pokemon, move0: move.Move,
 		return 1
 
 	#Priorities are the same, calculate effective speeds
-	effsp0, effsp1 = poke0.speed, poke1.speed
-
-	if poke0.stages[4] > 0:
-		effsp0 *= (2 + poke0.stages[4])/2.0
-	elif poke0.stages[4] < 0:
-		effsp0 *= 2.0/(2.0 - poke0.stages[4])
-
-	if poke0.status == constants.PAR:
-		effsp0 /= 2.0
-
-	if poke1.stages[4] > 0:
-		effsp1 *= (2 + poke1.stages[4])/2.0
-	elif poke1.stages[4] < 0:
-		effsp1 *= 2.0/(2.0 - poke1.stages[4])
-
-	if poke1.status == constants.PAR:
-		effsp1 /= 2.0
+	effsp0 = poke0.effectiveSpeed()
+	effsp1 = poke1.effectiveSpeed()
 
 	#Use effective speed to calculate order
 	if effsp0 > effsp1:
@@ -168,7 +185,7 @@ def decideOrder(poke0: pokemon.Pokemon, move0: move.Move,
 		return 1
 
 	#use random number to break tie
-	return random.randrange(1)
+	return rng.randrange(2)
 
 def gracefulExit():
 	"""
@@ -190,16 +207,23 @@ def dumpPokemon(userPokemon: pokemon.Pokemon, opponentPokemon: pokemon.Pokemon):
 	print()
 
 
+# Guards readline's completer, which is shared by the whole process
+_completerLock = threading.Lock()
+
 def setCompleter(fullWords: typing.Set[str]):
 	"""
-	Sets up tab-completion for the 'fullWords' set
+	Sets up tab-completion for the 'fullWords' set. Only the interactive game uses
+	tab-completion; the words are copied, so the set may be changed (or used by another
+	thread) afterwards
 	"""
+	words = tuple(sorted(fullWords))
 	def complete(text: str, state: int) -> str:
 		"""
 		A closure that is used as the readline completion function
 		"""
-		return [word for word in fullWords if word.startswith(text)][state]
+		return [word for word in words if word.startswith(text)][state]
 
-	readline.set_completer_delims(' \t\n:')
-	readline.parse_and_bind("tab: complete")
-	readline.set_completer(complete)
+	with _completerLock:
+		readline.set_completer_delims(' \t\n:')
+		readline.parse_and_bind("tab: complete")
+		readline.set_completer(complete)
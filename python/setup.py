@@ -138,10 +138,10 @@ setup(
 	#
 	# Similar to `install_requires` above, these must be valid existing
 	# projects.
-	# extras_require={  # Optional
-	#     'dev': ['check-manifest'],
-	#     'test': ['coverage'],
-	# },
+	extras_require={  # Optional
+		'lockstep': ['numpy'],
+		'env': ['numpy'],
+	},
 
 	# If there are data files included in your packages that need to be
 	# installed, specify them here.
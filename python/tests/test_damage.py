@@ -0,0 +1,117 @@
+"""
+Checks `Move.calcDmg` against damage worked out by hand, and the critical hit odds at each
+critical stage
+"""
+
+import unittest
+from pokesim import constants
+from pokesim import move
+from pokesim import pokemon
+from pokesim import prng
+
+class RecordedDraws():
+	"""
+	Stands in for a random number generator, recording the range of each draw and never
+	landing a critical hit
+	"""
+
+	def __init__(self):
+		"""
+		Starts with no draws recorded
+		"""
+		self.stops = []
+
+	def randrange(self, stop: int) -> int:
+		"""
+		Records the range of a draw, and returns its highest value
+		"""
+		self.stops.append(stop)
+		return stop - 1
+
+class TestDamage(unittest.TestCase):
+	"""
+	Damage done by a level 100 Bulbasaur (Hardy, 252 HP and Attack EVs, so 197 Attack and 135
+	Defense) to another. The engine divides by the attacker's own Defense
+	"""
+
+	def setUp(self):
+		"""
+		Builds the attacker and defender
+		"""
+		self.attacker = pokemon.build('Bulbasaur')
+		self.defender = pokemon.build('Bulbasaur', "The opponent's Bulbasaur")
+
+	def rolls(self, moveName: str, crit: bool = False) -> list:
+		"""
+		Returns the damage done by a move with each of the 16 damage rolls
+		"""
+		mymove = move.Move(moveName)
+		return [mymove.calcDmg(self.attacker, self.defender, None, prng.ScriptedDraws(roll, crit))[0]
+		        for roll in range(16)]
+
+	def test_stats(self):
+		"""
+		The stats the expected damage is worked out from
+		"""
+		self.assertEqual((self.attacker.attack, self.attacker.defense), (197, 135))
+
+	def test_tackle(self):
+		"""
+		42 * 40 * 197 // 135 // 50 + 2 = 51 damage before the roll, no STAB and neutral
+		"""
+		self.assertEqual(self.rolls('Tackle'),
+		                 [43, 43, 44, 44, 45, 45, 46, 46, 47, 47, 48, 48, 49, 49, 50, 51])
+
+	def test_tackle_critical(self):
+		"""
+		51 * 6144/4096 = 76.5, rounded down, before the roll
+		"""
+		self.assertEqual(self.rolls('Tackle', True),
+		                 [64, 65, 66, 66, 67, 68, 69, 69, 70, 71, 72, 72, 73, 74, 75, 76])
+
+	def test_attack_stages(self):
+		"""
+		+2 Attack doubles it to 394, for 100 damage before the roll. -2 Attack halves it to
+		98, for 26, but a critical hit ignores the drop
+		"""
+		self.attacker.stages[constants.ATTACK] = 2
+		self.assertEqual(self.rolls('Tackle'), list(range(85, 101)))
+		self.attacker.stages[constants.ATTACK] = -2
+		self.assertEqual(self.rolls('Tackle'),
+		                 [22, 22, 22, 22, 23, 23, 23, 23, 24, 24, 24, 24, 25, 25, 25, 26])
+		self.assertEqual(self.rolls('Tackle', True)[::15], [64, 76])
+
+	def test_vine_whip(self):
+		"""
+		57 damage before the roll, then STAB (x1.5) and a quarter for a Grass move against
+		a Grass/Poison type
+		"""
+		self.assertEqual(self.rolls('Vine Whip'),
+		                 [18, 18, 18, 18, 18, 19, 19, 19, 19, 19, 20, 20, 20, 20, 21, 21])
+		self.assertEqual(self.rolls('Vine Whip', True),
+		                 [27, 27, 27, 27, 28, 28, 28, 29, 29, 29, 30, 30, 30, 31, 31, 31])
+
+class TestCritical(unittest.TestCase):
+	"""
+	The chance of a critical hit at each critical stage
+	"""
+
+	def test_odds(self):
+		"""
+		1/16 at stage 0, doubling with each stage above it and halving with each below
+		"""
+		self.assertEqual([move.critOdds(stage) for stage in range(-2, 6)],
+		                 [64, 32, 16, 8, 4, 2, 1, 1])
+
+	def test_draws(self):
+		"""
+		Negative stages draw from a wider range, and stage 4 and up land without a draw
+		"""
+		for stage, stops in ((-1, [32]), (0, [16]), (3, [2]), (4, [])):
+			draws = RecordedDraws()
+			self.assertEqual(move.critical(0, stage, draws),
+			                 move.CRIT_MODIFIER if not stops else move.MODIFIER_ONE)
+			self.assertEqual(draws.stops, stops)
+
+if __name__ == '__main__':
+	unittest.main()